@@ -0,0 +1,291 @@
+import asyncio
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+
+import profiling
+import prompt_registry
+import utils
+from log_writer import logger
+from singleflight import SingleFlight
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_CACHE_SIZE = 128
+
+
+class AgentError(Exception):
+    """Raised when an agent does not produce a final answer within its steps."""
+
+
+class Tool:
+    """A function the model may call.
+
+    The parameters are described to the model from the function's signature,
+    type hints and docstring.
+
+    Args:
+        fn: The function to call with the model's arguments as keywords.
+            Coroutine functions are run on their own event loop.
+        name: Name shown to the model, the function name by default.
+        description: Description shown to the model, the docstring by default.
+        timeout: Seconds to wait for a result before reporting a timeout to
+            the model.
+        idempotent: Whether calls with the same arguments always return the
+            same result. Such results are cached and identical concurrent
+            calls share one execution.
+        cache_size: Number of results cached for idempotent tools.
+    """
+
+    def __init__(
+        self,
+        fn,
+        name: str | None = None,
+        description: str | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        idempotent: bool = False,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+
+        self.fn = fn
+        self.name = name or fn.__name__
+        self.timeout = timeout
+        self.idempotent = idempotent
+        self.cache_size = cache_size
+        self.schema = convert_to_openai_tool(fn)
+        self.schema["function"]["name"] = self.name
+        if description is not None:
+            self.schema["function"]["description"] = description
+        self._cache: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _execute(self, args: dict):
+        if inspect.iscoroutinefunction(self.fn):
+            return asyncio.run(self.fn(**args))
+        return self.fn(**args)
+
+    def call(self, args: dict) -> tuple[object, bool]:
+        """Run the tool and return its result and whether it came from the cache."""
+        if not self.idempotent:
+            return self._execute(args), False
+        key = json.dumps(args, sort_keys=True, default=str)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key], True
+
+        def run():
+            result = self._execute(args)
+            with self._lock:
+                self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return result
+
+        return self._flight.do(key, run), False
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+def tool(
+    fn=None,
+    *,
+    name: str | None = None,
+    description: str | None = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    idempotent: bool = False,
+):
+    """Decorator turning a function into a :class:`Tool`.
+
+    Usable bare (``@tool``) or with the arguments of :class:`Tool`
+    (``@tool(idempotent=True, timeout=10)``).
+    """
+
+    def decorator(f) -> Tool:
+        return Tool(
+            f, name=name, description=description, timeout=timeout, idempotent=idempotent
+        )
+
+    return decorator(fn) if fn is not None else decorator
+
+
+class Step:
+    """Timing of one model request or tool call of an agent run."""
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        elapsed: float,
+        cached: bool = False,
+        error: str | None = None,
+    ) -> None:
+        self.kind = kind
+        self.name = name
+        self.elapsed = elapsed
+        self.cached = cached
+        self.error = error
+
+    def as_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "elapsed": self.elapsed,
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+
+class AgentResult:
+    """Final answer of an agent run with its messages and step timings."""
+
+    def __init__(self, output: str, messages: list, steps: list[Step], elapsed: float) -> None:
+        self.output = output
+        self.messages = messages
+        self.steps = steps
+        self.elapsed = elapsed
+
+    @property
+    def turns(self) -> int:
+        """Number of model requests made."""
+        return sum(1 for step in self.steps if step.kind == "llm")
+
+
+def _tool_content(result) -> str:
+    if isinstance(result, str):
+        return result
+    return json.dumps(result, ensure_ascii=False, default=str)
+
+
+class Agent:
+    """Tool-calling loop on top of :class:`utils.LLM` or an ``LLMRouter``.
+
+    Each turn the model is sent the conversation with the tools bound. All
+    tool calls it requests in one turn are independent by definition and run
+    concurrently; their results are sent back in the next turn until the
+    model replies without calling a tool.
+
+    Args:
+        llm: An :class:`utils.LLM` or :class:`llm_router.LLMRouter`.
+        tools: Tools the model may call, as :class:`Tool` objects or plain
+            functions.
+        system_prompt: Instructions for the model.
+        max_steps: Maximum number of model requests per run.
+        max_workers: Maximum number of tool calls running at the same time.
+    """
+
+    def __init__(
+        self,
+        llm,
+        tools: list,
+        system_prompt: str = "You are a helpful assistant.",
+        max_steps: int = 8,
+        max_workers: int = 8,
+    ) -> None:
+        self.llm = llm
+        self.tools: dict[str, Tool] = {}
+        for t in tools:
+            t = t if isinstance(t, Tool) else Tool(t)
+            self.tools[t.name] = t
+        self.system_prompt = system_prompt
+        self.max_steps = max_steps
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="agent-tool"
+        )
+
+    @staticmethod
+    def _timed_call(tool_: Tool, args: dict) -> tuple[object, bool, float]:
+        start = time.perf_counter()
+        result, cached = tool_.call(args)
+        return result, cached, time.perf_counter() - start
+
+    def _run_tools(self, calls: list[dict]) -> list[tuple[str, Step]]:
+        """Run the tool calls of one turn concurrently and return their results."""
+        start = time.perf_counter()
+        pending = []
+        for call in calls:
+            tool_ = self.tools.get(call["name"])
+            future = None
+            if tool_ is not None:
+                future = self._executor.submit(self._timed_call, tool_, call.get("args") or {})
+            pending.append((call["name"], tool_, future))
+
+        outcomes = []
+        for name, tool_, future in pending:
+            if future is None:
+                step = Step("tool", name, 0.0, error="unknown tool")
+                outcomes.append((f"Error: unknown tool {name}", step))
+                continue
+            # Timeouts count from the start of the turn, as all calls run at once
+            remaining = max(0.0, start + tool_.timeout - time.perf_counter())
+            try:
+                result, cached, elapsed = future.result(timeout=remaining)
+            except FutureTimeout:
+                # The thread cannot be stopped; its result is discarded
+                error = f"timed out after {tool_.timeout:g}s"
+                elapsed = tool_.timeout
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                elapsed = time.perf_counter() - start
+            else:
+                outcomes.append((_tool_content(result), Step("tool", name, elapsed, cached)))
+                continue
+            logger(f"agent: tool {name} failed: {error}")
+            outcomes.append((f"Error: {error}", Step("tool", name, elapsed, error=error)))
+        return outcomes
+
+    def run(
+        self,
+        user_prompt: str,
+        model_name: str | None = None,
+        conversation_id: str | None = None,
+    ) -> AgentResult:
+        """Run the agent on ``user_prompt`` until the model gives a final answer.
+
+        Raises:
+            AgentError: If the model still calls tools after ``max_steps`` requests.
+        """
+        run_start = time.perf_counter()
+        messages = [SystemMessage(content=self.system_prompt), HumanMessage(content=user_prompt)]
+        # The messages drop the template refs of rendered prompts
+        prompt = prompt_registry.prompt_refs(self.system_prompt, user_prompt)
+        schemas = [t.schema for t in self.tools.values()]
+        steps: list[Step] = []
+
+        for _ in range(self.max_steps):
+            start = time.perf_counter()
+            response = self.llm.invoke_tools(
+                messages, schemas, model_name, conversation_id, prompt
+            )
+            model = model_name or self.llm.model_name
+            steps.append(Step("llm", model, time.perf_counter() - start))
+            messages.append(response)
+            if not response.tool_calls:
+                elapsed = time.perf_counter() - run_start
+                result = AgentResult(
+                    utils._content_text(response.content), messages, steps, elapsed
+                )
+                logger(f"agent: answered after {result.turns} turns in {elapsed:.2f}s")
+                return result
+
+            with profiling.span("tools", calls=len(response.tool_calls)):
+                outcomes = self._run_tools(response.tool_calls)
+            for call, (content, step) in zip(response.tool_calls, outcomes):
+                messages.append(
+                    ToolMessage(content=content, tool_call_id=call["id"], name=call["name"])
+                )
+                steps.append(step)
+
+        raise AgentError(f"No final answer after {self.max_steps} steps")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
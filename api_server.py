@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import artifact_manager
+import conversation_store
+import job_queue
+import search_index
+import usage_ledger
+import utils
+from app_context import AppContext
+from component_base import BaseComponent
+from log_writer import logger
+
+# Conversations kept in memory; older ones are resumed from the store on demand.
+MAX_ACTIVE_CONVERSATIONS = 1000
+
+
+class APIError(Exception):
+    """Error returned to the client as a JSON body with an HTTP status."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class APIServer(ThreadingHTTPServer):
+    """HTTP server sharing the component manager and LLM clients of the app."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], app: AppContext | None = None) -> None:
+        super().__init__(address, APIHandler)
+        self.app = app or AppContext()
+        self.conversations: "OrderedDict[str, utils.Conversation]" = OrderedDict()
+        self._llm: utils.LLM | None = None
+        self._lock = threading.RLock()
+
+    def get_llm(self) -> utils.LLM:
+        with self._lock:
+            if self._llm is None:
+                self._llm = utils.LLM(component="api")
+            return self._llm
+
+    def get_conversation(self, conv_id: str) -> utils.Conversation:
+        """Return an active conversation, resuming it from the store if needed."""
+        with self._lock:
+            conv = self.conversations.get(conv_id)
+            if conv is None:
+                try:
+                    conv = utils.Conversation.resume(self.get_llm(), conv_id)
+                except KeyError:
+                    raise APIError(404, f"Unknown conversation: {conv_id}")
+            self.remember_conversation(conv)
+        return conv
+
+    def remember_conversation(self, conv: utils.Conversation) -> None:
+        with self._lock:
+            self.conversations[conv.conversation_id] = conv
+            self.conversations.move_to_end(conv.conversation_id)
+            while len(self.conversations) > MAX_ACTIVE_CONVERSATIONS:
+                self.conversations.popitem(last=False)
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    """JSON endpoints for LLM requests, conversations, components and artifacts.
+
+    Endpoints accepting ``"stream": true`` answer with server-sent events; each
+    event carries ``{"delta": text}`` and the last one ``{"done": true}``.
+    """
+
+    server: APIServer
+    server_version = "CyniaAgents"
+
+    ROUTES = [
+        ("GET", r"/v1/health", "health"),
+        ("POST", r"/v1/ask", "ask"),
+        ("POST", r"/v1/conversations", "create_conversation"),
+        ("GET", r"/v1/conversations/(?P<conv_id>[^/]+)", "get_conversation"),
+        ("POST", r"/v1/conversations/(?P<conv_id>[^/]+)/messages", "send_message"),
+        ("GET", r"/v1/components", "list_components"),
+        ("POST", r"/v1/components/(?P<name>[^/]+)/tasks", "run_task"),
+        ("GET", r"/v1/jobs/(?P<job_id>[^/]+)", "get_job"),
+        ("GET", r"/v1/artifacts", "list_artifacts"),
+        ("GET", r"/v1/artifacts/(?P<file>[^/]+)", "download_artifact"),
+        ("GET", r"/v1/usage", "usage"),
+        ("GET", r"/v1/search", "search"),
+    ]
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        logger(f"api: {self.address_string()} {format % args}")
+
+    def _dispatch(self, method: str) -> None:
+        path = urlparse(self.path).path.rstrip("/")
+        try:
+            self.server.app.refresh_config()
+            for route_method, pattern, handler in self.ROUTES:
+                match = re.fullmatch(pattern, path)
+                if match and route_method == method:
+                    params = {k: unquote(v) for k, v in match.groupdict().items()}
+                    getattr(self, f"handle_{handler}")(**params)
+                    return
+            raise APIError(404, f"No route for {method} {path}")
+        except APIError as e:
+            self._send_json({"error": e.message}, e.status)
+        except usage_ledger.BudgetExceededError as e:
+            self._send_json({"error": str(e)}, 429)
+        except Exception as e:
+            logger(f"api: {method} {path} failed: {e}")
+            self._send_json({"error": str(e)}, 500)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise APIError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise APIError(400, "Request body must be a JSON object")
+        return body
+
+    def _send_json(self, data, status: int = 200) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, chunks) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def event(data: dict) -> None:
+            payload = json.dumps(data, ensure_ascii=False)
+            self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            for text in chunks:
+                event({"delta": text})
+        except (BrokenPipeError, ConnectionResetError):
+            chunks.close()
+            return
+        except Exception as e:
+            logger(f"api: stream failed: {e}")
+            event({"error": str(e)})
+            return
+        event({"done": True})
+
+    def handle_health(self) -> None:
+        self._send_json({"status": "ok"})
+
+    def handle_ask(self) -> None:
+        body = self._read_json()
+        if "user" not in body:
+            raise APIError(400, "Missing field: user")
+        llm = self.server.get_llm()
+        args = (body.get("system", ""), body["user"])
+        if body.get("stream"):
+            self._send_stream(llm.ask_stream(*args, model_name=body.get("model")))
+        else:
+            self._send_json({"reply": llm.ask(*args, model_name=body.get("model"))})
+
+    def handle_create_conversation(self) -> None:
+        body = self._read_json()
+        conv = self.server.get_llm().create_conversation(
+            body.get("system", ""),
+            store=conversation_store.get_store(),
+            window=conversation_store.DEFAULT_WINDOW,
+            component=body.get("component", ""),
+        )
+        self.server.remember_conversation(conv)
+        self._send_json({"id": conv.conversation_id}, 201)
+
+    def handle_get_conversation(self, conv_id: str) -> None:
+        conv = self.server.get_conversation(conv_id)
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            offset = int(query.get("offset", ["0"])[0])
+            limit = min(int(query.get("limit", ["50"])[0]), 500)
+        except ValueError:
+            raise APIError(400, "offset and limit must be integers")
+        self._send_json(
+            {
+                "id": conv_id,
+                "system": conv.messages[0]["content"],
+                "total": conv.message_count,
+                "messages": conv.load_page(offset, limit),
+            }
+        )
+
+    def handle_send_message(self, conv_id: str) -> None:
+        conv = self.server.get_conversation(conv_id)
+        body = self._read_json()
+        if "content" not in body:
+            raise APIError(400, "Missing field: content")
+        if body.get("stream"):
+            self._send_stream(conv.send_stream(body["content"], body.get("model")))
+        else:
+            self._send_json({"reply": conv.send(body["content"], body.get("model"))})
+
+    def handle_list_components(self) -> None:
+        manager = self.server.app.manager
+        self._send_json(
+            [
+                {
+                    "name": comp.name,
+                    "description": comp.description,
+                    "enabled": comp.name in manager.enabled,
+                }
+                for comp in manager.available.values()
+            ]
+        )
+
+    def handle_run_task(self, name: str) -> None:
+        comp = self.server.app.manager.available.get(name)
+        if comp is None or name not in self.server.app.manager.enabled:
+            raise APIError(404, f"Component not found or not enabled: {name}")
+        if type(comp).run_task is BaseComponent.run_task:
+            raise APIError(501, f"Component does not support tasks: {name}")
+        body = self._read_json()
+        run_async = body.pop("async", False)
+        if not isinstance(run_async, bool):
+            raise APIError(400, "async must be a boolean")
+        if run_async:
+            job = self.server.app.jobs.submit(name, "API task", comp.run_task, body)
+            self._send_json({"job": job.id}, 202)
+            return
+        try:
+            result = comp.run_task(body)
+        except NotImplementedError:
+            raise APIError(501, f"Component does not support tasks: {name}")
+        self._send_json(result)
+
+    def handle_get_job(self, job_id: str) -> None:
+        job = self.server.app.jobs.get(job_id)
+        if job is None:
+            raise APIError(404, f"Unknown job: {job_id}")
+        data = {
+            "id": job.id,
+            "component": job.component,
+            "status": job.status,
+            "wait_time": job.wait_time,
+            "run_time": job.run_time,
+        }
+        if job.status == job_queue.DONE:
+            data["result"] = job.result
+        elif job.status == job_queue.FAILED:
+            data["error"] = job.error
+        self._send_json(data)
+
+    def handle_list_artifacts(self) -> None:
+        self._send_json(artifact_manager.list_artifacts())
+
+    def handle_download_artifact(self, file: str) -> None:
+        known = {art["file"] for art in artifact_manager.list_artifacts()}
+        if file not in known:
+            raise APIError(404, f"Unknown artifact: {file}")
+        path = os.path.join(artifact_manager.ARTIFACTS_DIR, file)
+        size = os.path.getsize(path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.send_header("Content-Disposition", f'attachment; filename="{file}"')
+        self.end_headers()
+        with open(path, "rb") as f:
+            while chunk := f.read(64 * 1024):
+                self.wfile.write(chunk)
+
+
+    def handle_usage(self) -> None:
+        query = parse_qs(urlparse(self.path).query)
+        group_by = query.get("group_by", ["component"])[0]
+        if group_by not in usage_ledger.GROUP_COLUMNS:
+            raise APIError(400, f"group_by must be one of {', '.join(usage_ledger.GROUP_COLUMNS)}")
+        try:
+            since = float(query["since"][0]) if "since" in query else None
+        except ValueError:
+            raise APIError(400, "since must be a timestamp")
+        self._send_json(
+            usage_ledger.get_ledger().summary(
+                group_by, since=since, component=query.get("component", [None])[0]
+            )
+        )
+
+    def handle_search(self) -> None:
+        query = parse_qs(urlparse(self.path).query)
+        if not query.get("q", [""])[0].strip():
+            raise APIError(400, "q is required")
+        kind = query.get("kind", [None])[0]
+        if kind not in (None, search_index.ARTIFACT, search_index.MESSAGE):
+            raise APIError(400, "kind must be artifact or message")
+        try:
+            limit = min(int(query.get("limit", ["20"])[0]), 100)
+            offset = int(query.get("offset", ["0"])[0])
+        except ValueError:
+            raise APIError(400, "limit and offset must be integers")
+        self._send_json(
+            search_index.get_index().search(
+                query["q"][0],
+                kind=kind,
+                component=query.get("component", [None])[0],
+                limit=limit,
+                offset=offset,
+            )
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Cynia Agents HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    server = APIServer((args.host, args.port))
+    logger(f"api: listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import threading
+
+import config
+import http_transport
+import job_queue
+import search_index
+import utils
+from component_manager import ComponentManager
+from log_writer import logger
+
+
+class AppContext:
+    """Server-wide application state shared by every UI session.
+
+    ``web.py`` is executed again on every widget interaction. Holding the
+    component manager, the component instances and the pooled LLM clients in
+    one long-lived object means a rerun only has to render the page.
+    """
+
+    def __init__(self, components_dir="components", config_path="components.json"):
+        utils.initialize()
+        self._lock = threading.RLock()
+        self.manager = ComponentManager(components_dir, config_path)
+        self.jobs = job_queue.get_job_queue()
+        index = search_index.get_index()
+        if index.created:
+            # First start with search: index what was stored before
+            self.jobs.submit("search", "Build search index", index.rebuild)
+        if getattr(config, "HTTP_WARMUP", "false") == "true":
+            threading.Thread(target=self._warm_up, name="http-warmup", daemon=True).start()
+
+    @staticmethod
+    def _warm_up() -> None:
+        """Connect to the providers so the first request skips DNS and TLS setup."""
+        for url in http_transport.provider_urls():
+            http_transport.warm_up(url)
+
+    def reload_components(self) -> None:
+        """Re-read ``components.json`` and rediscover installed components.
+
+        Component modules that were imported before are reloaded, so edits to
+        them take effect without a restart.
+        """
+        with self._lock:
+            self.manager.load_config()
+            self.manager.discover_components()
+            logger(f"app: {len(self.manager.available)} components reloaded")
+
+    def refresh_config(self) -> None:
+        """Pick up configuration files changed by another process.
+
+        This only stats the files when nothing changed. LLM clients compare
+        their settings with ``config.CONFIG_VERSION`` and rebuild themselves
+        only if one of their own settings changed. Cached clients built from
+        replaced settings are dropped.
+        """
+        if config.reload_if_changed():
+            utils.prune_clients()
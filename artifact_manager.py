@@ -1,13 +1,22 @@
 import os
 import json
 import shutil
+import threading
 import time
 import uuid
 
+import profiling
+import search_index
+from log_writer import logger
+
 ARTIFACTS_DIR = "artifacts"
 ARTIFACTS_FILE = os.path.join(ARTIFACTS_DIR, "artifacts.json")
 ARTIFACT_TYPES: set[str] = set()
 
+# Result of list_artifacts() and the state of the files it was built from
+_listing: tuple[tuple, list[dict]] | None = None
+_listing_lock = threading.Lock()
+
 
 def _load_metadata() -> list[dict]:
     if os.path.exists(ARTIFACTS_FILE):
@@ -27,6 +36,7 @@ def register_artifact_type(name: str) -> None:
     ARTIFACT_TYPES.add(name)
 
 
+@profiling.track("artifacts")
 def write_artifact(component: str, src_path: str, remark: str, artifact_type: str) -> str:
     """Store a file as an artifact and record its metadata."""
     if artifact_type not in ARTIFACT_TYPES:
@@ -39,24 +49,50 @@ def write_artifact(component: str, src_path: str, remark: str, artifact_type: st
     dst_path = os.path.join(ARTIFACTS_DIR, unique)
     shutil.copy2(src_path, dst_path)
     size = os.path.getsize(dst_path)
-    data = _load_metadata()
-    data.append({
+    meta = {
         "file": unique,
         "component": component,
         "size": size,
         "remark": remark,
         "type": artifact_type,
-    })
+    }
+    data = _load_metadata()
+    data.append(meta)
     _save_metadata(data)
+    try:
+        search_index.get_index().add_artifact(meta, dst_path)
+    except Exception as e:
+        # The artifact is stored; it only stays unsearchable until a rebuild
+        logger(f"search: failed to index {unique}: {e}")
     return dst_path
 
 
+@profiling.track("artifacts")
 def list_artifacts() -> list[dict]:
-    """Return metadata for all stored artifacts."""
+    """Return metadata for all stored artifacts.
+
+    The listing is rebuilt only when the metadata file or the contents of the
+    artifacts directory changed, so repeated calls cost two ``stat`` calls.
+    """
+    global _listing
+    state = (os.path.abspath(ARTIFACTS_DIR), _stat_key(ARTIFACTS_FILE), _stat_key(ARTIFACTS_DIR))
+    with _listing_lock:
+        if _listing is not None and _listing[0] == state:
+            return list(_listing[1])
     data = _load_metadata()
     valid = []
     for art in data:
         path = os.path.join(ARTIFACTS_DIR, art.get("file", ""))
         if os.path.isfile(path):
             valid.append(art)
-    return valid
+    with _listing_lock:
+        _listing = (state, valid)
+    return list(valid)
+
+
+def _stat_key(path: str) -> tuple | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Allow running as ``python benchmarks/load_test.py`` as well as ``-m benchmarks.load_test``
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+INVOCATION_DIR = os.getcwd()
+
+from benchmarks.mock_llm_server import MockSettings, start_server  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+
+
+# AppTest installs a process-wide mock Runtime for every run, so two runs in
+# different threads clobber each other. Reruns are serialized here; sessions
+# still interleave and their LLM jobs still run concurrently in the job queue.
+# The time spent waiting for the lock is reported separately as queueing.
+_run_lock = threading.Lock()
+
+
+class Session:
+    """One simulated browser session clicking through the application."""
+
+    def __init__(self, index: int, timeout: float) -> None:
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.app = AppTest.from_file(os.path.join(ROOT, "web.py"), default_timeout=timeout)
+        self.samples: dict[str, list[float]] = {}
+        self.waits: list[float] = []
+        self.errors: list[str] = []
+
+    def _run(self, page: str, action=None) -> None:
+        queued = time.perf_counter()
+        with _run_lock:
+            start = time.perf_counter()
+            self.waits.append(start - queued)
+            try:
+                if action is None:
+                    self.app.run()
+                else:
+                    action()
+            except Exception as e:
+                self.errors.append(f"{page}: {e}")
+                return
+            self.samples.setdefault(page, []).append(time.perf_counter() - start)
+        if self.app.exception:
+            self.errors.append(f"{page}: {self.app.exception[0].message}")
+
+    def _click_sidebar(self, page: str, label: str) -> None:
+        for button in self.app.sidebar.button:
+            if label in button.label:
+                self._run(page, lambda: button.click().run())
+                return
+        self.errors.append(f"{page}: sidebar button {label!r} not found")
+
+    def _click(self, page: str, label: str) -> None:
+        for button in self.app.button:
+            if button.label == label:
+                self._run(page, lambda: button.click().run())
+                return
+        self.errors.append(f"{page}: button {label!r} not found")
+
+    def script(self, iterations: int, poll_interval: float, max_polls: int) -> None:
+        """Visit every page and send one message to the Echo Agent per iteration."""
+        self._run("initial")
+        for i in range(iterations):
+            self._click_sidebar("component_center", "Component Center")
+            self._click_sidebar("artifact_center", "Artifact Center")
+            self._click_sidebar("config_center", "Configuration Center")
+            self._click_sidebar("jobs", "Jobs")
+            self._click_sidebar("echo_agent", "Echo Agent")
+            if not self.app.text_area:
+                self.errors.append("echo_agent: prompt input not found")
+                continue
+            self.app.text_area[0].input(f"Session {self.index} message {i}")
+            self._click("echo_send", "Send")
+            for _ in range(max_polls):
+                if not any(b.label == "Refresh" for b in self.app.button):
+                    break
+                time.sleep(poll_interval)
+                self._click("echo_poll", "Refresh")
+
+
+@contextlib.contextmanager
+def workspace():
+    """Run the app from a scratch copy so the load test leaves no state behind."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(ROOT, "components"), os.path.join(tmp, "components"))
+        for name in ("components.json", ".env.example", "prompts.json"):
+            if os.path.exists(os.path.join(ROOT, name)):
+                shutil.copy(os.path.join(ROOT, name), tmp)
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(previous)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive simulated sessions against web.py.")
+    parser.add_argument("--sessions", type=int, default=10, help="number of simulated sessions")
+    parser.add_argument("--concurrency", type=int, default=5, help="sessions running at once")
+    parser.add_argument("--iterations", type=int, default=3, help="page tours per session")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock LLM latency in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds allowed per rerun")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    server = start_server(
+        settings=MockSettings(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    )
+    # The application reads its settings from the environment before .env
+    os.environ.update(
+        {
+            "LLM_PROVIDER": "openai",
+            "API_KEY": "mock",
+            "BASE_URL": server.base_url,
+            "GENERATION_MODEL": "mock-model",
+        }
+    )
+
+    with workspace(), contextlib.redirect_stdout(io.StringIO()):
+        # Import and warm the shared application context once, as a running
+        # server would have done before the first users arrive.
+        Session(-1, args.timeout).app.run()
+
+        tracemalloc.start()
+        base_memory = tracemalloc.get_traced_memory()[0]
+        sessions = [Session(i, args.timeout) for i in range(args.sessions)]
+        lock = threading.Lock()
+        finished = []
+
+        def drive(session: Session) -> None:
+            session.script(args.iterations, poll_interval=0.1, max_polls=200)
+            with lock:
+                finished.append(session)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(drive, sessions))
+        wall = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0] - base_memory
+        tracemalloc.stop()
+    server.shutdown()
+
+    all_samples: list[float] = []
+    waits: list[float] = []
+    per_page: dict[str, list[float]] = {}
+    errors: list[str] = []
+    for session in sessions:
+        errors += session.errors
+        waits += session.waits
+        for page, samples in session.samples.items():
+            per_page.setdefault(page, []).extend(samples)
+            all_samples.extend(samples)
+
+    report = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "iterations": args.iterations,
+        "mock_latency_s": args.latency,
+        "wall_s": round(wall, 3),
+        "reruns": len(all_samples),
+        "throughput_reruns_per_s": round(len(all_samples) / wall, 2) if wall else None,
+        "messages_per_s": round(args.sessions * args.iterations / wall, 2) if wall else None,
+        "memory_per_session_kb": round(memory / max(1, args.sessions) / 1024, 1),
+        "rerun_latency": summarize("rerun", all_samples) if all_samples else None,
+        "rerun_wait": summarize("rerun_wait", waits) if waits else None,
+        "pages": {
+            page: summarize(page, samples) for page, samples in sorted(per_page.items())
+        },
+        "errors": errors[:50],
+        "error_count": len(errors),
+    }
+
+    latency = report["rerun_latency"] or {}
+    print(
+        f"{report['reruns']} reruns in {report['wall_s']} s "
+        f"({report['throughput_reruns_per_s']} reruns/s), "
+        f"p50={latency.get('p50_ms')} ms p95={latency.get('p95_ms')} ms "
+        f"p99={latency.get('p99_ms')} ms, "
+        f"wait p95={(report['rerun_wait'] or {}).get('p95_ms')} ms, "
+        f"{report['memory_per_session_kb']} KiB/session, {len(errors)} errors",
+        file=sys.stderr,
+    )
+    if args.output:
+        with open(os.path.join(INVOCATION_DIR, args.output), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockSettings:
+    """Behaviour of the mock server.
+
+    Args:
+        latency: Seconds to wait before the first token is produced.
+        jitter: Random extra latency of up to this many seconds.
+        tokens_per_second: Output rate; ``0`` returns the reply at once.
+        reply_tokens: Number of tokens in every reply.
+        error_rate: Probability of answering with an injected error.
+        error_status: HTTP status used for injected errors.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        tokens_per_second: float = 0.0,
+        reply_tokens: int = 20,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """Minimal OpenAI-compatible chat completions server for benchmarks."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], settings: MockSettings | None = None) -> None:
+        super().__init__(address, MockLLMHandler)
+        self.settings = settings or MockSettings()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server: MockLLMServer
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; avoid the delayed-ACK stall on
+    # keep-alive connections.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data: dict, status: int = 200) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(
+                {"object": "list", "data": [{"id": "mock-model", "object": "model"}]}
+            )
+        else:
+            self._send_json({"error": {"message": "Not found"}}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json({"error": {"message": "Not found"}}, 404)
+            return
+        self.server.count_request()
+        settings = self.server.settings
+
+        if settings.error_rate and random.random() < settings.error_rate:
+            self._send_json(
+                {"error": {"message": "Injected error", "type": "server_error"}},
+                settings.error_status,
+            )
+            return
+
+        time.sleep(settings.latency + random.uniform(0, settings.jitter))
+
+        model = body.get("model", "mock-model")
+        prompt_tokens = sum(
+            len(str(m.get("content", "")).split()) for m in body.get("messages", [])
+        )
+        tokens = [f"tok{i} " for i in range(settings.reply_tokens)]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex}"
+
+        if not body.get("stream"):
+            if settings.tokens_per_second:
+                time.sleep(len(tokens) / settings.tokens_per_second)
+            self._send_json(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> None:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            if settings.tokens_per_second:
+                time.sleep(1 / settings.tokens_per_second)
+            chunk({"content": token})
+        chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            }
+            self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_server(
+    host: str = "127.0.0.1", port: int = 0, settings: MockSettings | None = None
+) -> MockLLMServer:
+    """Start a mock server on a background thread and return it.
+
+    Use port ``0`` to pick a free port; ``server.base_url`` is the value to use
+    as ``BASE_URL``. Call ``server.shutdown()`` when done.
+    """
+    server = MockLLMServer((host, port), settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="0 for instant replies")
+    parser.add_argument("--reply-tokens", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of an injected error")
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    server = MockLLMServer((args.host, args.port), settings)
+    print(f"Mock LLM server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
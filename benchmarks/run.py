@@ -0,0 +1,266 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+# Allow running as ``python benchmarks/run.py`` as well as ``-m benchmarks.run``
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# config reads .env relative to the working directory
+INVOCATION_DIR = os.getcwd()
+os.chdir(ROOT)
+
+import artifact_manager  # noqa: E402
+import conversation_store  # noqa: E402
+import log_writer  # noqa: E402
+import search_index  # noqa: E402
+import usage_ledger  # noqa: E402
+import utils  # noqa: E402
+from component_manager import ComponentManager  # noqa: E402
+
+from benchmarks.mock_llm_server import MockSettings, start_server  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+
+COMPONENT_TEMPLATE = '''from component_base import BaseComponent
+
+
+class BenchComponent{i}(BaseComponent):
+    name = "Bench Component {i}"
+    description = "Synthetic component {i}"
+
+    def render(self):
+        pass
+
+
+def get_component():
+    return BenchComponent{i}()
+'''
+
+
+def measure(fn, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# Process-wide stores opened relative to the working directory on first use
+SINGLETONS = [
+    (usage_ledger, "_ledger"),
+    (conversation_store, "_store"),
+    (search_index, "_index"),
+]
+
+
+@contextlib.contextmanager
+def workdir():
+    """Run inside a temporary directory with stdout (logger output) silenced.
+
+    Stores opened inside the directory are closed afterwards and the ones
+    opened before are put back, so no later code writes to a deleted file.
+    """
+    previous = os.getcwd()
+    saved = [getattr(module, name) for module, name in SINGLETONS]
+    for module, name in SINGLETONS:
+        setattr(module, name, None)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield tmp
+        finally:
+            os.chdir(previous)
+            for (module, name), value in zip(SINGLETONS, saved):
+                opened = getattr(module, name)
+                if opened is not None:
+                    opened._conn.close()
+                setattr(module, name, value)
+
+
+def _mock_llm(base_url: str) -> utils.LLM:
+    return utils.LLM(
+        provider="openai", api_key="mock", base_url=base_url, model_name="mock-model"
+    )
+
+
+def bench_llm_ask(ctx: dict) -> list[dict]:
+    n = ctx["scale"](500)
+    with workdir():
+        llm = _mock_llm(ctx["base_url"])
+        llm.ask("You are a benchmark.", "warm up")
+        samples = measure(lambda: llm.ask("You are a benchmark.", "Say something."), n)
+        stream_samples = measure(
+            lambda: "".join(llm.ask_stream("You are a benchmark.", "Say something.")), n // 5
+        )
+    return [summarize("llm_ask", samples), summarize("llm_ask_stream", stream_samples)]
+
+
+def bench_conversation_send(ctx: dict) -> list[dict]:
+    history = ctx["scale"](1000)
+    n = ctx["scale"](100)
+    filler = "lorem ipsum dolor sit amet " * 10
+    with workdir():
+        conv = _mock_llm(ctx["base_url"]).create_conversation("You are a benchmark.")
+        for i in range(history // 2):
+            conv.messages.append({"role": "user", "content": f"{i} {filler}"})
+            conv.messages.append({"role": "assistant", "content": f"{i} {filler}"})
+        samples = measure(lambda: conv.send("Next message."), n)
+    return [summarize("conversation_send", samples, history_messages=history)]
+
+
+def bench_discover_components(ctx: dict) -> list[dict]:
+    count = ctx["scale"](300)
+    repeats = ctx["scale"](20)
+    with workdir() as tmp:
+        package = "bench_components"
+        os.makedirs(package)
+        open(os.path.join(package, "__init__.py"), "w").close()
+        for i in range(count):
+            with open(os.path.join(package, f"bench_{i}.py"), "w", encoding="utf-8") as f:
+                f.write(COMPONENT_TEMPLATE.format(i=i))
+        sys.path.insert(0, tmp)
+        try:
+            start = time.perf_counter()
+            manager = ComponentManager(components_dir=package, config_path="bench.json")
+            cold = time.perf_counter() - start
+            assert len(manager.available) == count
+            samples = measure(manager.discover_components, repeats)
+        finally:
+            sys.path.remove(tmp)
+            for name in [m for m in sys.modules if m.split(".")[0] == package]:
+                del sys.modules[name]
+    return [
+        summarize(
+            "discover_components",
+            samples,
+            components=count,
+            cold_ms=round(cold * 1000, 4),
+        )
+    ]
+
+
+def bench_artifacts(ctx: dict) -> list[dict]:
+    count = ctx["scale"](10000)
+    artifact_manager.register_artifact_type("bench")
+    with workdir():
+        with open("payload.txt", "w", encoding="utf-8") as f:
+            f.write("x" * 1024)
+        samples = measure(
+            lambda: artifact_manager.write_artifact("Bench", "payload.txt", "bench", "bench"),
+            count,
+        )
+        list_samples = measure(artifact_manager.list_artifacts, ctx["scale"](20))
+    tail = max(1, count // 10)
+    return [
+        summarize(
+            "write_artifact",
+            samples,
+            artifacts=count,
+            first_10pct_mean_ms=round(sum(samples[:tail]) / tail * 1000, 4),
+            last_10pct_mean_ms=round(sum(samples[-tail:]) / tail * 1000, 4),
+        ),
+        summarize("list_artifacts", list_samples, artifacts=count),
+    ]
+
+
+def bench_logger(ctx: dict) -> list[dict]:
+    n = ctx["scale"](20000)
+    line = "benchmark log line " * 5
+    with workdir():
+        log_writer.first_call_time = None
+        samples = measure(lambda: log_writer.logger(line), n)
+    log_writer.first_call_time = None
+    return [summarize("logger", samples)]
+
+
+BENCHMARKS = {
+    "llm": bench_llm_ask,
+    "conversation": bench_conversation_send,
+    "components": bench_discover_components,
+    "artifacts": bench_artifacts,
+    "logger": bench_logger,
+}
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """Return a message for every result slower than the baseline allows."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"])
+        if before and result["mean_ms"] > before["mean_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{result['name']}: {before['mean_ms']:.3f} ms -> {result['mean_ms']:.3f} ms"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the framework against a mock LLM.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="run a tenth of the iterations")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="mock server latency in seconds")
+    args = parser.parse_args()
+
+    server = start_server(settings=MockSettings(latency=args.latency))
+    factor = 0.1 if args.quick else 1.0
+    ctx = {
+        "base_url": server.base_url,
+        "scale": lambda n: max(1, int(n * factor)),
+    }
+
+    results = []
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name}...", file=sys.stderr)
+            results += BENCHMARKS[name](ctx)
+    finally:
+        server.shutdown()
+
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "mock_latency_s": args.latency,
+        "results": results,
+    }
+    for r in results:
+        print(
+            f"{r['name']:<22} n={r['iterations']:<6} mean={r['mean_ms']:>9.3f} ms "
+            f"p95={r['p95_ms']:>9.3f} ms  {r['ops_per_s']} ops/s",
+            file=sys.stderr,
+        )
+    if args.output:
+        with open(os.path.join(INVOCATION_DIR, args.output), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        regressions = compare(
+            results, os.path.join(INVOCATION_DIR, args.baseline), args.tolerance
+        )
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+def _percentile(sorted_samples: list[float], pct: float) -> float:
+    index = max(0, min(len(sorted_samples) - 1, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(name: str, samples: list[float], **extra) -> dict:
+    """Return latency statistics in milliseconds for a list of durations."""
+    ordered = sorted(samples)
+    total = sum(samples)
+    return {
+        "name": name,
+        "iterations": len(samples),
+        "total_s": round(total, 4),
+        "mean_ms": round(total / len(samples) * 1000, 4),
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 4),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "ops_per_s": round(len(samples) / total, 2) if total else None,
+        **extra,
+    }
@@ -15,6 +15,17 @@ class BaseComponent:
         """Render Streamlit UI for this component."""
         raise NotImplementedError
 
+    def run_task(self, payload: dict) -> dict:
+        """Run the component headlessly, e.g. from the HTTP API.
+
+        Args:
+            payload: JSON request body describing the task.
+
+        Returns:
+            dict: JSON serializable result.
+        """
+        raise NotImplementedError
+
 
 def get_component():
     """Dummy to satisfy loader when no component is implemented."""
@@ -108,10 +108,14 @@ class ComponentManager:
             json.dump({"enabled": self.enabled}, f, indent=2)
 
     def discover_components(self):
-        self.available = {}
+        # Built aside and swapped in at once, as other threads iterate it unlocked
+        available = {}
         if not os.path.isdir(self.components_dir):
+            self.available = available
             return
         package_name = self.components_dir.replace(os.sep, ".")
+        # Components added since the last scan must be visible to the import system
+        importlib.invalidate_caches()
         # Discover regular modules and packages first
         for _, name, ispkg in pkgutil.iter_modules([self.components_dir]):
             if ispkg:
@@ -120,8 +124,14 @@ class ComponentManager:
             else:
                 module_path = os.path.join(self.components_dir, f"{name}.py")
                 req_path = None
+            module_name = f"{package_name}.{name}"
             try:
-                module = importlib.import_module(f"{package_name}.{name}")
+                module = sys.modules.get(module_name)
+                if module is None:
+                    module = importlib.import_module(module_name)
+                else:
+                    # Pick up edits; submodules of a package keep their old code
+                    module = importlib.reload(module)
             except Exception as e:
                 logger(f"Failed to import module {name}: {e}")
                 meta = (
@@ -137,14 +147,14 @@ class ComponentManager:
                     meta.get("description", ""),
                     reqs or [],
                 )
-                self.available[comp.name] = comp
+                available[comp.name] = comp
                 continue
 
             if hasattr(module, "get_component"):
                 try:
                     comp = module.get_component()
                     if isinstance(comp, BaseComponent):
-                        self.available[comp.name] = comp
+                        available[comp.name] = comp
                 except Exception as e:
                     logger(f"Failed to load component from module {name}: {e}")
 
@@ -180,16 +190,18 @@ class ComponentManager:
                         meta.get("description", ""),
                         reqs or [],
                     )
-                    self.available[comp.name] = comp
+                    available[comp.name] = comp
                     continue
 
                 if hasattr(module, "get_component"):
                     try:
                         comp = module.get_component()
                         if isinstance(comp, BaseComponent):
-                            self.available[comp.name] = comp
+                            available[comp.name] = comp
                     except Exception as e:
                         logger(f"Failed to load component from module {entry.name}: {e}")
 
+        self.available = available
+
     def get_enabled_components(self):
         return [c for c in self.available.values() if c.name in self.enabled]
@@ -2,11 +2,20 @@ from component_base import BaseComponent
 import streamlit as st
 import utils
 import artifact_manager
+import conversation_store
+import job_queue
+import prompt_registry
 import tempfile
+import time
 import os
 
 artifact_manager.register_artifact_type("text")
 
+# Can be overridden by an ECHO_AGENT_SYS entry in prompts.json
+prompt_registry.get_registry().register("ECHO_AGENT_SYS", "You are a helpful assistant.")
+# Number of messages shown per page of the conversation view.
+PAGE_SIZE = 20
+
 
 class ExampleComponent(BaseComponent):
     name = "Echo Agent"
@@ -15,26 +24,78 @@ class ExampleComponent(BaseComponent):
 
     def __init__(self):
         super().__init__()
-        self.llm = utils.LLM()
-        if "example_conv" not in st.session_state:
-            st.session_state.example_conv = self.llm.create_conversation(
-                "You are a helpful assistant."
-            )
+        self.llm = utils.LLM(component=self.name)
+
+    def _new_conversation(self):
+        return self.llm.create_conversation(
+            prompt_registry.get_registry().render("ECHO_AGENT_SYS"),
+            store=conversation_store.get_store(),
+            window=conversation_store.DEFAULT_WINDOW,
+            component=self.name,
+        )
+
+    def _resume_conversation(self):
+        conv_id = st.session_state.example_resume
+        if conv_id:
+            st.session_state.example_conv = utils.Conversation.resume(self.llm, conv_id)
 
     def render(self):
+        # The component instance is shared between sessions, so the
+        # per-user conversation is created lazily in the session state.
+        if "example_conv" not in st.session_state:
+            st.session_state.example_conv = self._new_conversation()
         st.header(self.name)
+
+        past = conversation_store.get_store().list_conversations(self.name, limit=20)
+        labels = {
+            c["id"]: time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(c["updated_at"]))
+            for c in past
+        }
+        cols = st.columns([3, 1])
+        cols[0].selectbox(
+            "Resume conversation",
+            [""] + list(labels),
+            format_func=lambda conv_id: labels.get(conv_id, "-"),
+            key="example_resume",
+            on_change=self._resume_conversation,
+        )
+        if cols[1].button("New Conversation"):
+            st.session_state.example_conv = self._new_conversation()
+        conv = st.session_state.example_conv
+
         prompt = st.text_area("Prompt")
         if st.button("Send"):
-            with st.spinner("Generating..."):
-                reply = st.session_state.example_conv.send(prompt)
-        history_text = "\n".join(
-            f"{m['role']}: {m['content']}" for m in st.session_state.example_conv.history[1:]
-        )
-        st.text_area("Conversation", value=history_text, height=300)
+            # Run the request as a background job so it survives reruns and
+            # navigation; the reply is appended to the conversation when done.
+            job = job_queue.get_job_queue().submit_conversation(
+                self.name, conv, prompt
+            )
+            st.session_state.example_job = job.id
+        job_id = st.session_state.get("example_job")
+        job = job_queue.get_job_queue().get(job_id) if job_id else None
+        if job and not job.finished:
+            st.info(f"Generating... ({job.status})")
+            if st.button("Refresh"):
+                st.rerun()
+        elif job and job.status == job_queue.FAILED:
+            st.error(job.error)
+
+        # Only the displayed page of the history is loaded from the store.
+        total = conv.message_count
+        pages = max(1, -(-total // PAGE_SIZE))
+        page = st.number_input("Page", min_value=1, max_value=pages, value=pages)
+        for message in conv.load_page((page - 1) * PAGE_SIZE, PAGE_SIZE):
+            with st.chat_message(message["role"]):
+                st.write(message["content"])
 
         if st.button("Save Conversation Artifact"):
-            with tempfile.NamedTemporaryFile("w", delete=False, suffix=".txt") as f:
-                f.write(history_text)
+            with tempfile.NamedTemporaryFile(
+                "w", delete=False, suffix=".txt", encoding="utf-8"
+            ) as f:
+                for message in conversation_store.get_store().iter_messages(
+                    conv.conversation_id
+                ):
+                    f.write(f"{message['role']}: {message['content']}\n")
                 temp_path = f.name
             artifact_manager.write_artifact(
                 self.name,
@@ -45,5 +106,10 @@ class ExampleComponent(BaseComponent):
             os.remove(temp_path)
             st.success("Artifact saved")
 
+    def run_task(self, payload: dict) -> dict:
+        system_prompt = prompt_registry.get_registry().render("ECHO_AGENT_SYS")
+        reply = self.llm.ask(system_prompt, payload.get("prompt", ""))
+        return {"reply": reply}
+
 def get_component():
     return ExampleComponent()
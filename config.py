@@ -1,7 +1,9 @@
 import os
 import json
 import shutil
-from dotenv import load_dotenv
+import tempfile
+import threading
+from dotenv import dotenv_values, load_dotenv
 from log_writer import logger
 
 # Built-in registry of configuration items.
@@ -21,9 +23,142 @@ CONFIG_ITEMS = {
     "BASE_URL": {"description": "Base URL for the API provider"},
     "GENERATION_MODEL": {"description": "Model used for generation"},
     "FIXING_MODEL": {"description": "Model used for fixing"},
+    "JOB_WORKERS": {
+        "description": "Number of background jobs that may run at the same time",
+        "default": "2",
+    },
+    "BACKUP_LLM_PROVIDER": {
+        "description": "Provider of the backup model used by the LLM router",
+        "type": "select",
+        "options": ["openai", "anthropic", "google"],
+        "default": "openai",
+    },
+    "BACKUP_API_KEY": {
+        "description": "API key for the backup provider (defaults to API_KEY)",
+        "type": "password",
+    },
+    "BACKUP_BASE_URL": {"description": "Base URL for the backup provider (defaults to BASE_URL)"},
+    "BACKUP_MODEL": {"description": "Backup model used by the LLM router; leave empty to disable"},
+    "ROUTER_HEDGING": {
+        "description": "Send a duplicate request to the next model when a call is slower than usual",
+        "type": "select",
+        "options": ["false", "true"],
+        "default": "false",
+    },
+    "PROFILER_ENABLED": {
+        "description": "Run component pages under cProfile so their profiles can be saved as artifacts",
+        "type": "select",
+        "options": ["false", "true"],
+        "default": "false",
+    },
+    "JAVA_PATH": {
+        "description": "Java executable used by the decompiler (Java 11 or newer)",
+        "default": "java",
+    },
+    "DECOMPILER_WORKERS": {
+        "description": "Number of warm CFR processes used to decompile Java code",
+        "default": "2",
+    },
+    "NATIVE_JSON_MODE": {
+        "description": "Comma-separated models or base URLs of OpenAI-compatible APIs that accept json_schema response formats (always on for api.openai.com)",
+    },
+    "HTTP_MAX_CONNECTIONS": {
+        "description": "Maximum number of connections kept open to the LLM providers (applies after a restart)",
+        "default": "20",
+    },
+    "HTTP_TIMEOUT": {
+        "description": "Seconds to wait for a reply from an OpenAI-compatible provider (applies after a restart)",
+        "default": "600",
+    },
+    "HTTP_WARMUP": {
+        "description": "Open connections to the configured BASE_URL when the application starts",
+        "type": "select",
+        "options": ["false", "true"],
+        "default": "false",
+    },
 }
 
 
+# Keys stored in prompts.json instead of .env
+PROMPT_KEYS = ['SYS_GEN', 'USR_GEN', 'SYS_EDIT', 'USR_EDIT']
+
+ENV_FILE = '.env'
+PROMPTS_FILE = 'prompts.json'
+
+# Incremented whenever a configuration value changes. Long-lived objects such
+# as LLM clients compare it with the version they were built from.
+CONFIG_VERSION = 0
+
+# Modification times of the configuration files as last seen by this process.
+_mtimes: dict[str, int | None] = {}
+
+# The environment the process was started with, before ``.env`` was loaded
+# into it. A key removed from ``.env`` falls back to this, not to the value
+# the file once put into ``os.environ``.
+_PROCESS_ENV = dict(os.environ)
+
+# Serializes reloads and edits, which update the module globals together
+_lock = threading.RLock()
+
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _atomic_write(path, text):
+    """
+    Writes ``text`` to ``path`` through a temporary file and a rename, so the
+    file is never left truncated if the process dies while writing.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_prompts():
+    """
+    Reads prompts.json and returns the prompt values as strings.
+
+    Missing or invalid files yield empty values for every prompt key.
+    """
+    try:
+        with open(PROMPTS_FILE, 'r', encoding='utf-8') as f:
+            prompts = json.load(f)
+    except FileNotFoundError:
+        logger("Warning: prompts.json file not found. Prompt configurations not loaded.")
+        return {key: '' for key in PROMPT_KEYS}
+    except json.JSONDecodeError as e:
+        logger(f"Error: Failed to parse prompts.json: {e}")
+        return {key: '' for key in PROMPT_KEYS}
+
+    values = {}
+    for key in PROMPT_KEYS:
+        value = prompts.get(key, '')
+        # Object entries also declare placeholders for the prompt registry
+        if isinstance(value, dict):
+            value = value.get('text', '')
+        # Handle both string and array formats
+        if isinstance(value, list):
+            value = '\n'.join(value)
+        values[key] = value
+        logger(f"prompt: {key} -> loaded from prompts.json")
+    return values
+
+
 def load_config():
     """
     Loads the configuration from the ``.env`` file and ``prompts.json`` file,
@@ -37,11 +172,11 @@ def load_config():
         None
     """
     # Ensure the .env file exists by copying from the example if necessary
-    if not os.path.exists('.env') and os.path.exists('.env.example'):
-        shutil.copy('.env.example', '.env')
+    if not os.path.exists(ENV_FILE) and os.path.exists('.env.example'):
+        shutil.copy('.env.example', ENV_FILE)
 
     # Load environment variables from .env file
-    load_dotenv()
+    load_dotenv(ENV_FILE)
     
     # Load configuration from .env file
     for key, meta in CONFIG_ITEMS.items():
@@ -51,32 +186,144 @@ def load_config():
         logger(
             f"config: {key} -> {value if key != 'API_KEY' else '********'}"
         )
-      # Load prompts from prompts.json file
-    try:
-        with open('prompts.json', 'r', encoding='utf-8') as f:
-            prompts = json.load(f)
-            
-        # Configuration keys that should be loaded from prompts.json
-        prompt_config_keys = ['SYS_GEN', 'USR_GEN', 'SYS_EDIT', 'USR_EDIT']
-        
-        for key in prompt_config_keys:
-            value = prompts.get(key, '')
-            # Handle both string and array formats
-            if isinstance(value, list):
-                value = '\n'.join(value)
-            globals()[key] = value
-            logger(f"prompt: {key} -> loaded from prompts.json")
-            
-    except FileNotFoundError:
-        logger("Warning: prompts.json file not found. Prompt configurations not loaded.")
-        # Set default empty values for prompt keys
-        for key in ['SYS_GEN', 'USR_GEN', 'SYS_EDIT', 'USR_EDIT']:
-            globals()[key] = ''
-    except json.JSONDecodeError as e:
-        logger(f"Error: Failed to parse prompts.json: {e}")
-        # Set default empty values for prompt keys
-        for key in ['SYS_GEN', 'USR_GEN', 'SYS_EDIT', 'USR_EDIT']:
-            globals()[key] = ''
+
+    # Load prompts from prompts.json file
+    globals().update(_read_prompts())
+
+    _mtimes[ENV_FILE] = _file_mtime(ENV_FILE)
+    _mtimes[PROMPTS_FILE] = _file_mtime(PROMPTS_FILE)
+
+
+def reload_if_changed():
+    """
+    Reloads the configuration if ``.env`` or ``prompts.json`` was modified by
+    another process since it was last read. Only two ``stat`` calls are made
+    when nothing changed.
+
+    Values in ``.env`` take precedence over the process environment so that
+    edits made elsewhere are picked up.
+
+    Returns:
+        list: The keys whose values changed.
+    """
+    global CONFIG_VERSION
+    with _lock:
+        changed = []
+
+        env_mtime = _file_mtime(ENV_FILE)
+        if env_mtime != _mtimes.get(ENV_FILE):
+            _mtimes[ENV_FILE] = env_mtime
+            values = dotenv_values(ENV_FILE) if env_mtime is not None else {}
+            for key, meta in CONFIG_ITEMS.items():
+                value = values.get(key)
+                if value is None:
+                    value = _PROCESS_ENV.get(key)
+                    if value is None:
+                        os.environ.pop(key, None)
+                        value = meta.get("default", "")
+                    else:
+                        os.environ[key] = value
+                else:
+                    os.environ[key] = value
+                if globals().get(key) != value:
+                    globals()[key] = value
+                    changed.append(key)
+
+        prompts_mtime = _file_mtime(PROMPTS_FILE)
+        if prompts_mtime != _mtimes.get(PROMPTS_FILE):
+            _mtimes[PROMPTS_FILE] = prompts_mtime
+            for key, value in _read_prompts().items():
+                if globals().get(key) != value:
+                    globals()[key] = value
+                    changed.append(key)
+
+        if changed:
+            CONFIG_VERSION += 1
+            logger(f"config: reloaded {', '.join(changed)} (version {CONFIG_VERSION})")
+        return changed
+
+
+def _env_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def edit_config_many(values):
+    """
+    Edits several keys at once. ``.env`` and ``prompts.json`` are each read
+    and atomically rewritten at most once.
+
+    Args:
+        values (dict): Mapping of keys to their new values.
+
+    Returns:
+        list: The keys whose values changed.
+    """
+    global CONFIG_VERSION
+    with _lock:
+        prompt_values = {k: v for k, v in values.items() if k in PROMPT_KEYS}
+        env_values = {k: v for k, v in values.items() if k not in PROMPT_KEYS}
+
+        if prompt_values:
+            try:
+                # Read current prompts.json file content
+                with open(PROMPTS_FILE, "r", encoding='utf-8') as f:
+                    prompts = json.load(f)
+            except FileNotFoundError:
+                # If prompts.json doesn't exist, create it
+                prompts = {}
+            except json.JSONDecodeError:
+                # If prompts.json is invalid, reset it
+                prompts = {}
+
+            for key, value in prompt_values.items():
+                # Convert string to array format for better readability
+                if isinstance(value, str) and '\n' in value:
+                    prompts[key] = value.split('\n')
+                else:
+                    prompts[key] = str(value)
+
+            _atomic_write(
+                PROMPTS_FILE, json.dumps(prompts, indent=2, ensure_ascii=False)
+            )
+            _mtimes[PROMPTS_FILE] = _file_mtime(PROMPTS_FILE)
+
+        if env_values:
+            # Read current .env file content
+            env_lines = []
+            try:
+                with open(ENV_FILE, "r", encoding='utf-8') as f:
+                    env_lines = f.readlines()
+            except FileNotFoundError:
+                # If .env doesn't exist, create it
+                pass
+            if env_lines and not env_lines[-1].endswith("\n"):
+                env_lines[-1] += "\n"
+
+            # Update or add the key-value pairs
+            remaining = dict(env_values)
+            for i, line in enumerate(env_lines):
+                key = line.strip().split("=", 1)[0]
+                if "=" in line and key in remaining:
+                    env_lines[i] = f"{key}={_env_value(remaining.pop(key))}\n"
+            for key, value in remaining.items():
+                env_lines.append(f"{key}={_env_value(value)}\n")
+
+            _atomic_write(ENV_FILE, "".join(env_lines))
+            _mtimes[ENV_FILE] = _file_mtime(ENV_FILE)
+            for key, value in env_values.items():
+                os.environ[key] = _env_value(value)
+
+        # Update the global variables
+        changed = []
+        for key, value in values.items():
+            if globals().get(key) != str(value):
+                globals()[key] = str(value)
+                changed.append(key)
+        if changed:
+            CONFIG_VERSION += 1
+        return changed
 
 
 def edit_config(key, value):
@@ -90,77 +337,7 @@ def edit_config(key, value):
     Returns:
         bool: True
     """
-    # Check if this is a prompt-related key
-    prompt_keys = ['SYS_GEN', 'USR_GEN', 'SYS_EDIT', 'USR_EDIT']
-    
-    if key in prompt_keys:
-        # Edit prompts.json file
-        prompts_file_path = 'prompts.json'
-        
-        try:
-            # Read current prompts.json file content
-            with open(prompts_file_path, "r", encoding='utf-8') as f:
-                prompts = json.load(f)
-        except FileNotFoundError:
-            # If prompts.json doesn't exist, create it
-            prompts = {}
-        except json.JSONDecodeError:
-            # If prompts.json is invalid, reset it
-            prompts = {}
-          # Update the key-value pair
-        # Convert string to array format for better readability
-        if isinstance(value, str) and '\n' in value:
-            prompts[key] = value.split('\n')
-        else:
-            prompts[key] = str(value)
-        
-        # Write back to prompts.json file
-        with open(prompts_file_path, "w", encoding='utf-8') as f:
-            json.dump(prompts, f, indent=2, ensure_ascii=False)
-        
-        # Update the global variable
-        globals()[key] = str(value)
-        
-    else:
-        # Edit .env file for non-prompt keys
-        env_file_path = '.env'
-        
-        # Read current .env file content
-        env_lines = []
-        try:
-            with open(env_file_path, "r", encoding='utf-8') as f:
-                env_lines = f.readlines()
-        except FileNotFoundError:
-            # If .env doesn't exist, create it
-            pass
-        
-        # Update or add the key-value pair
-        key_found = False
-        for i, line in enumerate(env_lines):
-            if line.strip().startswith(f"{key}="):
-                if isinstance(value, bool):
-                    write_value = "true" if value else "false"
-                else:
-                    write_value = str(value)
-                env_lines[i] = f"{key}={write_value}\n"
-                key_found = True
-                break
-        
-        # If key wasn't found, add it
-        if not key_found:
-            if isinstance(value, bool):
-                write_value = "true" if value else "false"
-            else:
-                write_value = str(value)
-            env_lines.append(f"{key}={write_value}\n")
-        
-        # Write back to .env file
-        with open(env_file_path, "w", encoding='utf-8') as f:
-            f.writelines(env_lines)
-        
-        # Update the global variable
-        globals()[key] = str(value)
-
+    edit_config_many({key: value})
     return True
 
 
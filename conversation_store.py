@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import search_index
+from log_writer import logger
+
+STORE_PATH = os.path.join("data", "conversations.db")
+
+# Number of messages a resumed conversation keeps in memory by default.
+DEFAULT_WINDOW = 40
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    component TEXT NOT NULL DEFAULT '',
+    system_prompt TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_component
+    ON conversations (component, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+"""
+
+
+class ConversationStore:
+    """SQLite backed storage for conversation histories.
+
+    Messages are appended one at a time and read back in pages, so neither
+    writing nor displaying a long conversation needs the whole history.
+    """
+
+    def __init__(self, path: str = STORE_PATH, index=None) -> None:
+        self.path = path
+        # search_index.SearchIndex kept up to date with appended messages
+        self.index = index
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def create_conversation(
+        self, system_prompt: str, component: str = "", conv_id: str | None = None
+    ) -> str:
+        """Create a conversation and return its id, a new one unless ``conv_id`` is given."""
+        conv_id = conv_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO conversations VALUES (?, ?, ?, ?, ?)",
+                (conv_id, component, system_prompt, now, now),
+            )
+        return conv_id
+
+    def get_conversation(self, conv_id: str) -> dict | None:
+        """Return the conversation record or ``None`` if it does not exist."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM conversations WHERE id = ?", (conv_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_conversations(
+        self, component: str | None = None, limit: int = 50, offset: int = 0
+    ) -> list[dict]:
+        """Return conversations, most recently updated first."""
+        query = "SELECT * FROM conversations"
+        params: list = []
+        if component is not None:
+            query += " WHERE component = ?"
+            params.append(component)
+        query += " ORDER BY updated_at DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_conversations(self, page_size: int = 200):
+        """Yield every conversation in id order, reading one page at a time.
+
+        Pages continue after the last id seen, so conversations updated
+        while iterating are neither skipped nor repeated.
+        """
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM conversations WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, page_size),
+                ).fetchall()
+            yield from (dict(row) for row in rows)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["id"]
+
+    def append_message(self, conv_id: str, role: str, content: str) -> int:
+        """Append a message and return its sequence number."""
+        now = time.time()
+        with self._lock, self._conn:
+            seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE conversation_id = ?",
+                (conv_id,),
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                (conv_id, seq, role, content, now),
+            )
+            self._conn.execute(
+                "UPDATE conversations SET updated_at = ? WHERE id = ?", (now, conv_id)
+            )
+            row = self._conn.execute(
+                "SELECT component FROM conversations WHERE id = ?", (conv_id,)
+            ).fetchone()
+        if self.index is not None:
+            try:
+                self.index.add_message(conv_id, seq, role, content, row[0] if row else "", now)
+            except Exception as e:
+                logger(f"search: failed to index message {conv_id}:{seq}: {e}")
+        return seq
+
+    def count_messages(self, conv_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation_id = ?",
+                (conv_id,),
+            ).fetchone()[0]
+
+    def load_messages(self, conv_id: str, offset: int = 0, limit: int = 50) -> list[dict]:
+        """Return a page of messages in chronological order."""
+        # Sequence numbers are contiguous from 1, so the offset maps directly
+        # onto the primary key instead of scanning skipped rows.
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, created_at FROM messages "
+                "WHERE conversation_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (conv_id, offset, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def recent_messages(self, conv_id: str, limit: int) -> list[dict]:
+        """Return the last ``limit`` messages in chronological order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, created_at FROM messages "
+                "WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+                (conv_id, limit),
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def iter_messages(self, conv_id: str, page_size: int = 500):
+        """Yield every message of a conversation, reading one page at a time."""
+        offset = 0
+        while True:
+            page = self.load_messages(conv_id, offset, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    def delete_conversation(self, conv_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM messages WHERE conversation_id = ?", (conv_id,)
+            )
+            self._conn.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
+        if self.index is not None:
+            self.index.remove_conversation(conv_id)
+
+
+_store: ConversationStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ConversationStore:
+    """Return the process-wide conversation store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore(index=search_index.get_index())
+        return _store
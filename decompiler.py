@@ -0,0 +1,485 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import artifact_manager
+import config
+import profiling
+from log_writer import logger
+from singleflight import SingleFlight
+
+# Resolved from this file so the decompiler works from any working directory
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+CFR_JAR = os.path.join(_ROOT, "lib", "cfr-0.152.jar")
+WORKER_SOURCE = os.path.join(_ROOT, "lib", "CfrWorker.java")
+CACHE_DIR = os.path.join(_ROOT, "data", "decompiled")
+
+# Jars with fewer classes are decompiled by a single worker
+PARALLEL_MIN_CLASSES = 200
+STARTUP_TIMEOUT = 120.0
+REQUEST_TIMEOUT = 900.0
+# Seconds before starting a warm worker is tried again after it failed,
+# doubling with every further failure up to the maximum
+WORKER_RETRY_DELAY = 30.0
+WORKER_RETRY_MAX = 3600.0
+
+# Number of content hashes remembered by a Decompiler
+HASH_CACHE_SIZE = 1024
+
+SUMMARY_FILE = "summary.txt"
+# Written to the summary when CFR cannot read a jar; it does not raise then
+JAR_FAILURE = "Exception analysing jar"
+
+artifact_manager.register_artifact_type("java-source")
+
+
+class DecompilerError(Exception):
+    """Raised when Java is missing or CFR fails to decompile an input."""
+
+
+class _Worker:
+    """A JVM running ``CfrWorker`` that serves one request at a time."""
+
+    def __init__(self, java_path: str) -> None:
+        if shutil.which(java_path) is None:
+            raise DecompilerError(f"Java executable not found: {java_path}; set JAVA_PATH")
+        self.process = subprocess.Popen(
+            [java_path, "-cp", CFR_JAR, WORKER_SOURCE],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        threading.Thread(target=self._forward_stderr, daemon=True).start()
+        reply = self._read_reply(STARTUP_TIMEOUT)
+        if reply != "READY":
+            self.close()
+            raise DecompilerError(f"Could not start the CFR worker: {reply or 'no reply'}")
+        logger(f"decompiler: started CFR worker {self.process.pid}")
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def _forward_stderr(self) -> None:
+        for line in self.process.stderr:
+            line = line.rstrip()
+            if line:
+                logger(f"decompiler[{self.process.pid}]: {line}")
+
+    def _read_reply(self, timeout: float) -> str:
+        # readline() has no timeout, so a hung JVM is killed to unblock it
+        timer = threading.Timer(timeout, self.process.kill)
+        timer.start()
+        try:
+            return self.process.stdout.readline().rstrip("\n")
+        finally:
+            timer.cancel()
+
+    def run(self, source: str, output_dir: str, jar_filter: str = "") -> None:
+        """Decompile ``source`` into ``output_dir``.
+
+        Args:
+            source: Path of a jar or class file.
+            output_dir: Directory the ``.java`` files are written to.
+            jar_filter: Regular expression selecting the classes of a jar to
+                decompile, empty for all of them.
+
+        Raises:
+            DecompilerError: If CFR reports an error or the worker dies.
+        """
+        try:
+            self.process.stdin.write(f"{source}\t{output_dir}\t{jar_filter}\n")
+            self.process.stdin.flush()
+        except OSError:
+            pass
+        reply = self._read_reply(REQUEST_TIMEOUT)
+        if reply == "OK":
+            return
+        if not reply:
+            self.close()
+            raise DecompilerError(f"CFR worker stopped while decompiling {source}")
+        raise DecompilerError(f"CFR failed on {source}: {reply.removeprefix('ERR ')}")
+
+    def close(self) -> None:
+        if self.alive:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+
+
+class _CliWorker:
+    """Runs CFR's command line in a new JVM for every request.
+
+    Used when the Java runtime cannot launch ``CfrWorker.java``, which needs
+    the ``jdk.compiler`` module that runtimes without a JDK lack. The pool
+    drops it at ``retire_at`` to try starting a warm worker again.
+    """
+
+    def __init__(self, java_path: str, retire_at: float) -> None:
+        self.java_path = java_path
+        self.retire_at = retire_at
+
+    @property
+    def alive(self) -> bool:
+        return time.monotonic() < self.retire_at
+
+    def run(self, source: str, output_dir: str, jar_filter: str = "") -> None:
+        """Decompile ``source`` into ``output_dir``, like :meth:`_Worker.run`."""
+        args = [self.java_path, "-jar", CFR_JAR, source, "--outputdir", output_dir]
+        args += ["--silent", "true"]
+        if jar_filter:
+            args += ["--jarfilter", jar_filter]
+        try:
+            result = subprocess.run(
+                args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                timeout=REQUEST_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            raise DecompilerError(f"CFR timed out on {source}")
+        for line in result.stderr.splitlines():
+            if line.strip():
+                logger(f"decompiler: {line.rstrip()}")
+        if result.returncode != 0:
+            raise DecompilerError(f"CFR failed on {source} with exit code {result.returncode}")
+
+    def close(self) -> None:
+        pass
+
+
+class WorkerPool:
+    """Warm CFR workers shared by all decompilations.
+
+    Workers are started on first use, up to ``size`` of them, and kept
+    running so only the first request pays for the JVM startup.
+    """
+
+    def __init__(self, size: int, java_path: str = "java") -> None:
+        self.size = max(1, size)
+        self.java_path = java_path
+        self._idle: list[_Worker] = []
+        self._started = 0
+        self._cond = threading.Condition()
+        # After a warm worker failed to start, CFR's command line is used
+        # until this time
+        self._retry_at = 0.0
+        self._retry_delay = WORKER_RETRY_DELAY
+
+    def _start(self):
+        with self._cond:
+            retry_at = self._retry_at
+        if time.monotonic() < retry_at:
+            return _CliWorker(self.java_path, retry_at)
+        try:
+            worker = _Worker(self.java_path)
+        except DecompilerError as e:
+            if shutil.which(self.java_path) is None:
+                raise
+            with self._cond:
+                delay = self._retry_delay
+                self._retry_at = retry_at = time.monotonic() + delay
+                self._retry_delay = min(delay * 2, WORKER_RETRY_MAX)
+            logger(
+                f"decompiler: {e}; starting CFR for every request, "
+                f"retrying the worker in {delay:.0f}s"
+            )
+            return _CliWorker(self.java_path, retry_at)
+        with self._cond:
+            self._retry_delay = WORKER_RETRY_DELAY
+        return worker
+
+    @contextmanager
+    def worker(self):
+        """Borrow a worker, starting one if none is idle and the pool has room."""
+        with self._cond:
+            while not self._idle and self._started >= self.size:
+                self._cond.wait()
+            worker = self._idle.pop() if self._idle else None
+            if worker is not None and not worker.alive:
+                # Exited or retired while idle; its slot is reused
+                worker = None
+            elif worker is None:
+                self._started += 1
+        if worker is None:
+            try:
+                worker = self._start()
+            except BaseException:
+                with self._cond:
+                    self._started -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield worker
+        finally:
+            with self._cond:
+                if worker.alive:
+                    self._idle.append(worker)
+                else:
+                    self._started -= 1
+                self._cond.notify()
+
+    def close(self) -> None:
+        """Stop the idle workers; busy ones stop when they are returned."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+        for worker in idle:
+            worker.close()
+
+
+def _package_filter(packages: list[str]) -> str:
+    """Return a CFR ``jarfilter`` matching the classes directly in ``packages``."""
+    parts = [re.escape(p) + r"\.[^.]+" if p else r"[^.]+" for p in packages]
+    return "^(?:" + "|".join(parts) + ")$"
+
+
+def _split_packages(path: str, batches: int) -> list[str]:
+    """Split the classes of a jar into about ``batches`` filters of similar size.
+
+    Returns a single empty filter for small jars and other inputs, meaning
+    the input is decompiled in one request.
+    """
+    if batches < 2 or not zipfile.is_zipfile(path):
+        return [""]
+    counts: dict[str, int] = {}
+    with zipfile.ZipFile(path) as jar:
+        for name in jar.namelist():
+            if name.endswith(".class") and not name.startswith("META-INF/"):
+                package = name.rpartition("/")[0].replace("/", ".")
+                counts[package] = counts.get(package, 0) + 1
+    if sum(counts.values()) < PARALLEL_MIN_CLASSES or len(counts) < 2:
+        return [""]
+
+    # Largest packages first, each into the currently smallest batch
+    groups: list[tuple[int, list[str]]] = [(0, []) for _ in range(min(batches, len(counts)))]
+    for package, count in sorted(counts.items(), key=lambda item: -item[1]):
+        size, packages = min(groups, key=lambda group: group[0])
+        groups.remove((size, packages))
+        groups.append((size + count, packages + [package]))
+    return [_package_filter(packages) for _, packages in groups]
+
+
+class Decompiler:
+    """Decompile jar and class files with CFR and cache the sources.
+
+    Sources are stored under ``data/decompiled/<sha256>`` keyed by the content
+    of the input, so a jar that was decompiled before is served from disk no
+    matter where it is located. Large jars are split by package and
+    decompiled by several workers in parallel.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        java_path: str | None = None,
+        cache_dir: str = CACHE_DIR,
+    ) -> None:
+        if workers is None:
+            try:
+                workers = int(getattr(config, "DECOMPILER_WORKERS", "") or 2)
+            except ValueError:
+                workers = 2
+        self.pool = WorkerPool(workers, java_path or getattr(config, "JAVA_PATH", "") or "java")
+        self.cache_dir = cache_dir
+        self._flight = SingleFlight()
+        # Content hashes by (path, mtime, size) so cache hits skip reading the
+        # file, least recently used first
+        self._hashes: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def content_hash(self, path: str) -> str:
+        """Return the SHA-256 of the file at ``path``."""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest is not None:
+                self._hashes.move_to_end(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._hashes[key] = digest
+                while len(self._hashes) > HASH_CACHE_SIZE:
+                    self._hashes.popitem(last=False)
+        return digest
+
+    @profiling.track("decompiler")
+    def decompile(self, path: str) -> str:
+        """Return the directory holding the decompiled sources of ``path``.
+
+        Args:
+            path: A jar, zip, war or class file.
+
+        Raises:
+            DecompilerError: If the input cannot be decompiled.
+        """
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        digest = self.content_hash(path)
+        output_dir = os.path.join(self.cache_dir, digest)
+        if os.path.isdir(output_dir):
+            return output_dir
+        return self._flight.do(digest, lambda: self._decompile(path, output_dir))
+
+    def _decompile(self, path: str, output_dir: str) -> str:
+        if os.path.isdir(output_dir):
+            return output_dir
+        source = os.path.abspath(path)
+        if any(c in source for c in "\t\r\n"):
+            raise DecompilerError(f"Unsupported file name: {path!r}")
+        staging = os.path.abspath(f"{output_dir}.tmp-{uuid.uuid4().hex}")
+        filters = _split_packages(source, self.pool.size * 2)
+        batch_dirs = [os.path.join(staging, f".batch-{i}") for i in range(len(filters))]
+        logger(f"decompiler: decompiling {path} in {len(filters)} batch(es)")
+
+        def run(batch_dir: str, jar_filter: str) -> None:
+            os.makedirs(batch_dir, exist_ok=True)
+            with self.pool.worker() as worker:
+                worker.run(source, batch_dir, jar_filter)
+            self._check_output(source, batch_dir)
+
+        try:
+            if len(filters) == 1:
+                run(batch_dirs[0], filters[0])
+            else:
+                with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+                    for future in [executor.submit(run, d, f) for d, f in zip(batch_dirs, filters)]:
+                        future.result()
+            self._merge(staging, batch_dirs)
+            try:
+                os.replace(staging, output_dir)
+            except OSError:
+                # Another process finished the same input first
+                if not os.path.isdir(output_dir):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return output_dir
+
+    @staticmethod
+    def _check_output(source: str, batch_dir: str) -> None:
+        """Raise if CFR reported success without decompiling ``source``.
+
+        CFR logs unreadable inputs instead of raising, so a broken jar only
+        shows in the summary and a broken class file leaves no output.
+        """
+        summary = os.path.join(batch_dir, SUMMARY_FILE)
+        if os.path.isfile(summary):
+            with open(summary, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if line.startswith(JAR_FAILURE):
+                        raise DecompilerError(f"CFR failed on {source}: {line.strip()}")
+        for _, _, files in os.walk(batch_dir):
+            if any(name.endswith(".java") for name in files):
+                return
+        raise DecompilerError(f"CFR produced no sources for {source}")
+
+    @staticmethod
+    def _merge(staging: str, batch_dirs: list[str]) -> None:
+        summaries = []
+        for batch_dir in batch_dirs:
+            for root, _, files in os.walk(batch_dir):
+                for name in files:
+                    src = os.path.join(root, name)
+                    rel = os.path.relpath(src, batch_dir)
+                    if rel == SUMMARY_FILE:
+                        with open(src, "r", encoding="utf-8", errors="replace") as f:
+                            summaries.append(f.read())
+                        continue
+                    dst = os.path.join(staging, rel)
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    os.replace(src, dst)
+            shutil.rmtree(batch_dir, ignore_errors=True)
+        if any(s.strip() for s in summaries):
+            with open(os.path.join(staging, SUMMARY_FILE), "w", encoding="utf-8") as f:
+                f.write("\n".join(summaries))
+
+    def get_source(self, path: str, class_name: str) -> str:
+        """Return the decompiled source of ``class_name`` (e.g. ``com.example.Main``) in ``path``."""
+        output_dir = self.decompile(path)
+        file_path = os.path.join(output_dir, *class_name.split(".")) + ".java"
+        if not os.path.isfile(file_path):
+            raise KeyError(class_name)
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def archive(self, path: str) -> str:
+        """Return a zip of the decompiled sources of ``path``, cached next to them."""
+        output_dir = self.decompile(path)
+        zip_path = f"{output_dir}.zip"
+        if os.path.isfile(zip_path):
+            return zip_path
+        fd, tmp_path = tempfile.mkstemp(suffix=".zip", dir=self.cache_dir)
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+                for root, _, files in os.walk(output_dir):
+                    for name in sorted(files):
+                        file_path = os.path.join(root, name)
+                        archive.write(file_path, os.path.relpath(file_path, output_dir))
+            os.replace(tmp_path, zip_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return zip_path
+
+    def write_artifact(self, component: str, path: str, remark: str | None = None) -> str:
+        """Decompile ``path`` and store its sources as a ``java-source`` artifact.
+
+        Returns:
+            The path of the stored artifact.
+        """
+        zip_path = self.archive(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            named = os.path.join(tmp_dir, f"{name}-sources.zip")
+            try:
+                os.link(zip_path, named)
+            except OSError:
+                shutil.copyfile(zip_path, named)
+            return artifact_manager.write_artifact(
+                component,
+                named,
+                remark or f"Decompiled sources of {os.path.basename(path)}",
+                "java-source",
+            )
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+_decompiler: Decompiler | None = None
+_decompiler_lock = threading.Lock()
+
+
+def get_decompiler() -> Decompiler:
+    """Return the process-wide decompiler, creating it on first use."""
+    global _decompiler
+    with _decompiler_lock:
+        if _decompiler is None:
+            _decompiler = Decompiler()
+        return _decompiler
@@ -0,0 +1,137 @@
+import importlib.util
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from log_writer import logger
+
+DEFAULT_MAX_CONNECTIONS = 20
+# Idle connections are kept open this long so requests after a pause skip
+# the TCP and TLS handshakes
+KEEPALIVE_EXPIRY = 120.0
+WARMUP_TIMEOUT = 5.0
+# The OpenAI SDK's defaults, which a client of its own would have used
+DEFAULT_TIMEOUT = 600.0
+CONNECT_TIMEOUT = 5.0
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# HTTP/2 needs the optional ``h2`` package (``pip install httpx[http2]``)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def max_connections() -> int:
+    try:
+        return max(1, int(getattr(config, "HTTP_MAX_CONNECTIONS", "") or DEFAULT_MAX_CONNECTIONS))
+    except ValueError:
+        return DEFAULT_MAX_CONNECTIONS
+
+
+def request_timeout() -> float:
+    try:
+        return max(1.0, float(getattr(config, "HTTP_TIMEOUT", "") or DEFAULT_TIMEOUT))
+    except ValueError:
+        return DEFAULT_TIMEOUT
+
+
+def _timeout():
+    import httpx
+
+    return httpx.Timeout(request_timeout(), connect=CONNECT_TIMEOUT)
+
+
+def _limits():
+    import httpx
+
+    connections = max_connections()
+    return httpx.Limits(
+        max_connections=connections,
+        max_keepalive_connections=connections,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def client_args() -> dict:
+    """Return ``httpx.Client`` arguments for SDKs that build their own client."""
+    return {"limits": _limits(), "http2": HTTP2_AVAILABLE}
+
+
+def get_http_client():
+    """Return the process-wide ``httpx.Client`` shared by provider clients.
+
+    Every OpenAI-compatible client uses it, so connections to a provider are
+    kept alive and reused across models and ``LLM`` instances. The pool size
+    and ``HTTP_TIMEOUT`` are read when the client is first created. Redirects
+    are followed, as with the SDK's own client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import httpx
+
+            _client = httpx.Client(
+                **client_args(), timeout=_timeout(), follow_redirects=True
+            )
+            logger(
+                f"http: shared client with {max_connections()} connections"
+                f"{', HTTP/2' if HTTP2_AVAILABLE else ''}, {request_timeout():g}s timeout"
+            )
+        return _client
+
+
+def warm_up(base_url: str, connections: int = 2) -> int:
+    """Open connections to ``base_url`` ahead of the first request.
+
+    Any HTTP response counts, including errors, since only the DNS lookup,
+    TCP connection and TLS handshake are of interest.
+
+    Args:
+        base_url: URL of the provider API.
+        connections: Number of connections to open in parallel. HTTP/2
+            multiplexes requests over one connection, so one is opened then.
+
+    Returns:
+        The number of connections that were opened.
+    """
+    client = get_http_client()
+    if HTTP2_AVAILABLE:
+        connections = 1
+    connections = min(connections, max_connections())
+
+    def ping(_) -> bool:
+        try:
+            client.head(base_url, timeout=WARMUP_TIMEOUT)
+            return True
+        except Exception as e:
+            logger(f"http: warm-up of {base_url} failed: {e}")
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        opened = sum(executor.map(ping, range(connections)))
+    if opened:
+        logger(
+            f"http: opened {opened} connection(s) to {base_url} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+    return opened
+
+
+def provider_urls() -> list[str]:
+    """Return the base URLs of the configured providers that use the shared client."""
+    urls = []
+    if (getattr(config, "LLM_PROVIDER", "") or "openai").lower() == "openai":
+        urls.append(getattr(config, "BASE_URL", "") or OPENAI_BASE_URL)
+    if (
+        getattr(config, "BACKUP_MODEL", "")
+        and (getattr(config, "BACKUP_LLM_PROVIDER", "") or "openai").lower() == "openai"
+    ):
+        urls.append(
+            getattr(config, "BACKUP_BASE_URL", "")
+            or getattr(config, "BASE_URL", "")
+            or OPENAI_BASE_URL
+        )
+    return list(dict.fromkeys(urls))
@@ -0,0 +1,89 @@
+import subprocess
+import sys
+
+import config
+
+# Modules imported by web.py when the application starts.
+STARTUP_MODULES = [
+    "streamlit",
+    "config",
+    "utils",
+    "component_manager",
+    "artifact_manager",
+    "job_queue",
+]
+
+PROVIDER_MODULES = {
+    "openai": "langchain_openai",
+    "anthropic": "langchain_anthropic",
+    "google": "langchain_google_genai",
+}
+
+
+def _parse_importtime(output: str) -> list[dict]:
+    """Parse the stderr of ``python -X importtime`` into rows."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append(
+                {
+                    "module": name.strip(),
+                    "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                    "self_ms": int(self_us) / 1000,
+                    "cumulative_ms": int(cumulative_us) / 1000,
+                }
+            )
+        except ValueError:
+            # Header line or unexpected format
+            continue
+    return rows
+
+
+def profile_imports(modules: list[str], top: int = 20) -> dict:
+    """Measure the import cost of ``modules`` in a fresh interpreter.
+
+    Args:
+        modules: Module names imported in the given order.
+        top: Number of most expensive modules to return.
+
+    Returns:
+        dict: ``total_ms`` for the requested imports, ``roots`` with the
+        cumulative time of each top-level import and ``top`` with the modules
+        that took the longest on their own.
+    """
+    code = "\n".join(f"import {name}" for name in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    rows = _parse_importtime(proc.stderr)
+    roots = [row for row in rows if row["depth"] == 0]
+    return {
+        "total_ms": sum(
+            row["cumulative_ms"] for row in roots if row["module"] in modules
+        ),
+        "roots": sorted(roots, key=lambda r: r["cumulative_ms"], reverse=True),
+        "top": sorted(rows, key=lambda r: r["self_ms"], reverse=True)[:top],
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+    }
+
+
+def startup_report(top: int = 20) -> dict:
+    """Profile the application's startup imports plus the configured SDK."""
+    provider = (getattr(config, "LLM_PROVIDER", "") or "openai").lower()
+    modules = STARTUP_MODULES + [PROVIDER_MODULES.get(provider, "langchain_openai")]
+    return profile_imports(modules, top)
+
+
+if __name__ == "__main__":
+    report = startup_report()
+    print(f"Total: {report['total_ms']:.0f} ms")
+    for row in report["roots"]:
+        print(f"{row['cumulative_ms']:10.1f} ms  {row['module']}")
+    print("\nSlowest modules (self time):")
+    for row in report["top"]:
+        print(f"{row['self_ms']:10.1f} ms  {row['module']}")
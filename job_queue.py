@@ -0,0 +1,177 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import artifact_manager
+import config
+from log_writer import logger
+
+artifact_manager.register_artifact_type("text")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Finished jobs kept for the Jobs page before the oldest ones are dropped.
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    """A unit of background work and its bookkeeping."""
+
+    def __init__(self, component: str, description: str, fn, args, kwargs) -> None:
+        self.id = uuid.uuid4().hex
+        self.component = component
+        self.description = description
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.error: str | None = None
+        self.submitted_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    @property
+    def wait_time(self) -> float | None:
+        """Seconds spent in the queue before a worker picked the job up."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    @property
+    def run_time(self) -> float | None:
+        """Seconds spent executing, measured up to now for running jobs."""
+        if self.started_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+
+class JobQueue:
+    """Thread pool running jobs independently of Streamlit reruns."""
+
+    def __init__(self, workers: int | None = None) -> None:
+        if workers is None:
+            try:
+                workers = int(getattr(config, "JOB_WORKERS", "") or 2)
+            except ValueError:
+                workers = 2
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="job"
+        )
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, component: str, description: str, fn, *args, **kwargs) -> Job:
+        """Queue ``fn(*args, **kwargs)`` and return the created job."""
+        job = Job(component, description, fn, args, kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        logger(f"jobs: queued {job.id} ({component}: {description})")
+        return job
+
+    def _run(self, job: Job) -> None:
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            job.result = job.fn(*job.args, **job.kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+            logger(f"jobs: {job.id} failed: {job.error}")
+        finally:
+            job.finished_at = time.time()
+            # Drop references to the callable and its arguments once finished.
+            job.fn = None
+            job.args = ()
+            job.kwargs = {}
+        logger(f"jobs: {job.id} {job.status} in {job.run_time:.2f}s")
+
+    def _prune(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.finished]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list[Job]:
+        """Return all known jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def remove(self, job_id: str) -> None:
+        """Forget a finished job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.finished:
+                del self._jobs[job_id]
+
+    def submit_ask(
+        self, component: str, llm, system_prompt: str, user_prompt: str, **kwargs
+    ) -> Job:
+        """Run :meth:`utils.LLM.ask` in the background."""
+        return self.submit(
+            component, user_prompt[:80], llm.ask, system_prompt, user_prompt, **kwargs
+        )
+
+    def submit_conversation(
+        self, component: str, conversation, user_prompt: str, **kwargs
+    ) -> Job:
+        """Send a message on a conversation in the background.
+
+        The reply is appended to the conversation when the job finishes, even if
+        the page that submitted it is no longer displayed.
+        """
+        return self.submit(
+            component, user_prompt[:80], conversation.send, user_prompt, **kwargs
+        )
+
+
+def save_job_artifact(job: Job, remark: str | None = None) -> str:
+    """Store the result of a finished job as a text artifact."""
+    if job.status != DONE:
+        raise ValueError(f"Job {job.id} has not finished successfully")
+    with tempfile.NamedTemporaryFile(
+        "w", delete=False, suffix=".txt", encoding="utf-8"
+    ) as f:
+        f.write(str(job.result))
+        temp_path = f.name
+    try:
+        return artifact_manager.write_artifact(
+            job.component,
+            temp_path,
+            remark or job.description,
+            "text",
+        )
+    finally:
+        os.remove(temp_path)
+
+
+_queue: JobQueue | None = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue, creating it on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,50 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.Collections;
+import java.util.HashMap;
+import java.util.Map;
+
+import org.benf.cfr.reader.api.CfrDriver;
+
+/**
+ * Long-running CFR process driven by decompiler.py.
+ *
+ * Reads one request per line from stdin, {@code <input>\t<outputdir>\t<jarfilter>},
+ * decompiles {@code input} into {@code outputdir} and answers {@code OK} or
+ * {@code ERR <message>} on stdout. An empty jar filter decompiles every class.
+ * CFR's own console output is redirected to stderr so it cannot corrupt the
+ * protocol. Run with {@code java -cp cfr-0.152.jar CfrWorker.java}.
+ */
+public class CfrWorker {
+    public static void main(String[] args) throws Exception {
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        System.setOut(System.err);
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        out.println("READY");
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            String[] parts = line.split("\t", -1);
+            try {
+                Map<String, String> options = new HashMap<>();
+                options.put("outputdir", parts[1]);
+                options.put("silent", "true");
+                if (parts.length > 2 && !parts[2].isEmpty()) {
+                    options.put("jarfilter", parts[2]);
+                }
+                CfrDriver driver = new CfrDriver.Builder().withOptions(options).build();
+                driver.analyse(Collections.singletonList(parts[0]));
+                out.println("OK");
+            } catch (Throwable e) {
+                out.println("ERR " + String.valueOf(e).replace('\n', ' ').replace('\r', ' '));
+            }
+        }
+    }
+}
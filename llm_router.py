@@ -0,0 +1,427 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import config
+import profiling
+import usage_ledger
+import utils
+from log_writer import logger
+
+# HTTP statuses that say nothing about the request itself, so another target
+# may well succeed where this one failed.
+FAILOVER_STATUSES = {401, 403, 404, 408, 409, 429}
+
+
+def is_provider_error(error: Exception) -> bool:
+    """Return whether ``error`` was caused by the provider rather than the request.
+
+    Connection problems, timeouts, rate limits, authentication failures and
+    server errors are provider errors. Invalid arguments, missing image files
+    and rejected prompts are not, since every target would fail the same way.
+    """
+    if isinstance(error, usage_ledger.BudgetExceededError):
+        return False
+    if isinstance(error, (ValueError, TypeError, KeyError, OSError)) and not isinstance(
+        error, (ConnectionError, TimeoutError)
+    ):
+        return False
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status in FAILOVER_STATUSES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    name = type(error).__name__.lower()
+    text = str(error).lower()
+    return any(
+        word in name or word in text
+        for word in (
+            "connect", "timeout", "timed out", "rate limit", "overloaded", "unavailable", "api key"
+        )
+    )
+
+
+class TargetStats:
+    """Rolling latency and error statistics of one target."""
+
+    def __init__(self, window: int = 50) -> None:
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def percentile(self, pct: float) -> float | None:
+        """Latency percentile of recent successful calls, ``None`` without data."""
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        index = max(0, math.ceil(pct * len(samples)) - 1)
+        return samples[index]
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def as_dict(self) -> dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "calls": len(self.outcomes),
+            "error_rate": round(self.error_rate, 3),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "healthy": self.healthy,
+        }
+
+
+class Target:
+    """A provider/model pair the router can send requests to."""
+
+    def __init__(self, llm: utils.LLM, window: int = 50) -> None:
+        self.llm = llm
+        self.stats = TargetStats(window)
+
+    @property
+    def name(self) -> str:
+        return f"{self.llm.provider}:{self.llm.model_name}"
+
+    @property
+    def key(self) -> tuple:
+        return (self.llm.provider, self.llm.base_url, self.llm.model_name)
+
+
+class LLMRouter:
+    """Send each request to the fastest healthy target of an ordered pool.
+
+    The router can be used wherever an :class:`utils.LLM` is expected,
+    including as the model of a :class:`utils.Conversation`.
+
+    Targets are ranked by their recent median latency. Targets without
+    measurements rank first, in pool order, so that every target, including a
+    backup that may turn out faster, is measured with one call. A target that
+    only failed so far is tried again once its cooldown is over.
+    A provider error moves the call on to the next target, and a target that
+    keeps failing is skipped for ``cooldown`` seconds.
+
+    With ``hedge`` enabled a non-streaming call that takes longer than the
+    target's ``hedge_percentile`` latency is duplicated to the next target and
+    the first reply wins. The slower request cannot be cancelled and runs to
+    completion in the background.
+
+    Args:
+        llms: Targets in order of preference.
+        hedge: Whether to send hedged duplicate requests.
+        hedge_percentile: Latency percentile after which to hedge.
+        hedge_min_samples: Measurements required before hedging a target.
+        window: Number of recent calls the statistics are based on.
+        failure_threshold: Consecutive failures that put a target on cooldown.
+        max_error_rate: Error rate over the window that puts a target on cooldown.
+        cooldown: Seconds an unhealthy target is skipped.
+    """
+
+    def __init__(
+        self,
+        llms: list[utils.LLM],
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 10,
+        window: int = 50,
+        failure_threshold: int = 3,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0,
+    ) -> None:
+        if not llms:
+            raise ValueError("LLMRouter needs at least one target")
+        self.window = window
+        self.targets = [Target(llm, window) for llm in llms]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._factory = None
+        self._config_version = config.CONFIG_VERSION
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-hedge")
+
+    @classmethod
+    def from_config(cls, component: str = "", **kwargs) -> "LLMRouter":
+        """Build a router over ``GENERATION_MODEL``, ``FIXING_MODEL`` and ``BACKUP_MODEL``.
+
+        The pool is rebuilt when the configuration changes; statistics of
+        targets that stay in the pool are kept. ``hedge`` defaults to the
+        ``ROUTER_HEDGING`` setting. Other keyword arguments are passed to
+        :class:`LLMRouter`.
+
+        Args:
+            component: Name the usage ledger attributes the calls to.
+        """
+        kwargs.setdefault("hedge", getattr(config, "ROUTER_HEDGING", "false") == "true")
+        router = cls(_config_llms(component), **kwargs)
+        router._factory = lambda: _config_llms(component)
+        return router
+
+    @property
+    def model_name(self) -> str:
+        """Model of the currently preferred target."""
+        return self._ranked()[0].llm.model_name
+
+    @property
+    def provider(self) -> str:
+        return self._ranked()[0].llm.provider
+
+    def stats(self) -> dict[str, dict]:
+        """Return the statistics of every target."""
+        return {t.name: t.stats.as_dict() for t in self.targets}
+
+    def create_conversation(self, system_prompt: str, **kwargs) -> "utils.Conversation":
+        """Return a :class:`utils.Conversation` routed through this router."""
+        return utils.Conversation(self, system_prompt, **kwargs)
+
+    def _refresh(self) -> None:
+        if self._factory is None or self._config_version == config.CONFIG_VERSION:
+            return
+        with self._lock:
+            if self._config_version == config.CONFIG_VERSION:
+                return
+            previous = {t.key: t for t in self.targets}
+            targets = []
+            for llm in self._factory():
+                target = Target(llm, self.window)
+                if target.key in previous:
+                    target.stats = previous[target.key].stats
+                targets.append(target)
+            self.targets = targets
+            self._config_version = config.CONFIG_VERSION
+            logger(f"router: targets {', '.join(t.name for t in targets)}")
+
+    def _ranked(self) -> list[Target]:
+        self._refresh()
+
+        def rank(item):
+            index, target = item
+            p50 = target.stats.percentile(0.5)
+            # Unmeasured targets are tried optimistically to measure them
+            return (not target.stats.healthy, p50 if p50 is not None else 0.0, index)
+
+        return [target for _, target in sorted(enumerate(self.targets), key=rank)]
+
+    def _record(self, target: Target, latency: float, error: Exception | None) -> None:
+        stats = target.stats
+        stats.record(latency, error is None)
+        if error is None:
+            return
+        if (
+            stats.consecutive_failures >= self.failure_threshold
+            or (len(stats.outcomes) >= 5 and stats.error_rate > self.max_error_rate)
+        ):
+            stats.cooldown_until = time.monotonic() + self.cooldown
+            logger(f"router: {target.name} unhealthy, skipping it for {self.cooldown:.0f}s")
+
+    def _invoke(self, target: Target, method: str, args: tuple):
+        start = time.perf_counter()
+        try:
+            result = getattr(target.llm, method)(*args)
+        except Exception as e:
+            # Only provider errors count against the target
+            if is_provider_error(e):
+                self._record(target, time.perf_counter() - start, e)
+            raise
+        self._record(target, time.perf_counter() - start, None)
+        return result
+
+    def _failover(self, targets: list[Target], method: str, args: tuple, errors: list):
+        for target in targets:
+            try:
+                return self._invoke(target, method, args)
+            except Exception as e:
+                if not is_provider_error(e):
+                    raise
+                logger(f"router: {target.name} failed, trying the next target: {e}")
+                errors.append(e)
+        raise errors[-1]
+
+    def _hedged(self, targets: list[Target], method: str, args: tuple):
+        primary = targets[0]
+        delay = None
+        if len(primary.stats.latencies) >= self.hedge_min_samples:
+            delay = primary.stats.percentile(self.hedge_percentile)
+        if delay is None or len(targets) < 2:
+            return self._failover(targets, method, args, [])
+
+        # The requests run on worker threads, which the render profiler does
+        # not see, so the wait is attributed here instead.
+        with profiling.span("llm"):
+            futures = {self._executor.submit(self._invoke, primary, method, args): primary}
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                backup = targets[1]
+                logger(f"router: hedging {primary.name} with {backup.name} after {delay:.2f}s")
+                futures[self._executor.submit(self._invoke, backup, method, args)] = backup
+
+            errors = []
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        if not is_provider_error(e):
+                            raise
+                        logger(f"router: {futures[future].name} failed: {e}")
+                        errors.append(e)
+        return self._failover(targets[len(futures):], method, args, errors)
+
+    def _call(self, method: str, *args):
+        targets = self._ranked()
+        if self.hedge:
+            return self._hedged(targets, method, args)
+        return self._failover(targets, method, args, [])
+
+    def _stream(self, method: str, *args):
+        # Failing over is only possible until the first chunk has been passed on
+        errors = []
+        for target in self._ranked():
+            start = time.perf_counter()
+            started = False
+            try:
+                for text in getattr(target.llm, method)(*args):
+                    started = True
+                    yield text
+            except Exception as e:
+                if not is_provider_error(e):
+                    raise
+                self._record(target, time.perf_counter() - start, e)
+                if started:
+                    raise
+                logger(f"router: {target.name} failed, trying the next target: {e}")
+                errors.append(e)
+                continue
+            self._record(target, time.perf_counter() - start, None)
+            return
+        raise errors[-1]
+
+    def ask(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        image_path: str | None = None,
+        model_name: str | None = None,
+    ) -> str:
+        """Same as :meth:`utils.LLM.ask`, routed to the best target.
+
+        ``model_name`` overrides the model of whichever target is chosen.
+        """
+        return self._call("ask", system_prompt, user_prompt, image_path, model_name)
+
+    def invoke_tools(
+        self,
+        messages: list,
+        tools: list[dict],
+        model_name: str | None = None,
+        conversation_id: str | None = None,
+        prompt: str | None = None,
+    ):
+        """Same as :meth:`utils.LLM.invoke_tools`, routed to the best target."""
+        return self._call("invoke_tools", messages, tools, model_name, conversation_id, prompt)
+
+    def ask_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema,
+        image_path: str | None = None,
+        model_name: str | None = None,
+        max_retries: int = 2,
+    ):
+        """Same as :meth:`utils.LLM.ask_json`, routed to the best target."""
+        return self._call(
+            "ask_json", system_prompt, user_prompt, schema, image_path, model_name, max_retries
+        )
+
+    def ask_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        image_path: str | None = None,
+        model_name: str | None = None,
+    ):
+        """Same as :meth:`utils.LLM.ask_stream`, routed to the best target."""
+        yield from self._stream("ask_stream", system_prompt, user_prompt, image_path, model_name)
+
+    def _conversation(
+        self,
+        messages: list[dict],
+        model_name: str | None = None,
+        conversation_id: str | None = None,
+        component: str | None = None,
+    ) -> str:
+        # Hedged requests may still read the history after the caller moved on
+        return self._call(
+            "_conversation", list(messages), model_name, conversation_id, component
+        )
+
+    def _conversation_stream(
+        self,
+        messages: list[dict],
+        model_name: str | None = None,
+        conversation_id: str | None = None,
+        component: str | None = None,
+    ):
+        yield from self._stream(
+            "_conversation_stream", messages, model_name, conversation_id, component
+        )
+
+
+def _config_llms(component: str = "") -> list[utils.LLM]:
+    """Return the targets configured in the Configuration Center."""
+    llms = [utils.LLM(component=component)]
+    seen = {(llms[0].provider, llms[0].base_url, llms[0].model_name)}
+
+    candidates = []
+    if getattr(config, "FIXING_MODEL", ""):
+        candidates.append((None, None, None, config.FIXING_MODEL))
+    if getattr(config, "BACKUP_MODEL", ""):
+        candidates.append(
+            (
+                config.BACKUP_LLM_PROVIDER,
+                config.BACKUP_API_KEY or None,
+                config.BACKUP_BASE_URL or None,
+                config.BACKUP_MODEL,
+            )
+        )
+    for provider, api_key, base_url, model_name in candidates:
+        try:
+            llm = utils.LLM(provider, api_key, base_url, model_name, component)
+        except Exception as e:
+            logger(f"router: skipping {provider or 'default'}:{model_name}: {e}")
+            continue
+        key = (llm.provider, llm.base_url, llm.model_name)
+        if key not in seen:
+            seen.add(key)
+            llms.append(llm)
+    return llms
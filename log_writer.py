@@ -1,6 +1,8 @@
 import os
 from datetime import datetime
 
+import profiling
+
 first_call_time = None
 
 
@@ -15,6 +17,7 @@ def get_log_filename():
     return log_filename
 
 
+@profiling.track("logger")
 def logger(text: str):
     print(text)
 
@@ -0,0 +1,170 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import inspect
+import os
+import tempfile
+import threading
+import time
+
+# Subsystems shown in the render breakdown, in display order.
+SUBSYSTEMS = ["llm", "artifacts", "logger"]
+
+# Only one cProfile can be active in a process; Python 3.12 raises otherwise
+_cprofile_lock = threading.Lock()
+
+_current: contextvars.ContextVar["RenderProfile | None"] = contextvars.ContextVar(
+    "render_profile", default=None
+)
+
+
+class RenderProfile:
+    """Time spent while rendering one page, split by subsystem.
+
+    Subsystem times are exclusive: logging done inside an LLM call counts as
+    logger time, not LLM time. Whatever is left over is the page's own code.
+    """
+
+    def __init__(self, page: str) -> None:
+        self.page = page
+        self.total = 0.0
+        self.times: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        # cProfile statistics file, if one was collected
+        self.stats_path: str | None = None
+        # [subsystem, time spent in nested subsystems] for every open call
+        self._stack: list[list] = []
+
+    def _enter(self, subsystem: str) -> None:
+        self._stack.append([subsystem, 0.0])
+
+    def _exit(self, elapsed: float, calls: int) -> None:
+        subsystem, nested = self._stack.pop()
+        self.times[subsystem] = self.times.get(subsystem, 0.0) + elapsed - nested
+        self.calls[subsystem] = self.calls.get(subsystem, 0) + calls
+        if self._stack:
+            self._stack[-1][1] += elapsed
+
+    @property
+    def own_time(self) -> float:
+        """Render time not spent in any tracked subsystem."""
+        return max(0.0, self.total - sum(self.times.values()))
+
+    def rows(self) -> list[dict]:
+        """Return the breakdown as table rows, the page's own code last."""
+        rows = []
+        for subsystem in sorted(self.times, key=lambda s: (s not in SUBSYSTEMS, s)):
+            rows.append(
+                {
+                    "subsystem": subsystem,
+                    "calls": self.calls[subsystem],
+                    "time (ms)": round(self.times[subsystem] * 1000, 1),
+                }
+            )
+        rows.append(
+            {"subsystem": "component code", "calls": 1, "time (ms)": round(self.own_time * 1000, 1)}
+        )
+        return rows
+
+
+@contextlib.contextmanager
+def span(subsystem: str, calls: int = 1):
+    """Attribute the enclosed time to ``subsystem`` if a page is being profiled.
+
+    Args:
+        subsystem: Name shown in the breakdown, e.g. ``"llm"``.
+        calls: Number of calls the block counts as.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile._enter(subsystem)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile._exit(time.perf_counter() - start, calls)
+
+
+def track(subsystem: str):
+    """Decorator attributing the time spent in a function to ``subsystem``.
+
+    For generator functions only the time spent producing each item is
+    counted, not the time the caller spends between items.
+    """
+
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                gen = fn(*args, **kwargs)
+                calls = 1
+                try:
+                    while True:
+                        with span(subsystem, calls):
+                            calls = 0
+                            try:
+                                item = next(gen)
+                            except StopIteration as stop:
+                                return stop.value
+                        yield item
+                finally:
+                    gen.close()
+
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(subsystem):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def profile_render(page: str, cprofile: bool = False):
+    """Profile the rendering of ``page``.
+
+    Yields a :class:`RenderProfile` that is filled in when the block exits.
+    With ``cprofile`` the block also runs under :mod:`cProfile` and the
+    statistics are available as ``profile.stats_path`` afterwards. While
+    another render holds the profiler only the subsystem times are collected
+    and ``stats_path`` stays ``None``.
+
+    Args:
+        page: Name of the page being rendered.
+        cprofile: Whether to collect a full cProfile of the block.
+    """
+    profile = RenderProfile(page)
+    locked = cprofile and _cprofile_lock.acquire(blocking=False)
+    profiler = cProfile.Profile() if locked else None
+    token = _current.set(profile)
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another tool, e.g. a debugger, owns the profiling hooks
+                profiler = None
+        yield profile
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if locked:
+            _cprofile_lock.release()
+        profile.total = time.perf_counter() - start
+        _current.reset(token)
+    # Not reached when the page stops early, e.g. through st.rerun()
+    if profiler is not None:
+        fd, path = tempfile.mkstemp(suffix=".prof")
+        os.close(fd)
+        profiler.dump_stats(path)
+        profile.stats_path = path
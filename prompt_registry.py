@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import config
+from log_writer import logger
+
+# Placeholders are written as %NAME% so that prompts may contain code with
+# literal braces.
+PLACEHOLDER_RE = re.compile(r"%([A-Z][A-Z0-9_]*)%")
+
+_encoders: dict[str, object] = {}
+_encoders_lock = threading.Lock()
+
+
+def _get_encoder(model: str):
+    """Return a tiktoken encoder for ``model`` or ``None`` if unavailable."""
+    with _encoders_lock:
+        if model in _encoders:
+            return _encoders[model]
+        try:
+            import tiktoken
+        except ImportError:
+            encoder = None
+        else:
+            # Provider prefixes such as "openai/gpt-4o" are not known to tiktoken
+            try:
+                try:
+                    encoder = tiktoken.encoding_for_model(model.split("/")[-1])
+                except KeyError:
+                    encoder = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # Encodings are downloaded on first use and may be unavailable
+                logger(f"prompts: tiktoken unavailable for {model}, estimating tokens: {e}")
+                encoder = None
+        _encoders[model] = encoder
+        return encoder
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Count the tokens of ``text`` for ``model``.
+
+    Uses ``tiktoken`` when it is installed and falls back to an estimate of
+    four characters per token otherwise.
+    """
+    encoder = _get_encoder(model)
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+class RenderedPrompt(str):
+    """Text of a rendered template that carries the template's ``ref``.
+
+    The ref is lost once the text is combined with other strings, so callers
+    read it with :func:`prompt_refs` before doing so.
+    """
+
+    def __new__(cls, text: str, ref: str) -> "RenderedPrompt":
+        rendered = super().__new__(cls, text)
+        rendered.ref = ref
+        return rendered
+
+
+def prompt_refs(*texts) -> str | None:
+    """Return the refs of the rendered templates among ``texts``, comma-separated."""
+    refs = []
+    for text in texts:
+        ref = getattr(text, "ref", None)
+        if ref and ref not in refs:
+            refs.append(ref)
+    return ",".join(refs) or None
+
+
+class PromptTemplate:
+    """A prompt compiled once into literal segments and placeholders."""
+
+    def __init__(self, name: str, text: str, placeholders: list[str] | None = None) -> None:
+        self.name = name
+        self.text = text
+        parts = PLACEHOLDER_RE.split(text)
+        self._literals = parts[0::2]
+        self._names = parts[1::2]
+        self.placeholders = sorted(set(self._names))
+        if placeholders is not None:
+            missing = set(placeholders) - set(self.placeholders)
+            unexpected = set(self.placeholders) - set(placeholders)
+            if missing or unexpected:
+                raise ValueError(
+                    f"Prompt {name}: missing placeholders {sorted(missing)}, "
+                    f"unexpected placeholders {sorted(unexpected)}"
+                )
+        self.static_text = "".join(self._literals)
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        self._static_tokens: dict[str, int] = {}
+
+    @property
+    def ref(self) -> str:
+        """Identifier of this exact template text, e.g. ``USR_GEN@1a2b3c4d5e6f``."""
+        return f"{self.name}@{self.version}"
+
+    def render(self, **values) -> RenderedPrompt:
+        """Fill in the placeholders.
+
+        The returned string remembers :attr:`ref`, which the LLM client records
+        with the usage and logs of the calls it is sent in.
+
+        Raises:
+            KeyError: If a placeholder has no value.
+        """
+        missing = [name for name in self.placeholders if name not in values]
+        if missing:
+            raise KeyError(f"Prompt {self.name}: missing values for {missing}")
+        out = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            out.append(str(values[name]))
+            out.append(literal)
+        return RenderedPrompt("".join(out), self.ref)
+
+    def static_tokens(self, model: str) -> int:
+        """Tokens of the template without its placeholders, cached per model."""
+        count = self._static_tokens.get(model)
+        if count is None:
+            count = count_tokens(self.static_text, model)
+            self._static_tokens[model] = count
+        return count
+
+    def estimate_tokens(self, model: str, **values) -> int:
+        """Estimate the tokens of the rendered prompt.
+
+        Only the substituted values are counted; the static part comes from the
+        cache. Tokens merging across segment boundaries make this approximate.
+        """
+        return self.static_tokens(model) + sum(
+            count_tokens(str(values.get(name, "")), model) for name in self._names
+        )
+
+    def fits(self, model: str, budget: int, **values) -> bool:
+        """Return whether the rendered prompt stays within ``budget`` tokens."""
+        return self.estimate_tokens(model, **values) <= budget
+
+
+class PromptRegistry:
+    """Templates from ``prompts.json`` plus prompts registered in code.
+
+    The registry reloads when ``prompts.json`` or ``config.CONFIG_VERSION``
+    changes and recompiles only the templates whose text changed, so cached
+    token counts survive reloads.
+
+    Entries in ``prompts.json`` are a string, a list of lines, or an object
+    ``{"text": ..., "placeholders": [...]}`` declaring the placeholders of a
+    prompt that is not registered in code.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path or config.PROMPTS_FILE
+        self._registered: dict[str, tuple[str, list[str] | None]] = {}
+        self._templates: dict[str, PromptTemplate] = {}
+        self._config_version: int | None = None
+        # prompts.json is watched directly: config only reloads its own keys
+        self._file_mtime: int | None = None
+        self._lock = threading.Lock()
+
+    def _read_file(self) -> dict[str, tuple[str, list[str] | None]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            logger(f"prompts: failed to parse {self.path}: {e}")
+            return {}
+        if not isinstance(data, dict):
+            logger(f"prompts: {self.path} must contain a JSON object")
+            return {}
+        prompts = {}
+        for name, value in data.items():
+            placeholders = None
+            if isinstance(value, dict):
+                placeholders = value.get("placeholders")
+                value = value.get("text")
+                if placeholders is not None and not (
+                    isinstance(placeholders, list) and all(isinstance(p, str) for p in placeholders)
+                ):
+                    logger(f"prompts: ignoring {name}, placeholders must be a list of strings")
+                    continue
+            if isinstance(value, list) and all(isinstance(v, str) for v in value):
+                value = "\n".join(value)
+            if not isinstance(value, str):
+                logger(f"prompts: ignoring {name}, expected a string or list of strings")
+                continue
+            prompts[name] = (value, placeholders)
+        return prompts
+
+    def _compile(self, name: str, text: str, placeholders: list[str] | None):
+        current = self._templates.get(name)
+        if current is not None and current.text == text:
+            return current
+        return PromptTemplate(name, text, placeholders)
+
+    def _refresh(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self._config_version == config.CONFIG_VERSION and self._file_mtime == mtime:
+            return
+        sources = dict(self._registered)
+        for name, (text, placeholders) in self._read_file().items():
+            registered = self._registered.get(name)
+            if registered is not None and registered[1] is not None:
+                # Code declares what the component will fill in
+                placeholders = registered[1]
+            sources[name] = (text, placeholders)
+        templates = {}
+        for name, (text, placeholders) in sources.items():
+            try:
+                templates[name] = self._compile(name, text, placeholders)
+            except ValueError as e:
+                logger(f"prompts: {e}")
+                if name in self._registered:
+                    templates[name] = self._compile(name, *self._registered[name])
+        self._templates = templates
+        self._config_version = config.CONFIG_VERSION
+        self._file_mtime = mtime
+
+    def register(
+        self, name: str, text: str, placeholders: list[str] | None = None
+    ) -> PromptTemplate:
+        """Register a default prompt; an entry in ``prompts.json`` overrides it.
+
+        Args:
+            name: Prompt name, e.g. ``"MY_COMPONENT_SYS"``.
+            text: Template text using ``%NAME%`` placeholders.
+            placeholders: Expected placeholder names. Templates that do not
+                use exactly these are rejected when loaded.
+        """
+        # Compile eagerly so that invalid templates fail at registration
+        PromptTemplate(name, text, placeholders)
+        with self._lock:
+            self._registered[name] = (text, placeholders)
+            self._config_version = None
+        return self.get(name)
+
+    def get(self, name: str) -> PromptTemplate:
+        with self._lock:
+            self._refresh()
+            template = self._templates.get(name)
+        if template is None:
+            raise KeyError(f"Unknown prompt: {name}")
+        return template
+
+    def render(self, name: str, **values) -> RenderedPrompt:
+        return self.get(name).render(**values)
+
+    def versions(self) -> dict[str, str]:
+        """Return the current version of every template."""
+        with self._lock:
+            self._refresh()
+            return {name: t.version for name, t in self._templates.items()}
+
+
+_registry: PromptRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> PromptRegistry:
+    """Return the process-wide prompt registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
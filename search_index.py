@@ -0,0 +1,328 @@
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+from log_writer import logger
+
+INDEX_PATH = os.path.join("data", "search.db")
+
+ARTIFACT = "artifact"
+MESSAGE = "message"
+
+# Text read from one artifact; the rest of a large file is not searchable
+MAX_TEXT_BYTES = 1 << 20
+
+# Documents written in one transaction while rebuilding
+REBUILD_BATCH_SIZE = 500
+
+# bm25 weights of the title, remark, body, component and type columns
+_WEIGHTS = (4.0, 3.0, 1.0, 2.0, 2.0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    ref TEXT NOT NULL UNIQUE,
+    parent TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_parent ON documents (parent);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title, remark, body, component, type, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _read_text(path: str) -> str:
+    """Return the searchable text of a file, or ``""`` for binary files.
+
+    Zip archives contribute the names and text of their members.
+    """
+    if zipfile.is_zipfile(path):
+        parts, remaining = [], MAX_TEXT_BYTES
+        try:
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    parts.append(info.filename)
+                    if info.is_dir() or remaining <= 0:
+                        continue
+                    with archive.open(info) as f:
+                        data = f.read(remaining)
+                    if b"\0" not in data:
+                        parts.append(data.decode("utf-8", errors="ignore"))
+                        remaining -= len(data)
+        except (OSError, zipfile.BadZipFile) as e:
+            logger(f"search: cannot read {path}: {e}")
+        return "\n".join(parts)
+    with open(path, "rb") as f:
+        data = f.read(MAX_TEXT_BYTES)
+    if b"\0" in data:
+        return ""
+    return data.decode("utf-8", errors="ignore")
+
+
+def to_match_query(text: str) -> str:
+    """Turn user input into an FTS5 query matching documents with every word.
+
+    Words are quoted so that punctuation and FTS5 operators in the input are
+    searched for literally, and the last word also matches as a prefix.
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """Incrementally maintained full-text index of artifacts and messages.
+
+    Documents are ranked with bm25, so the title and remark of an artifact
+    weigh more than its content.
+    """
+
+    def __init__(self, path: str = INDEX_PATH) -> None:
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # True if the index was just created and still needs a backfill
+        self.created = not os.path.exists(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _put(
+        self,
+        kind: str,
+        ref: str,
+        parent: str | None,
+        created_at: float,
+        title: str,
+        remark: str,
+        body: str,
+        component: str,
+        doc_type: str,
+    ) -> None:
+        self._put_many([(kind, ref, parent, created_at, title, remark, body, component, doc_type)])
+
+    def _put_many(self, documents: list[tuple]) -> None:
+        """Insert or replace documents, given as the arguments of :meth:`_put`, in one transaction."""
+        if not documents:
+            return
+        with self._lock, self._conn:
+            for kind, ref, parent, created_at, title, remark, body, component, doc_type in documents:
+                row = self._conn.execute(
+                    "SELECT id FROM documents WHERE ref = ?", (ref,)
+                ).fetchone()
+                if row is None:
+                    doc_id = self._conn.execute(
+                        "INSERT INTO documents (kind, ref, parent, created_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (kind, ref, parent, created_at),
+                    ).lastrowid
+                else:
+                    doc_id = row[0]
+                    self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+                self._conn.execute(
+                    "INSERT INTO documents_fts (rowid, title, remark, body, component, type) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, title, remark, body, component, doc_type),
+                )
+
+    def add_artifact(self, meta: dict, path: str, created_at: float | None = None) -> None:
+        """Index an artifact given its metadata record and stored file."""
+        self._put(*self._artifact_document(meta, path, created_at))
+
+    @staticmethod
+    def _artifact_document(meta: dict, path: str, created_at: float | None) -> tuple:
+        file_name = meta["file"]
+        # Stored names are "<uuid>_<original name>"
+        title = file_name.split("_", 1)[-1]
+        if created_at is None:
+            created_at = time.time()
+        return (
+            ARTIFACT,
+            file_name,
+            None,
+            created_at,
+            title,
+            meta.get("remark") or "",
+            _read_text(path),
+            meta.get("component") or "",
+            meta.get("type") or "",
+        )
+
+    def add_message(
+        self,
+        conv_id: str,
+        seq: int,
+        role: str,
+        content: str,
+        component: str = "",
+        created_at: float | None = None,
+    ) -> None:
+        """Index a conversation message."""
+        self._put(*self._message_document(conv_id, seq, role, content, component, created_at))
+
+    @staticmethod
+    def _message_document(
+        conv_id: str,
+        seq: int,
+        role: str,
+        content: str,
+        component: str,
+        created_at: float | None,
+    ) -> tuple:
+        return (
+            MESSAGE,
+            f"{conv_id}:{seq}",
+            conv_id,
+            time.time() if created_at is None else created_at,
+            "",
+            "",
+            content,
+            component,
+            role,
+        )
+
+    def remove(self, ref: str) -> None:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM documents WHERE ref = ?", (ref,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (row[0],))
+                self._conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+
+    def remove_conversation(self, conv_id: str) -> None:
+        """Drop every indexed message of a conversation."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM documents_fts WHERE rowid IN "
+                "(SELECT id FROM documents WHERE parent = ?)",
+                (conv_id,),
+            )
+            self._conn.execute("DELETE FROM documents WHERE parent = ?", (conv_id,))
+
+    def search(
+        self,
+        query: str,
+        kind: str | None = None,
+        component: str | None = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> list[dict]:
+        """Return the documents matching ``query``, best match first.
+
+        Args:
+            query: Words to search for, as typed by the user.
+            kind: Only return ``"artifact"`` or ``"message"`` documents.
+            component: Only return documents of this component.
+            limit: Maximum number of results.
+            offset: Number of results to skip, for pagination.
+
+        Returns:
+            Dictionaries with ``kind``, ``ref`` (artifact file name or
+            ``<conversation id>:<seq>``), ``parent`` (conversation id),
+            ``title``, ``remark``, ``component``, ``type``, ``created_at``,
+            ``snippet`` with matches wrapped in ``**`` and ``score``.
+        """
+        match = to_match_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT d.kind, d.ref, d.parent, d.created_at, f.title, f.remark, "
+            "f.component, f.type, "
+            "snippet(documents_fts, 2, '**', '**', '…', 16) AS snippet, "
+            f"bm25(documents_fts, {', '.join(map(str, _WEIGHTS))}) AS score "
+            "FROM documents_fts AS f JOIN documents AS d ON d.id = f.rowid "
+            "WHERE documents_fts MATCH ?"
+        )
+        params: list = [match]
+        if kind is not None:
+            sql += " AND d.kind = ?"
+            params.append(kind)
+        if component is not None:
+            sql += " AND f.component = ?"
+            params.append(component)
+        sql += " ORDER BY score LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def rebuild(self, artifacts_dir: str | None = None, store=None) -> int:
+        """Re-index every stored artifact and conversation message.
+
+        Args:
+            artifacts_dir: Directory of the artifacts, ``artifact_manager``'s
+                by default.
+            store: Conversation store to index, the process-wide one by default.
+
+        Returns:
+            The number of indexed documents.
+        """
+        import artifact_manager
+        import conversation_store
+
+        if store is None:
+            store = conversation_store.get_store()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM documents_fts")
+
+        start = time.perf_counter()
+        batch = []
+
+        def put(document: tuple) -> None:
+            batch.append(document)
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                self._put_many(batch)
+                batch.clear()
+
+        for meta in artifact_manager.list_artifacts():
+            path = os.path.join(artifacts_dir or artifact_manager.ARTIFACTS_DIR, meta["file"])
+            try:
+                put(self._artifact_document(meta, path, os.path.getmtime(path)))
+            except OSError as e:
+                logger(f"search: cannot index {meta['file']}: {e}")
+
+        for conv in store.iter_conversations():
+            for message in store.iter_messages(conv["id"]):
+                put(
+                    self._message_document(
+                        conv["id"],
+                        message["seq"],
+                        message["role"],
+                        message["content"],
+                        conv["component"],
+                        message["created_at"],
+                    )
+                )
+        self._put_many(batch)
+
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+        self.created = False
+        count = self.count()
+        logger(f"search: indexed {count} documents in {time.perf_counter() - start:.2f}s")
+        return count
+
+
+_index: SearchIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SearchIndex:
+    """Return the process-wide search index, opening it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
@@ -0,0 +1,159 @@
+import threading
+
+
+class _Call:
+    """An in-flight call and the outcome shared with every caller."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class _Stream:
+    """An in-flight stream, its chunks so far and its subscribers."""
+
+    def __init__(self, iterator) -> None:
+        self.iterator = iterator
+        self.chunks: list = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.pulling = False
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is running wait for it and receive the same result or exception. Once the
+    call finishes the key is forgotten, so results are never cached.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, _Stream] = {}
+        self._lock = threading.Lock()
+        # Number of calls and subscriptions that joined one already in flight
+        self.coalesced = 0
+
+    def do(self, key: str, fn):
+        """Return ``fn()``, sharing the call with concurrent callers of ``key``.
+
+        Args:
+            key: Identifies calls that are interchangeable.
+            fn: Function to call if no call for ``key`` is in flight.
+
+        Raises:
+            Exception: Whatever ``fn`` raised, in every waiting caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stream(self, key: str, fn):
+        """Yield the items of ``fn()``, sharing the iterator with concurrent subscribers.
+
+        Subscribers joining late first receive the items produced so far. The
+        iterator is advanced by whichever subscriber needs the next item
+        first, so a slow or abandoned subscriber does not hold up the others.
+        The upstream iterator is closed when every subscriber has gone away.
+        """
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = _Stream(iter(fn()))
+                self._streams[key] = stream
+            else:
+                self.coalesced += 1
+            with stream.cond:
+                stream.subscribers += 1
+        return self._subscribe(key, stream)
+
+    def _subscribe(self, key: str, stream: _Stream):
+        index = 0
+        try:
+            while True:
+                pull = False
+                with stream.cond:
+                    while index >= len(stream.chunks) and not stream.done and stream.pulling:
+                        stream.cond.wait()
+                    if index < len(stream.chunks):
+                        chunk = stream.chunks[index]
+                    elif stream.done:
+                        if stream.error is not None:
+                            raise stream.error
+                        return
+                    else:
+                        stream.pulling = True
+                        pull = True
+
+                if pull:
+                    self._pull(key, stream)
+                    continue
+                index += 1
+                yield chunk
+        finally:
+            self._unsubscribe(key, stream)
+
+    def _pull(self, key: str, stream: _Stream) -> None:
+        try:
+            chunk = next(stream.iterator)
+        except StopIteration:
+            self._finish(key, stream, None)
+        except BaseException as e:
+            self._finish(key, stream, e)
+        else:
+            with stream.cond:
+                stream.chunks.append(chunk)
+                stream.pulling = False
+                stream.cond.notify_all()
+
+    def _finish(self, key: str, stream: _Stream, error: BaseException | None) -> None:
+        with self._lock:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+        with stream.cond:
+            stream.done = True
+            stream.error = error
+            stream.pulling = False
+            stream.cond.notify_all()
+
+    def _unsubscribe(self, key: str, stream: _Stream) -> None:
+        # Under the map lock so that no new subscriber can join an abandoned stream
+        with self._lock:
+            with stream.cond:
+                stream.subscribers -= 1
+                abandoned = stream.subscribers == 0 and not stream.done
+                if abandoned:
+                    stream.done = True
+                    stream.cond.notify_all()
+            if abandoned and self._streams.get(key) is stream:
+                del self._streams[key]
+        if abandoned:
+            close = getattr(stream.iterator, "close", None)
+            if close is not None:
+                close()
@@ -0,0 +1,404 @@
+import json
+import re
+
+# JSON type of a value, told by its first character
+_START_TYPES = {"{": "object", "[": "array", '"': "string", "t": "boolean", "f": "boolean", "n": "null"}
+_LITERALS = ("true", "false", "null")
+_NUMBER_CHARS = set("0123456789+-.eE")
+
+
+class StructuredOutputError(Exception):
+    """Raised when the model did not produce valid output within the retries."""
+
+
+class JSONDivergenceError(ValueError):
+    """The streamed text can no longer become a value matching the schema.
+
+    Attributes:
+        position: Offset of the offending character in the fed text.
+        valid_prefix: The longest prefix ending after a complete value that
+            the output can be continued from, or ``""``.
+    """
+
+    def __init__(self, message: str, position: int, valid_prefix: str) -> None:
+        super().__init__(f"{message} at offset {position}")
+        self.position = position
+        self.valid_prefix = valid_prefix
+
+
+class _Frame:
+    """An object or array that is still open."""
+
+    def __init__(self, kind: str, schema: dict) -> None:
+        self.kind = kind
+        self.schema = schema
+        self.state = "key_or_end" if kind == "object" else "value_or_end"
+        self.key: str | None = None
+        self.seen: set[str] = set()
+        self.count = 0
+
+
+class StreamingJSONValidator:
+    """Check JSON text against a schema while it is still being received.
+
+    Text is fed chunk by chunk; as soon as it can no longer match the schema a
+    :class:`JSONDivergenceError` is raised so the request can be aborted.
+    Leading whitespace and a Markdown code fence are skipped.
+
+    The supported schema keywords are ``type``, ``properties``, ``required``,
+    ``additionalProperties``, ``items``, ``enum``, ``const``, ``minItems``,
+    ``maxItems``, ``anyOf``/``oneOf`` and local ``$ref``. Anything else, such
+    as ``pattern``, ``format`` or ``minimum``, is left to the validation of
+    the complete value by the converter of :func:`resolve_schema`.
+    """
+
+    def __init__(self, schema: dict | None = None) -> None:
+        self.root = schema or {}
+        self._text: list[str] = []
+        self._length = 0
+        self.start: int | None = None
+        self.end: int | None = None
+        self._safe_end: int | None = None
+        self._stack: list[_Frame] = []
+        self._token: list | None = None
+        self._fence = False
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return "".join(self._text)
+
+    def value_text(self) -> str:
+        """Return the text of the complete JSON value."""
+        if not self.done:
+            raise self._diverge("Incomplete JSON", self._length)
+        return self.text[self.start : self.end]
+
+    def valid_prefix(self) -> str:
+        if self.start is None or self._safe_end is None:
+            return ""
+        return self.text[self.start : self._safe_end]
+
+    def finish(self) -> str:
+        """Signal the end of input and return the JSON text.
+
+        Raises:
+            JSONDivergenceError: If the input ended before the value did.
+        """
+        if self._token is not None and self._token[0] == "number" and not self._stack:
+            self._complete_scalar(self._length)
+        return self.value_text()
+
+    def feed(self, chunk: str) -> bool:
+        """Validate the next chunk of text and return whether the value is complete.
+
+        Raises:
+            JSONDivergenceError: If the text cannot match the schema any more.
+        """
+        offset = self._length
+        self._text.append(chunk)
+        self._length += len(chunk)
+        for i, c in enumerate(chunk, offset):
+            if self.done:
+                return True
+            self._feed_char(c, i)
+        return self.done
+
+    def _diverge(self, message: str, position: int) -> JSONDivergenceError:
+        return JSONDivergenceError(message, position, self.valid_prefix())
+
+    def _resolve(self, schema: dict) -> dict:
+        while isinstance(schema, dict):
+            if "$ref" in schema:
+                node = self.root
+                for part in schema["$ref"].lstrip("#/").split("/"):
+                    node = node.get(part, {}) if part else node
+                schema = node
+            elif "allOf" in schema and len(schema["allOf"]) == 1:
+                schema = schema["allOf"][0]
+            else:
+                return schema
+        return {}
+
+    def _types(self, schema: dict) -> set[str] | None:
+        """JSON types allowed by ``schema``, ``None`` if any type is."""
+        schema = self._resolve(schema)
+        if "type" in schema:
+            types = schema["type"]
+            return {types} if isinstance(types, str) else set(types)
+        branches = schema.get("anyOf") or schema.get("oneOf")
+        if branches:
+            types = set()
+            for branch in branches:
+                branch_types = self._types(branch)
+                if branch_types is None:
+                    return None
+                types |= branch_types
+            return types
+        values = schema.get("enum", [schema["const"]] if "const" in schema else None)
+        if values is not None:
+            return {_json_type(v) for v in values}
+        return None
+
+    def _branch(self, schema: dict, jtype: str) -> dict:
+        """Return the sub-schema a value of ``jtype`` is validated against."""
+        schema = self._resolve(schema)
+        branches = schema.get("anyOf") or schema.get("oneOf")
+        if not branches:
+            return schema
+        matches = [b for b in branches if _allows(self._types(b), jtype)]
+        # Several object or array branches cannot be told apart yet
+        return self._resolve(matches[0]) if len(matches) == 1 else {}
+
+    def _value_schema(self, frame: _Frame) -> dict:
+        if frame.kind == "array":
+            items = frame.schema.get("items", {})
+            return items if isinstance(items, dict) else {}
+        properties = frame.schema.get("properties", {})
+        if frame.key in properties:
+            return properties[frame.key]
+        extra = frame.schema.get("additionalProperties", {})
+        return extra if isinstance(extra, dict) else {}
+
+    def _feed_char(self, c: str, i: int) -> None:
+        token = self._token
+        if token is not None:
+            kind = token[0]
+            if kind == "string":
+                if token[3]:
+                    token[3] = False
+                elif c == "\\":
+                    token[3] = True
+                elif c == '"':
+                    token[1].append(c)
+                    self._complete_scalar(i + 1)
+                    return
+                elif c < " ":
+                    raise self._diverge("Control character in string", i)
+                token[1].append(c)
+                return
+            if kind == "literal":
+                token[1].append(c)
+                text = "".join(token[1])
+                if not any(lit.startswith(text) for lit in _LITERALS):
+                    raise self._diverge(f"Invalid literal {text!r}", i)
+                if text in _LITERALS:
+                    self._complete_scalar(i + 1)
+                return
+            if c in _NUMBER_CHARS:
+                token[1].append(c)
+                return
+            self._complete_scalar(i)
+            if self.done:
+                return
+
+        if self.start is None:
+            if self._fence:
+                self._fence = c != "\n"
+                return
+            if c == "`":
+                self._fence = True
+                return
+        if c in " \t\r\n":
+            return
+
+        if not self._stack:
+            if self.start is None:
+                self.start = i
+            self._begin_value(c, i, self.root)
+            return
+
+        frame = self._stack[-1]
+        state = frame.state
+        if frame.kind == "object":
+            if state in ("key_or_end", "key") and c == '"':
+                self._token = ["string", [c], None, False, True]
+            elif state == "key_or_end" and c == "}":
+                self._close(frame, i)
+            elif state == "colon" and c == ":":
+                frame.state = "value"
+            elif state == "value":
+                self._begin_value(c, i, self._value_schema(frame))
+            elif state == "comma_or_end" and c == ",":
+                frame.state = "key"
+            elif state == "comma_or_end" and c == "}":
+                self._close(frame, i)
+            else:
+                raise self._diverge(f"Unexpected {c!r} in object", i)
+        else:
+            if state in ("value_or_end", "value") and not (state == "value_or_end" and c == "]"):
+                frame.count += 1
+                max_items = frame.schema.get("maxItems")
+                if max_items is not None and frame.count > max_items:
+                    raise self._diverge(f"More than {max_items} items", i)
+                self._begin_value(c, i, self._value_schema(frame))
+            elif c == "]" and state in ("value_or_end", "comma_or_end"):
+                self._close(frame, i)
+            elif state == "comma_or_end" and c == ",":
+                frame.state = "value"
+            else:
+                raise self._diverge(f"Unexpected {c!r} in array", i)
+
+    def _begin_value(self, c: str, i: int, schema: dict) -> None:
+        jtype = _START_TYPES.get(c)
+        if jtype is None and (c == "-" or c.isdigit()):
+            jtype = "number"
+        if jtype is None:
+            raise self._diverge(f"Unexpected {c!r}", i)
+        allowed = self._types(schema)
+        if not _allows(allowed, jtype):
+            raise self._diverge(f"Expected {' or '.join(sorted(allowed))}, got {jtype}", i)
+        schema = self._branch(schema, jtype)
+        if jtype in ("object", "array"):
+            self._stack.append(_Frame(jtype, schema))
+            self._safe_end = i + 1
+        elif jtype == "string":
+            self._token = ["string", [c], schema, False, False]
+        elif jtype == "number":
+            self._token = ["number", [c], schema]
+        else:
+            self._token = ["literal", [c], schema]
+
+    def _complete_scalar(self, end: int) -> None:
+        token = self._token
+        self._token = None
+        text = "".join(token[1])
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            raise self._diverge(f"Invalid value {text}", end - len(text))
+        if token[0] == "string" and token[-1]:
+            self._complete_key(value, end)
+            return
+        schema = self._resolve(token[2] or {})
+        allowed = self._types(schema)
+        if (
+            token[0] == "number"
+            and allowed is not None
+            and "number" not in allowed
+            and not float(value).is_integer()
+        ):
+            raise self._diverge(f"Expected integer, got {text}", end - len(text))
+        if "enum" in schema and value not in schema["enum"]:
+            raise self._diverge(f"{text} is not one of {schema['enum']}", end - len(text))
+        if "const" in schema and value != schema["const"]:
+            raise self._diverge(f"Expected {schema['const']!r}, got {text}", end - len(text))
+        self._after_value(end)
+
+    def _complete_key(self, key: str, end: int) -> None:
+        frame = self._stack[-1]
+        if key in frame.seen:
+            raise self._diverge(f"Duplicate property {key!r}", end)
+        properties = frame.schema.get("properties", {})
+        if key not in properties and frame.schema.get("additionalProperties") is False:
+            raise self._diverge(f"Unexpected property {key!r}", end)
+        frame.seen.add(key)
+        frame.key = key
+        frame.state = "colon"
+
+    def _close(self, frame: _Frame, i: int) -> None:
+        if frame.kind == "object":
+            missing = [k for k in frame.schema.get("required", []) if k not in frame.seen]
+            if missing:
+                raise self._diverge(f"Missing required properties {missing}", i)
+        else:
+            min_items = frame.schema.get("minItems")
+            if min_items is not None and frame.count < min_items:
+                raise self._diverge(f"Fewer than {min_items} items", i)
+        self._stack.pop()
+        self._after_value(i + 1)
+
+    def _after_value(self, end: int) -> None:
+        if not self._stack:
+            self.end = end
+        else:
+            self._stack[-1].state = "comma_or_end"
+        self._safe_end = end
+
+
+def _json_type(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return "array" if isinstance(value, list) else "object"
+
+
+def _allows(types: set[str] | None, jtype: str) -> bool:
+    if types is None or jtype in types:
+        return True
+    return jtype == "number" and "integer" in types
+
+
+def resolve_schema(schema) -> tuple[dict, object]:
+    """Return the JSON schema for ``schema`` and a function building the result.
+
+    ``schema`` may be a JSON schema dictionary, whose results are validated
+    with :mod:`jsonschema` and returned as parsed JSON, or a type such as a
+    pydantic model or a dataclass, whose results are returned as instances of
+    that type. Either function raises a ``ValueError`` for invalid results.
+    """
+    if isinstance(schema, dict):
+        import jsonschema
+
+        validator = jsonschema.validators.validator_for(schema)(schema)
+
+        def validate(value):
+            # Covers the keywords the streaming validator does not check
+            error = jsonschema.exceptions.best_match(validator.iter_errors(value))
+            if error is not None:
+                raise ValueError(f"{error.message} at {error.json_path}")
+            return value
+
+        return schema, validate
+    from pydantic import TypeAdapter
+
+    adapter = TypeAdapter(schema)
+    return adapter.json_schema(), adapter.validate_python
+
+
+def wrap_root(schema: dict) -> tuple[dict, bool]:
+    """Return a schema with an object at the root and whether it was wrapped.
+
+    Native JSON modes such as OpenAI's only accept object schemas, so any
+    other schema becomes the ``value`` property of an object. Definitions
+    stay at the root so that ``$ref`` pointers keep resolving.
+    """
+    if schema.get("type") == "object" or ("type" not in schema and "properties" in schema):
+        return schema, False
+    inner = {k: v for k, v in schema.items() if k not in ("$defs", "definitions", "title")}
+    wrapped = {
+        "type": "object",
+        "properties": {"value": inner},
+        "required": ["value"],
+        "additionalProperties": False,
+    }
+    for key in ("$defs", "definitions", "title"):
+        if key in schema:
+            wrapped[key] = schema[key]
+    return wrapped, True
+
+
+def schema_name(schema: dict) -> str:
+    """Return a name for ``schema`` usable in provider requests."""
+    name = re.sub(r"[^a-zA-Z0-9_-]", "_", str(schema.get("title", "response")))
+    return name[:64] or "response"
+
+
+def instructions(schema: dict) -> str:
+    """Return the prompt text asking for a reply that matches ``schema``."""
+    return (
+        "\n\nReply with a single JSON value that matches this JSON schema and "
+        "nothing else, without Markdown formatting:\n"
+        + json.dumps(schema, ensure_ascii=False)
+    )
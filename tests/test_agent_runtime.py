@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+
+from agent_runtime import Agent, AgentError, Tool, tool
+
+
+class ScriptedLLM:
+    """Model stand-in that requests the given tool calls, one list per turn."""
+
+    model_name = "scripted"
+
+    def __init__(self, *turns: list[tuple[str, dict]]):
+        self.turns = list(turns)
+        self.requests = []
+
+    def invoke_tools(self, messages, tools, model_name=None, conversation_id=None, prompt=None):
+        self.requests.append(list(messages))
+        if not self.turns:
+            return AIMessage(content="done")
+        calls = self.turns.pop(0)
+        return AIMessage(
+            content="",
+            tool_calls=[
+                {"name": name, "args": args, "id": f"call_{i}"}
+                for i, (name, args) in enumerate(calls)
+            ],
+        )
+
+
+def tool_results(result) -> list[str]:
+    return [m.content for m in result.messages if isinstance(m, ToolMessage)]
+
+
+@pytest.fixture
+def agent_factory():
+    agents = []
+
+    def make(llm, tools, **kwargs):
+        agent = Agent(llm, tools, **kwargs)
+        agents.append(agent)
+        return agent
+
+    yield make
+    for agent in agents:
+        agent.close()
+
+
+def test_tool_calls_of_one_turn_overlap(agent_factory):
+    spans = {}
+
+    def wait(name: str) -> str:
+        """Wait a moment."""
+        start = time.perf_counter()
+        time.sleep(0.2)
+        spans[name] = (start, time.perf_counter())
+        return name
+
+    llm = ScriptedLLM([("wait", {"name": "a"}), ("wait", {"name": "b"})])
+    result = agent_factory(llm, [wait]).run("go")
+
+    assert result.output == "done"
+    assert tool_results(result) == ["a", "b"]
+    (a_start, a_end), (b_start, b_end) = spans["a"], spans["b"]
+    assert a_start < b_end and b_start < a_end
+    assert result.turns == 2
+
+
+def test_timeout_reports_an_error_without_waiting_for_the_tool(agent_factory):
+    release = threading.Event()
+
+    def hang() -> str:
+        """Never finish in time."""
+        release.wait(5)
+        return "late"
+
+    llm = ScriptedLLM([("hang", {})])
+    start = time.perf_counter()
+    try:
+        result = agent_factory(llm, [Tool(hang, timeout=0.1)]).run("go")
+    finally:
+        release.set()
+
+    assert time.perf_counter() - start < 1
+    assert tool_results(result) == ["Error: timed out after 0.1s"]
+    tool_step = [s for s in result.steps if s.kind == "tool"][0]
+    assert tool_step.error == "timed out after 0.1s"
+    # The model was asked again with the error
+    assert result.output == "done"
+
+
+def test_idempotent_results_are_cached(agent_factory):
+    runs = []
+
+    @tool(idempotent=True)
+    def lookup(key: str) -> dict:
+        """Look a key up."""
+        runs.append(key)
+        return {"key": key}
+
+    llm = ScriptedLLM([("lookup", {"key": "x"})], [("lookup", {"key": "x"})])
+    result = agent_factory(llm, [lookup]).run("go")
+
+    assert runs == ["x"]
+    assert tool_results(result) == ['{"key": "x"}'] * 2
+    assert [s.cached for s in result.steps if s.kind == "tool"] == [False, True]
+
+
+def test_raising_and_unknown_tools_become_error_results(agent_factory):
+    def broken() -> str:
+        """Always fail."""
+        raise ValueError("bad input")
+
+    def fine() -> str:
+        """Succeed."""
+        return "ok"
+
+    llm = ScriptedLLM([("broken", {}), ("fine", {}), ("missing", {})])
+    result = agent_factory(llm, [broken, fine]).run("go")
+
+    assert tool_results(result) == [
+        "Error: ValueError: bad input",
+        "ok",
+        "Error: unknown tool missing",
+    ]
+    assert result.output == "done"
+
+
+def test_agent_gives_up_after_max_steps(agent_factory):
+    def fine() -> str:
+        """Succeed."""
+        return "ok"
+
+    llm = ScriptedLLM(*[[("fine", {})]] * 3)
+    with pytest.raises(AgentError):
+        agent_factory(llm, [fine], max_steps=2).run("go")
@@ -0,0 +1,122 @@
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+import prompt_registry
+import usage_ledger
+import utils
+
+
+class RejectedError(Exception):
+    status_code = 400
+
+
+class FakeClient:
+    """Chat model stand-in recording bound options and streaming canned replies."""
+
+    def __init__(self, reply, native_reply=None, reject_native=False, reject_usage=False):
+        self.reply = reply
+        self.native_reply = native_reply
+        self.reject_native = reject_native
+        self.reject_usage = reject_usage
+        self.bound = []
+        self.requests = []
+
+    def bind(self, **kwargs):
+        self.bound.append(kwargs)
+        return FakeBound(self)
+
+    def stream(self, messages, native=False, **kwargs):
+        self.requests.append(kwargs)
+        if native and self.reject_native:
+            raise RejectedError("response_format is not supported")
+        if self.reject_usage and kwargs.get("stream_usage") is not False:
+            raise RejectedError("stream_options is not supported")
+        yield AIMessageChunk(content=self.native_reply if native else self.reply)
+
+
+class FakeBound:
+    def __init__(self, client):
+        self.client = client
+
+    def stream(self, messages, **kwargs):
+        return self.client.stream(messages, native=True, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def ledger(tmp_path, monkeypatch):
+    ledger = usage_ledger.UsageLedger(str(tmp_path / "usage.db"), str(tmp_path / "usage.json"))
+    monkeypatch.setattr(usage_ledger, "_ledger", ledger)
+    monkeypatch.setattr(utils, "_NATIVE_JSON_REJECTED", set())
+    monkeypatch.setattr(utils, "_STREAM_USAGE_REJECTED", set())
+
+
+def make_llm(monkeypatch, base_url, client):
+    llm = utils.LLM(provider="openai", api_key="test", base_url=base_url, model_name="model")
+    monkeypatch.setattr(llm, "_get_client", lambda model_name=None: client)
+    return llm
+
+
+def test_compatible_endpoints_use_the_prompt_only(monkeypatch):
+    client = FakeClient('["a", "b"]')
+    llm = make_llm(monkeypatch, "https://openrouter.ai/api/v1", client)
+    assert llm.ask_json("sys", "user", list[str]) == ["a", "b"]
+    assert client.bound == []
+
+
+def test_native_mode_wraps_non_object_roots(monkeypatch):
+    client = FakeClient("", native_reply='{"value": ["a"]}')
+    llm = make_llm(monkeypatch, "https://api.openai.com/v1", client)
+    assert llm.ask_json("sys", "user", list[str]) == ["a"]
+    schema = client.bound[0]["response_format"]["json_schema"]["schema"]
+    assert schema["type"] == "object"
+    assert schema["properties"]["value"] == {"type": "array", "items": {"type": "string"}}
+
+
+def test_native_mode_is_opt_in_for_listed_models(monkeypatch):
+    monkeypatch.setattr(utils.config, "NATIVE_JSON_MODE", "other, model", raising=False)
+    client = FakeClient("", native_reply='{"value": 3}')
+    llm = make_llm(monkeypatch, "http://localhost:8000/v1", client)
+    assert llm.ask_json("sys", "user", int) == 3
+    assert client.bound
+
+
+def test_rejected_native_mode_falls_back_to_the_prompt(monkeypatch):
+    client = FakeClient('["a"]', reject_native=True)
+    llm = make_llm(monkeypatch, "https://api.openai.com/v1", client)
+    assert llm.ask_json("sys", "user", list[str], max_retries=0) == ["a"]
+    # Later calls skip the rejected mode right away
+    client.bound.clear()
+    assert llm.ask_json("sys", "user", list[str], max_retries=0) == ["a"]
+    assert client.bound == []
+
+
+def test_rejected_stream_usage_is_retried_without_it(monkeypatch):
+    client = FakeClient('["a"]', reject_usage=True)
+    llm = make_llm(monkeypatch, "http://localhost:8000/v1", client)
+    assert llm.ask_json("sys", "user", list[str], max_retries=0) == ["a"]
+    assert client.requests == [{}, {"stream_usage": False}]
+    assert utils._STREAM_USAGE_REJECTED == {"http://localhost:8000/v1"}
+
+    client.requests.clear()
+    assert llm.ask_json("sys", "user", list[str], max_retries=0) == ["a"]
+    assert client.requests == [{"stream_usage": False}]
+
+
+
+def test_prompt_versions_are_recorded_with_the_usage(monkeypatch):
+    template = prompt_registry.PromptTemplate("LIST_SYS", "List %COUNT% letters.")
+    client = FakeClient('["a"]')
+    llm = make_llm(monkeypatch, "http://localhost:8000/v1", client)
+    assert llm.ask_json(template.render(COUNT=1), "user", list[str]) == ["a"]
+    records = usage_ledger.get_ledger().records()
+    assert [r["prompt"] for r in records] == [template.ref]
+    assert usage_ledger.get_ledger().summary("prompt")[0]["key"] == template.ref
+
+
+def test_keywords_checked_after_streaming_reject_the_reply(monkeypatch):
+    client = FakeClient('"abc"')
+    llm = make_llm(monkeypatch, "http://localhost:8000/v1", client)
+    schema = {"type": "string", "pattern": "^[0-9]+$"}
+    with pytest.raises(utils.structured_output.StructuredOutputError, match="does not match"):
+        llm.ask_json("sys", "user", schema, max_retries=1)
+    assert len(client.requests) == 2
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+from component_manager import ComponentManager
+
+COMPONENT = '''
+from component_base import BaseComponent
+
+
+class Greeter(BaseComponent):
+    name = "Greeter"
+    description = "{description}"
+
+
+def get_component():
+    return Greeter()
+'''
+
+
+@pytest.fixture
+def components(tmp_path, monkeypatch):
+    """A ``reload_test_components`` package importable from a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    (tmp_path / "reload_test_components").mkdir()
+    yield tmp_path / "reload_test_components"
+    for name in [m for m in sys.modules if m.startswith("reload_test_components")]:
+        del sys.modules[name]
+
+
+def _write(path, description, mtime_ns):
+    path.write_text(COMPONENT.format(description=description), encoding="utf-8")
+    # Distinct modification times so the stale bytecode is not reused
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_rediscovery_picks_up_added_and_updated_components(components):
+    manager = ComponentManager("reload_test_components", "components.json")
+    manager.discover_components()
+    assert manager.available == {}
+
+    _write(components / "greeter.py", "first", 1_000_000_000)
+    manager.discover_components()
+    assert manager.available["Greeter"].description == "first"
+
+    _write(components / "greeter.py", "second", 2_000_000_000)
+    manager.discover_components()
+    assert manager.available["Greeter"].description == "second"
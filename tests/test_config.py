@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import config
+import utils
+
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch):
+    """Point the configuration at a temporary ``.env`` and restore it afterwards."""
+    for key in config.CONFIG_ITEMS:
+        monkeypatch.setattr(config, key, getattr(config, key, ""), raising=False)
+        if key in os.environ:
+            monkeypatch.setenv(key, os.environ[key])
+        else:
+            monkeypatch.delenv(key, raising=False)
+    path = tmp_path / ".env"
+    monkeypatch.setattr(config, "ENV_FILE", str(path))
+    monkeypatch.setattr(config, "PROMPTS_FILE", str(tmp_path / "prompts.json"))
+    monkeypatch.setattr(config, "_mtimes", {config.PROMPTS_FILE: None})
+    monkeypatch.setattr(config, "_PROCESS_ENV", {})
+    monkeypatch.setattr(config, "CONFIG_VERSION", 0)
+    return path
+
+
+def _write(path, text, mtime_ns):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_key_removed_from_env_file_falls_back_to_default(env_file):
+    _write(env_file, "BASE_URL=http://old.example/v1\n", 1_000_000_000)
+    assert "BASE_URL" in config.reload_if_changed()
+    assert config.BASE_URL == "http://old.example/v1"
+
+    _write(env_file, "", 2_000_000_000)
+    assert "BASE_URL" in config.reload_if_changed()
+    assert config.BASE_URL == ""
+    assert "BASE_URL" not in os.environ
+
+
+def test_key_removed_from_env_file_falls_back_to_process_env(env_file, monkeypatch):
+    monkeypatch.setattr(config, "_PROCESS_ENV", {"BASE_URL": "http://process.example/v1"})
+    _write(env_file, "BASE_URL=http://file.example/v1\n", 1_000_000_000)
+    config.reload_if_changed()
+
+    _write(env_file, "", 2_000_000_000)
+    config.reload_if_changed()
+    assert config.BASE_URL == "http://process.example/v1"
+    assert os.environ["BASE_URL"] == "http://process.example/v1"
+
+
+def test_prune_clients_drops_replaced_settings(env_file, monkeypatch):
+    monkeypatch.setattr(utils, "_CLIENTS", {})
+    monkeypatch.setattr(config, "LLM_PROVIDER", "openai")
+    monkeypatch.setattr(config, "API_KEY", "new-key")
+    monkeypatch.setattr(config, "BASE_URL", "")
+    monkeypatch.setattr(config, "BACKUP_LLM_PROVIDER", "")
+    monkeypatch.setattr(config, "BACKUP_API_KEY", "")
+    monkeypatch.setattr(config, "BACKUP_BASE_URL", "")
+    utils._CLIENTS[("openai", "old-key", "", "gpt-4o")] = object()
+    utils._CLIENTS[("openai", "new-key", "", "gpt-4o")] = object()
+    utils._CLIENTS[("openai", "new-key", "", "gpt-4o-mini")] = object()
+
+    assert utils.prune_clients() == 1
+    assert set(utils._CLIENTS) == {
+        ("openai", "new-key", "", "gpt-4o"),
+        ("openai", "new-key", "", "gpt-4o-mini"),
+    }
+
+
+def test_object_prompt_entries_are_read_as_text(env_file):
+    (env_file.parent / "prompts.json").write_text(
+        '{"SYS_GEN": {"text": ["Write", "%FILE%"], "placeholders": ["FILE"]}, "USR_GEN": "Go"}',
+        encoding="utf-8",
+    )
+    prompts = config._read_prompts()
+    assert prompts["SYS_GEN"] == "Write\n%FILE%"
+    assert prompts["USR_GEN"] == "Go"
@@ -0,0 +1,29 @@
+import conversation_store
+import utils
+
+
+class FakeLLM:
+    def _conversation(self, messages, model_name, conversation_id, component):
+        return f"reply to {messages[-1]['content']}"
+
+
+def test_conversation_is_stored_with_its_first_turn(tmp_path):
+    store = conversation_store.ConversationStore(str(tmp_path / "conversations.db"))
+    conv = utils.Conversation(FakeLLM(), "You are terse.", store=store, component="Echo")
+
+    # Opening a page without chatting leaves no record behind
+    assert store.list_conversations() == []
+    assert conv.message_count == 0
+    assert conv.load_page() == []
+
+    assert conv.send("hi") == "reply to hi"
+    record = store.get_conversation(conv.conversation_id)
+    assert record["system_prompt"] == "You are terse."
+    assert record["component"] == "Echo"
+    conv.send("again")
+    assert len(store.list_conversations()) == 1
+    assert [m["content"] for m in conv.load_page()] == ["hi", "reply to hi", "again", "reply to again"]
+
+    resumed = utils.Conversation.resume(FakeLLM(), conv.conversation_id, store=store)
+    resumed.send("third")
+    assert store.count_messages(conv.conversation_id) == 6
@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+
+import pytest
+
+import decompiler
+
+# Stand-in for the java executable. It answers the CfrWorker protocol, or
+# CFR's command line with -jar, and writes one source per input. Inputs named
+# "broken*" get CFR's jar failure in the summary and "empty*" produce nothing.
+# Every start is logged to "starts"; a "no-worker" file makes the worker fail.
+FAKE_JAVA = """#!{python}
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def decompile(source, output_dir):
+    name = os.path.basename(source)
+    os.makedirs(output_dir, exist_ok=True)
+    if name.startswith("broken"):
+        with open(os.path.join(output_dir, "summary.txt"), "w") as f:
+            f.write("Summary\\n{failure} " + source + "\\n")
+    elif not name.startswith("empty"):
+        with open(os.path.join(output_dir, "Main.java"), "w") as f:
+            f.write("// " + name + "\\n")
+
+
+mode = "cli" if "-jar" in sys.argv else "worker"
+with open(os.path.join(HERE, "starts"), "a") as f:
+    f.write(mode + "\\n")
+if mode == "cli":
+    args = sys.argv[1:]
+    decompile(args[2], args[args.index("--outputdir") + 1])
+    sys.exit(0)
+if os.path.exists(os.path.join(HERE, "no-worker")):
+    print("error: module jdk.compiler not found", file=sys.stderr)
+    sys.exit(1)
+print("READY", flush=True)
+for line in sys.stdin:
+    source, output_dir, _ = line.rstrip("\\n").split("\\t")
+    decompile(source, output_dir)
+    print("OK", flush=True)
+"""
+
+
+@pytest.fixture
+def java(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    path = bin_dir / "java"
+    path.write_text(
+        FAKE_JAVA.format(python=sys.executable, failure=decompiler.JAR_FAILURE), encoding="utf-8"
+    )
+    path.chmod(0o755)
+    return path
+
+
+def starts(java) -> list[str]:
+    log = java.parent / "starts"
+    return log.read_text().split() if log.exists() else []
+
+
+@pytest.fixture
+def make_decompiler(tmp_path):
+    instances = []
+
+    def make(java, workers=1):
+        instance = decompiler.Decompiler(workers, str(java), str(tmp_path / "cache"))
+        instances.append(instance)
+        return instance
+
+    yield make
+    for instance in instances:
+        instance.close()
+
+
+def write_input(tmp_path, name, content=b"\xca\xfe\xba\xbe"):
+    path = tmp_path / name
+    path.write_bytes(content + name.encode())
+    return str(path)
+
+
+def test_warm_worker_serves_every_request(tmp_path, java, make_decompiler):
+    d = make_decompiler(java)
+    first = d.get_source(write_input(tmp_path, "A.class"), "Main")
+    second = d.get_source(write_input(tmp_path, "B.class"), "Main")
+    assert (first, second) == ("// A.class\n", "// B.class\n")
+    assert starts(java) == ["worker"]
+
+
+def test_identical_content_is_served_from_the_cache(tmp_path, java, make_decompiler, monkeypatch):
+    monkeypatch.setattr(decompiler, "HASH_CACHE_SIZE", 2)
+    d = make_decompiler(java)
+    path = write_input(tmp_path, "A.class")
+    output_dir = d.decompile(path)
+    copy = tmp_path / "copy"
+    copy.mkdir()
+    (copy / "A.class").write_bytes(open(path, "rb").read())
+    assert d.decompile(str(copy / "A.class")) == output_dir
+    assert starts(java) == ["worker"]
+
+    for name in ("B.class", "C.class"):
+        d.content_hash(write_input(tmp_path, name))
+    assert len(d._hashes) == 2
+    # A changed file is hashed again
+    os.utime(path, ns=(1, 1))
+    assert d.content_hash(path) == os.path.basename(output_dir)
+    assert len(d._hashes) == 2
+
+
+@pytest.mark.parametrize("name", ["broken.jar", "empty.class"])
+def test_silent_cfr_failures_are_errors(tmp_path, java, make_decompiler, name):
+    d = make_decompiler(java)
+    with pytest.raises(decompiler.DecompilerError, match="CFR"):
+        d.decompile(write_input(tmp_path, name))
+    # Nothing is cached for the failed input
+    assert os.listdir(d.cache_dir) == []
+
+
+def test_worker_startup_is_retried_after_falling_back(tmp_path, java, make_decompiler, monkeypatch):
+    monkeypatch.setattr(decompiler, "WORKER_RETRY_DELAY", 0.3)
+    (java.parent / "no-worker").touch()
+    d = make_decompiler(java)
+
+    assert d.get_source(write_input(tmp_path, "A.class"), "Main") == "// A.class\n"
+    assert d.get_source(write_input(tmp_path, "B.class"), "Main") == "// B.class\n"
+    assert starts(java) == ["worker", "cli", "cli"]
+
+    (java.parent / "no-worker").unlink()
+    time.sleep(0.35)
+    assert d.get_source(write_input(tmp_path, "C.class"), "Main") == "// C.class\n"
+    assert d.get_source(write_input(tmp_path, "D.class"), "Main") == "// D.class\n"
+    assert starts(java) == ["worker", "cli", "cli", "worker"]
+
+
+def test_missing_java_is_reported(tmp_path, make_decompiler):
+    d = make_decompiler(tmp_path / "no-java")
+    with pytest.raises(decompiler.DecompilerError, match="Java executable not found"):
+        d.decompile(write_input(tmp_path, "A.class"))
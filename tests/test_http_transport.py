@@ -0,0 +1,26 @@
+import http_transport
+
+
+def test_shared_client_uses_the_sdk_timeout_and_follows_redirects(monkeypatch):
+    monkeypatch.setattr(http_transport, "_client", None)
+    monkeypatch.setattr(http_transport.config, "HTTP_TIMEOUT", "", raising=False)
+    client = http_transport.get_http_client()
+    try:
+        assert client.timeout.read == 600.0
+        assert client.timeout.connect == 5.0
+        assert client.follow_redirects
+    finally:
+        client.close()
+
+
+def test_timeout_is_read_from_the_configuration(monkeypatch):
+    monkeypatch.setattr(http_transport, "_client", None)
+    monkeypatch.setattr(http_transport.config, "HTTP_TIMEOUT", "90", raising=False)
+    client = http_transport.get_http_client()
+    try:
+        assert client.timeout.read == 90.0
+        assert client.timeout.connect == 5.0
+    finally:
+        client.close()
+    monkeypatch.setattr(http_transport.config, "HTTP_TIMEOUT", "soon")
+    assert http_transport.request_timeout() == 600.0
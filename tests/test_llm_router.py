@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+import usage_ledger
+import utils
+from benchmarks.mock_llm_server import MockSettings, start_server
+from llm_router import LLMRouter
+
+
+@pytest.fixture(autouse=True)
+def ledger(tmp_path, monkeypatch):
+    ledger = usage_ledger.UsageLedger(str(tmp_path / "usage.db"), str(tmp_path / "usage.json"))
+    monkeypatch.setattr(usage_ledger, "_ledger", ledger)
+
+
+@pytest.fixture
+def servers():
+    """A primary and a backup mock server; replies tell them apart by length."""
+    primary = start_server(settings=MockSettings(reply_tokens=1))
+    backup = start_server(settings=MockSettings(reply_tokens=2))
+    yield primary, backup
+    primary.shutdown()
+    backup.shutdown()
+
+
+def make_router(servers, **kwargs) -> LLMRouter:
+    llms = [
+        utils.LLM(provider="openai", api_key="mock", base_url=s.base_url, model_name="mock-model")
+        for s in servers
+    ]
+    return LLMRouter(llms, **kwargs)
+
+
+PRIMARY_REPLY = "tok0 "
+BACKUP_REPLY = "tok0 tok1 "
+
+
+def fail(server):
+    # 404 is a provider error the OpenAI SDK does not retry itself
+    server.settings.error_rate = 1.0
+    server.settings.error_status = 404
+
+
+def test_provider_errors_fail_over_and_put_the_target_on_cooldown(servers):
+    primary, backup = servers
+    router = make_router(servers, failure_threshold=2, cooldown=60)
+    fail(primary)
+
+    assert router.ask("sys", "user") == BACKUP_REPLY
+    assert router.ask("sys", "user") == BACKUP_REPLY
+    assert primary.requests == 2
+    assert router.targets[0].stats.as_dict()["healthy"] is False
+
+    # The primary is skipped while it cools down
+    assert router.ask("sys", "user") == BACKUP_REPLY
+    assert primary.requests == 2
+    assert backup.requests == 3
+
+
+def test_target_recovers_after_cooldown(servers):
+    primary, backup = servers
+    router = make_router(servers, failure_threshold=1, cooldown=0.2)
+    fail(primary)
+    assert router.ask("sys", "user") == BACKUP_REPLY
+
+    primary.settings.error_rate = 0.0
+    time.sleep(0.25)
+    # Healthy again and still unmeasured, so it is tried before the backup
+    assert router.ask("sys", "user") == PRIMARY_REPLY
+    assert primary.requests == 2
+    assert router.targets[0].stats.as_dict()["healthy"] is True
+
+
+def test_unmeasured_backup_is_tried_and_faster_target_preferred(servers):
+    primary, backup = servers
+    primary.settings.latency = 0.1
+    router = make_router(servers)
+
+    assert router.ask("sys", "user") == PRIMARY_REPLY
+    # The backup has no measurements yet and gets a call of its own
+    assert router.ask("sys", "user") == BACKUP_REPLY
+    # From now on the faster backup is preferred
+    assert router.ask("sys", "user") == BACKUP_REPLY
+    assert primary.requests == 1
+
+
+def test_hedged_request_returns_the_first_reply(servers):
+    primary, backup = servers
+    backup.settings.latency = 0.05
+    router = make_router(servers, hedge=True, hedge_min_samples=2)
+    # Measure both targets: primary, unmeasured backup, primary again
+    for _ in range(3):
+        router.ask("sys", "user")
+    assert router.targets[0].stats.as_dict()["calls"] == 2
+    assert router.model_name == "mock-model"
+
+    primary.settings.latency = 1.0
+    start = time.perf_counter()
+    assert router.ask("sys", "user") == BACKUP_REPLY
+    assert time.perf_counter() - start < 0.8
+    assert primary.requests == 3
+    assert backup.requests == 2
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+import pytest
+
+import utils
+
+GBK_MESSAGE = "错误：找不到符号，请检查类路径和依赖项是否正确配置"
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setattr(utils, "_ENCODING_CACHE", OrderedDict())
+
+
+def mangled(text: str, encoding: str) -> str:
+    """Return ``text`` the way it arrives when its bytes were read as latin-1."""
+    return text.encode(encoding).decode("latin1")
+
+
+def test_multibyte_encoding_is_remembered_per_source():
+    assert utils.mixed_decode("javac: " + mangled(GBK_MESSAGE, "gbk"), "javac") == (
+        "javac: " + GBK_MESSAGE
+    )
+    assert utils._ENCODING_CACHE["javac"].lower() in ("gbk", "gb2312", "gb18030")
+
+
+def test_single_byte_encoding_is_not_pinned():
+    utils.mixed_decode("javac: " + mangled("Größe überschritten", "latin-1"), "javac")
+    assert "javac" not in utils._ENCODING_CACHE
+    # Even a pinned single-byte codec must not garble later multibyte output
+    utils._ENCODING_CACHE["javac"] = "latin-1"
+    assert utils.mixed_decode("javac: " + mangled(GBK_MESSAGE, "gbk"), "javac") == (
+        "javac: " + GBK_MESSAGE
+    )
+
+
+def test_utf8_output_is_decoded_despite_cached_encoding():
+    utils._ENCODING_CACHE["javac"] = "gbk"
+    assert utils.mixed_decode("javac: " + mangled("找不到符号", "utf-8"), "javac") == (
+        "javac: 找不到符号"
+    )
+
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(utils, "ENCODING_CACHE_SIZE", 3)
+    for i in range(10):
+        utils._cache_encoding(f"tool {i}", "gbk")
+    # Reading an entry keeps it
+    assert utils._cached_encoding("tool 7") == "gbk"
+    utils._cache_encoding("tool 10", "gbk")
+    assert list(utils._ENCODING_CACHE) == ["tool 9", "tool 7", "tool 10"]
+
+
+def test_iter_decoded_lines_keeps_the_multibyte_encoding():
+    lines = [b"plain\n", GBK_MESSAGE.encode("gbk") + b"\n", "ok".encode("utf-8")]
+    assert list(utils.iter_decoded_lines(lines, "javac")) == ["plain\n", GBK_MESSAGE + "\n", "ok"]
+    assert utils._cached_encoding("javac").lower() in ("gbk", "gb2312", "gb18030")
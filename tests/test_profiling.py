@@ -0,0 +1,40 @@
+import os
+import threading
+
+import profiling
+
+
+def test_concurrent_renders_share_the_profiler():
+    both_inside, done = threading.Barrier(2), threading.Barrier(2)
+    profiles, errors = [], []
+
+    def render():
+        try:
+            with profiling.profile_render("page", cprofile=True) as profile:
+                both_inside.wait(5)
+                sum(range(1000))
+                done.wait(5)
+            profiles.append(profile)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=render) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == []
+    # One render is profiled, the other only has its span timings
+    paths = [p.stats_path for p in profiles]
+    assert sorted(path is None for path in paths) == [False, True]
+    assert all(p.total > 0 for p in profiles)
+    for path in paths:
+        if path:
+            os.remove(path)
+
+    # The profiler is free again afterwards
+    with profiling.profile_render("page", cprofile=True) as profile:
+        pass
+    assert profile.stats_path
+    os.remove(profile.stats_path)
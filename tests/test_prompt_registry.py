@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+import prompt_registry
+
+
+def _write(path, data, mtime_ns):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    # Distinct modification times even on file systems with coarse timestamps
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_custom_entries_reload_when_prompts_file_changes(tmp_path):
+    path = tmp_path / "prompts.json"
+    _write(path, {}, 1_000_000_000)
+    registry = prompt_registry.PromptRegistry(str(path))
+    registry.register("ECHO_SYS", "You are a helpful assistant.")
+    assert registry.render("ECHO_SYS") == "You are a helpful assistant."
+
+    _write(path, {"ECHO_SYS": "You are a pirate."}, 2_000_000_000)
+    assert registry.render("ECHO_SYS") == "You are a pirate."
+
+
+def test_override_with_wrong_placeholders_keeps_registered_text(tmp_path):
+    path = tmp_path / "prompts.json"
+    _write(path, {"GREET": "Hello %OTHER%"}, 1_000_000_000)
+    registry = prompt_registry.PromptRegistry(str(path))
+    registry.register("GREET", "Hello %NAME%", placeholders=["NAME"])
+    assert registry.render("GREET", NAME="Ada") == "Hello Ada"
+
+
+def test_file_only_entries_validate_declared_placeholders(tmp_path):
+    path = tmp_path / "prompts.json"
+    _write(
+        path,
+        {
+            "GOOD": {"text": ["Write %THING%", "now"], "placeholders": ["THING"]},
+            "BAD": {"text": "Write %THNIG%", "placeholders": ["THING"]},
+        },
+        1_000_000_000,
+    )
+    registry = prompt_registry.PromptRegistry(str(path))
+    assert registry.render("GOOD", THING="code") == "Write code\nnow"
+    with pytest.raises(KeyError):
+        registry.get("BAD")
+
+
+def test_rendered_prompts_carry_their_ref(tmp_path):
+    registry = prompt_registry.PromptRegistry(str(tmp_path / "prompts.json"))
+    greet = registry.register("GREET", "Hello %NAME%", placeholders=["NAME"])
+    registry.register("BYE", "Bye")
+    rendered = registry.render("GREET", NAME="Ada")
+    assert rendered == "Hello Ada"
+    assert rendered.ref == greet.ref == f"GREET@{greet.version}"
+    assert prompt_registry.prompt_refs(rendered, "plain", rendered, registry.render("BYE")) == (
+        f"{greet.ref},{registry.get('BYE').ref}"
+    )
+    assert prompt_registry.prompt_refs("plain", rendered + "!") is None
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+import artifact_manager
+import conversation_store
+import search_index
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = search_index.SearchIndex(str(tmp_path / "search.db"))
+    monkeypatch.setattr(search_index, "_index", index)
+    artifacts_dir = tmp_path / "artifacts"
+    monkeypatch.setattr(artifact_manager, "ARTIFACTS_DIR", str(artifacts_dir))
+    monkeypatch.setattr(artifact_manager, "ARTIFACTS_FILE", str(artifacts_dir / "artifacts.json"))
+    monkeypatch.setattr(artifact_manager, "_listing", None)
+    artifact_manager.register_artifact_type("text")
+    return index
+
+
+def write_artifact(tmp_path, name: str, text: str) -> str:
+    src = tmp_path / name
+    src.write_text(text, encoding="utf-8")
+    return artifact_manager.write_artifact("Echo", str(src), f"remark of {name}", "text")
+
+
+def test_iter_conversations_is_stable_while_conversations_change(tmp_path):
+    store = conversation_store.ConversationStore(str(tmp_path / "conversations.db"))
+    ids = sorted(store.create_conversation("sys", "Echo") for _ in range(7))
+    seen = []
+    for conv in store.iter_conversations(page_size=2):
+        seen.append(conv["id"])
+        # Updating a conversation moves it to the front of list_conversations
+        store.append_message(ids[-1], "user", "bump")
+    assert seen == ids
+
+
+def test_rebuild_indexes_every_artifact_and_message(tmp_path, index, monkeypatch):
+    monkeypatch.setattr(search_index, "REBUILD_BATCH_SIZE", 3)
+    store = conversation_store.ConversationStore(str(tmp_path / "conversations.db"))
+    for i in range(5):
+        conv_id = store.create_conversation("sys", "Echo")
+        store.append_message(conv_id, "user", f"question {i} about walruses")
+        store.append_message(conv_id, "assistant", f"answer {i}")
+    write_artifact(tmp_path, "notes.txt", "walruses live in the arctic")
+
+    assert index.rebuild(store=store) == 11
+    kinds = [hit["kind"] for hit in index.search("walruses", limit=50)]
+    assert kinds.count(search_index.MESSAGE) == 5
+    assert kinds.count(search_index.ARTIFACT) == 1
+
+
+def test_list_artifacts_follows_added_and_removed_files(tmp_path, index):
+    assert artifact_manager.list_artifacts() == []
+    first = write_artifact(tmp_path, "a.txt", "a")
+    assert [a["remark"] for a in artifact_manager.list_artifacts()] == ["remark of a.txt"]
+    write_artifact(tmp_path, "b.txt", "b")
+    assert len(artifact_manager.list_artifacts()) == 2
+
+    os.remove(first)
+    assert [a["remark"] for a in artifact_manager.list_artifacts()] == ["remark of b.txt"]
+    # The cached listing cannot be changed through a returned list
+    artifact_manager.list_artifacts().clear()
+    assert len(artifact_manager.list_artifacts()) == 1
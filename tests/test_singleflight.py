@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import usage_ledger
+import utils
+from singleflight import SingleFlight
+
+
+class SlowClient:
+    """Chat model stand-in that holds every request until released."""
+
+    def __init__(self, error: Exception | None = None):
+        self.error = error
+        self.release = threading.Event()
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return AIMessage(content=f"reply {self.calls}")
+
+
+@pytest.fixture(autouse=True)
+def flight(tmp_path, monkeypatch):
+    ledger = usage_ledger.UsageLedger(str(tmp_path / "usage.db"), str(tmp_path / "usage.json"))
+    monkeypatch.setattr(usage_ledger, "_ledger", ledger)
+    flight = SingleFlight()
+    monkeypatch.setattr(utils, "_INFLIGHT", flight)
+    return flight
+
+
+def make_llm(api_key="key", base_url="http://localhost:8000/v1"):
+    return utils.LLM(provider="openai", api_key=api_key, base_url=base_url, model_name="model")
+
+
+def run_concurrently(calls: list, flight: SingleFlight, release: list, followers: int) -> list:
+    """Start ``calls`` in threads, wait for ``followers`` to join, then release the clients."""
+    results = [None] * len(calls)
+
+    def run(i, fn):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, fn)) for i, fn in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.coalesced < followers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Give callers that must not coalesce the chance to do so anyway
+    time.sleep(0.05)
+    for event in release:
+        event.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_identical_calls_share_one_request(flight):
+    llm, client = make_llm(), SlowClient()
+    messages = [HumanMessage(content="hi")]
+    calls = [
+        (lambda name=name: llm._invoke(client, messages, "model", (name, None, None)))
+        for name in ("a", "b", "c")
+    ]
+    results = run_concurrently(calls, flight, [client.release], followers=2)
+
+    assert client.calls == 1
+    assert [r.content for r in results] == ["reply 1"] * 3
+    assert flight.coalesced == 2
+    # Every caller is recorded under its own component
+    records = usage_ledger.get_ledger().records()
+    assert sorted(r["component"] for r in records) == ["a", "b", "c"]
+
+
+def test_leader_failure_propagates_to_followers(flight):
+    llm, client = make_llm(), SlowClient(ConnectionError("provider down"))
+    messages = [HumanMessage(content="hi")]
+    call = lambda: llm._invoke(client, messages, "model", ("echo", None, None))
+    results = run_concurrently([call] * 3, flight, [client.release], followers=2)
+
+    assert client.calls == 1
+    assert all(isinstance(r, ConnectionError) for r in results)
+    # A failed call is not remembered
+    client.error = None
+    assert llm._invoke(client, messages, "model", ("echo", None, None)).content == "reply 2"
+
+
+def test_different_credentials_and_endpoints_do_not_share_requests(flight):
+    messages = [HumanMessage(content="hi")]
+    clients = [SlowClient() for _ in range(3)]
+    llms = [
+        make_llm(),
+        make_llm(api_key="other key"),
+        make_llm(base_url="http://localhost:9000/v1"),
+    ]
+    calls = [
+        (
+            lambda llm=llm, client=client: llm._invoke(
+                client, messages, "model", ("echo", None, None)
+            )
+        )
+        for llm, client in zip(llms, clients)
+    ]
+    run_concurrently(calls, flight, [client.release for client in clients], followers=0)
+
+    assert [client.calls for client in clients] == [1, 1, 1]
+    assert flight.coalesced == 0
+
+
+def test_request_key_covers_every_setting():
+    messages = [HumanMessage(content="hi")]
+    base = ("openai", "key", "http://localhost:8000/v1", "model")
+    key = utils._request_key(*base, messages)
+    assert utils._request_key(*base, [HumanMessage(content="hi")]) == key
+    for i, value in enumerate(("google", "other key", "http://localhost:9000/v1", "other")):
+        changed = list(base)
+        changed[i] = value
+        assert utils._request_key(*changed, messages) != key
+    assert utils._request_key(*base, [HumanMessage(content="hello")]) != key
+    # Separators inside values cannot make two requests look alike
+    assert utils._request_key("openai", "a", "b,c", "model", messages) != utils._request_key(
+        "openai", "a,b", "c", "model", messages
+    )
+
+
+def test_abandoned_stream_closes_upstream():
+    flight = SingleFlight()
+    produced, closed = [], threading.Event()
+
+    def upstream():
+        try:
+            for i in range(100):
+                produced.append(i)
+                yield i
+        finally:
+            closed.set()
+
+    first = flight.stream("key", upstream)
+    second = flight.stream("key", upstream)
+    assert next(first) == 0
+    assert next(second) == 0
+    first.close()
+    # The remaining subscriber still receives the stream
+    assert next(second) == 1
+    assert not closed.is_set()
+    second.close()
+    assert closed.is_set()
+    assert len(produced) == 2
+    # A new call after the abandoned one starts over
+    assert list(flight.stream("key", lambda: iter([7]))) == [7]
+
+
+def test_stream_error_reaches_late_subscribers():
+    flight = SingleFlight()
+
+    def upstream():
+        yield "a"
+        raise ConnectionError("reset")
+
+    first = flight.stream("key", upstream)
+    assert next(first) == "a"
+    late = flight.stream("key", upstream)
+    with pytest.raises(ConnectionError):
+        list(first)
+    # The late subscriber replays the chunks so far, then sees the same error
+    assert next(late) == "a"
+    with pytest.raises(ConnectionError):
+        next(late)
@@ -0,0 +1,152 @@
+import json
+
+import pytest
+
+import structured_output
+from structured_output import JSONDivergenceError, StreamingJSONValidator
+
+
+def feed_all(schema, text, chunk_size=1):
+    validator = StreamingJSONValidator(schema)
+    for i in range(0, len(text), chunk_size):
+        if validator.feed(text[i : i + chunk_size]):
+            break
+    return validator
+
+
+def diverge(schema, text):
+    with pytest.raises(JSONDivergenceError) as info:
+        feed_all(schema, text).finish()
+    return info.value
+
+
+PERSON = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "age": {"type": "integer"},
+        "tags": {"type": "array", "items": {"type": "string"}, "minItems": 1, "maxItems": 2},
+    },
+    "required": ["name", "age"],
+    "additionalProperties": False,
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_valid_object_in_any_chunking(chunk_size):
+    text = '{"name": "Ada", "age": 36, "tags": ["math"]}'
+    validator = feed_all(PERSON, text, chunk_size)
+    assert validator.done
+    assert json.loads(validator.finish()) == json.loads(text)
+
+
+def test_code_fence_and_trailing_text_are_skipped():
+    text = '```json\n{"name": "Ada", "age": 36}\n```\nHope this helps!'
+    validator = feed_all(PERSON, text)
+    assert json.loads(validator.finish()) == {"name": "Ada", "age": 36}
+
+
+def test_string_escapes():
+    schema = {"type": "array", "items": {"type": "string"}}
+    text = r'["quote \" inside", "back\\slash", "unicode é", "brace } ]"]'
+    validator = feed_all(schema, text)
+    assert json.loads(validator.finish()) == ["quote \" inside", "back\\slash", "unicode é", "brace } ]"]
+
+
+def test_control_character_in_string_diverges():
+    error = diverge({"type": "string"}, '"a\nb"')
+    assert error.position == 2
+
+
+def test_number_at_end_of_stream_completes_on_finish():
+    validator = feed_all({"type": "number"}, "-12.5e3")
+    assert not validator.done
+    assert validator.finish() == "-12.5e3"
+
+
+def test_integer_schema_rejects_fraction():
+    error = diverge({"type": "object", "properties": {"n": {"type": "integer"}}}, '{"n": 1.5}')
+    assert error.position == 6
+    assert error.valid_prefix == "{"
+
+
+def test_incomplete_value_is_reported_on_finish():
+    with pytest.raises(JSONDivergenceError):
+        feed_all(PERSON, '{"name": "Ada"').finish()
+
+
+def test_divergence_offset_and_valid_prefix():
+    text = '{"name": "Ada", "age": "old"}'
+    error = diverge(PERSON, text)
+    assert error.position == text.index('"old"')
+    assert error.valid_prefix == '{"name": "Ada"'
+
+
+def test_unexpected_and_missing_properties():
+    assert "Unexpected property" in str(diverge(PERSON, '{"nick": "A"}'))
+    assert "Missing required" in str(diverge(PERSON, '{"name": "Ada"}'))
+
+
+def test_min_and_max_items():
+    assert "Fewer than 1" in str(diverge(PERSON, '{"name": "A", "age": 1, "tags": []}'))
+    error = diverge(PERSON, '{"name": "A", "age": 1, "tags": ["a", "b", "c"]}')
+    assert "More than 2" in str(error)
+    assert error.valid_prefix == '{"name": "A", "age": 1, "tags": ["a", "b"'
+
+
+def test_any_of_picks_branch_by_type():
+    schema = {"anyOf": [{"type": "integer"}, {"type": "array", "items": {"type": "boolean"}}]}
+    assert feed_all(schema, "[true, false]").finish() == "[true, false]"
+    assert feed_all(schema, "7 ").finish() == "7"
+    assert "Expected" in str(diverge(schema, '"seven"'))
+    assert "Expected" in str(diverge(schema, '[1]'))
+
+
+def test_enum_and_const():
+    assert "is not one of" in str(diverge({"enum": ["a", "b"]}, '"c"'))
+    assert "Expected" in str(diverge({"const": 3}, "4 "))
+
+
+def test_ref_to_definitions():
+    schema = {
+        "type": "array",
+        "items": {"$ref": "#/$defs/Point"},
+        "$defs": {
+            "Point": {
+                "type": "object",
+                "properties": {"x": {"type": "integer"}},
+                "required": ["x"],
+            }
+        },
+    }
+    assert feed_all(schema, '[{"x": 1}, {"x": 2}]').finish() == '[{"x": 1}, {"x": 2}]'
+    assert "Missing required" in str(diverge(schema, '[{"x": 1}, {}]'))
+
+
+def test_pydantic_types_resolve_to_schema_and_converter():
+    schema, convert = structured_output.resolve_schema(list[int])
+    assert schema == {"type": "array", "items": {"type": "integer"}}
+    assert convert(["1", 2]) == [1, 2]
+
+
+def test_wrap_root_keeps_objects_and_wraps_other_types():
+    assert structured_output.wrap_root(PERSON) == (PERSON, False)
+    schema = {"type": "array", "items": {"$ref": "#/$defs/P"}, "$defs": {"P": {"type": "string"}}}
+    wrapped, was_wrapped = structured_output.wrap_root(schema)
+    assert was_wrapped
+    assert wrapped["$defs"] == schema["$defs"]
+    validator = feed_all(wrapped, '{"value": ["a"]}')
+    assert json.loads(validator.finish()) == {"value": ["a"]}
+
+
+def test_dict_schemas_are_validated_in_full():
+    schema = {
+        "type": "object",
+        "properties": {"code": {"type": "string", "pattern": "^[A-Z]{3}$"}, "n": {"minimum": 1}},
+    }
+    _, convert = structured_output.resolve_schema(schema)
+    assert convert({"code": "ABC", "n": 2}) == {"code": "ABC", "n": 2}
+    with pytest.raises(ValueError, match=r"does not match.*\$\.code"):
+        convert({"code": "abc", "n": 2})
+    with pytest.raises(ValueError, match="less than the minimum"):
+        convert({"code": "ABC", "n": 0})
@@ -0,0 +1,103 @@
+import json
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import usage_ledger
+import utils
+from usage_ledger import Budget, BudgetExceededError, UsageLedger
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    ledger = UsageLedger(str(tmp_path / "usage.db"), str(tmp_path / "usage.json"))
+    monkeypatch.setattr(usage_ledger, "_ledger", ledger)
+    return ledger
+
+
+def record(ledger, component="echo", tokens=(100, 0, 50), model="gpt-4o"):
+    return ledger.record(component, None, "openai", model, *tokens, 0.1)
+
+
+def test_cost_uses_cached_input_price(ledger, tmp_path):
+    (tmp_path / "usage.json").write_text(
+        json.dumps({"prices": {"gpt-4o": {"input": 2, "cached_input": 1, "output": 10}}}),
+        encoding="utf-8",
+    )
+    # 60 uncached and 40 cached input tokens, 50 output tokens
+    assert record(ledger, tokens=(100, 40, 50), model="openai/gpt-4o") == pytest.approx(
+        (60 * 2 + 40 * 1 + 50 * 10) / 1_000_000
+    )
+    assert record(ledger, model="unknown") is None
+    assert [row["key"] for row in ledger.summary("model")] == ["openai/gpt-4o", "unknown"]
+
+
+def test_exceeded_budget_rejects_only_its_component(ledger):
+    ledger.set_budget("echo", Budget(max_tokens=200))
+    record(ledger)
+    ledger.check_budget("echo")
+    record(ledger)
+    with pytest.raises(BudgetExceededError, match="300 of 200 tokens") as info:
+        ledger.check_budget("echo")
+    assert info.value.component == "echo"
+    ledger.check_budget("other")
+
+    ledger.set_budget("echo", None)
+    ledger.check_budget("echo")
+
+
+def test_budget_only_counts_its_period(ledger):
+    ledger.set_budget("echo", Budget(max_tokens=100, period=0.1))
+    record(ledger)
+    with pytest.raises(BudgetExceededError):
+        ledger.check_budget("echo")
+    time.sleep(0.15)
+    ledger.check_budget("echo")
+
+
+def test_budgets_from_the_usage_file(ledger, tmp_path):
+    (tmp_path / "usage.json").write_text(
+        json.dumps({"budgets": {"echo": {"max_cost": 0.001}, "bad": {"action": "explode"}}}),
+        encoding="utf-8",
+    )
+    assert ledger.get_budget("echo").max_cost == 0.001
+    assert ledger.get_budget("bad") is None
+
+
+def test_throttled_component_is_delayed(ledger):
+    ledger.set_budget("echo", Budget(max_tokens=1, action="throttle", throttle_interval=0.2))
+    record(ledger)
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        ledger.check_budget("echo")
+        timings.append(time.perf_counter() - start)
+    # The first call passes at once, later ones are spaced by the interval
+    assert timings[0] < 0.1
+    assert all(0.15 < t < 0.5 for t in timings[1:])
+
+
+def test_llm_call_is_rejected_before_the_request(ledger):
+    class Client:
+        calls = 0
+
+        def invoke(self, messages):
+            Client.calls += 1
+            return AIMessage(content="reply")
+
+    llm = utils.LLM(
+        provider="openai",
+        api_key="key",
+        base_url="http://localhost:8000/v1",
+        model_name="model",
+        component="echo",
+    )
+    ledger.set_budget("echo", Budget(max_tokens=1))
+    record(ledger)
+    with pytest.raises(BudgetExceededError):
+        llm._invoke(Client(), [HumanMessage(content="hi")], "model", ("echo", None, None))
+    assert Client.calls == 0
+    # Other components are not affected
+    assert llm._invoke(Client(), [HumanMessage(content="hi")], "model", ("other", None, None))
+    assert Client.calls == 1
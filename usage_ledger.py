@@ -0,0 +1,319 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from log_writer import logger
+
+LEDGER_PATH = os.path.join("data", "usage.db")
+
+# Prices per million tokens and per-component budgets, for example
+# {"prices": {"gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10}},
+#  "budgets": {"My Component": {"max_cost": 5, "action": "throttle"}}}
+USAGE_FILE = "usage.json"
+
+REJECT = "reject"
+THROTTLE = "throttle"
+
+GROUP_COLUMNS = ("component", "conversation_id", "provider", "model", "prompt")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    ts REAL NOT NULL,
+    component TEXT NOT NULL DEFAULT '',
+    conversation_id TEXT,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    cost REAL,
+    prompt TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_usage_component ON usage (component, ts);
+CREATE INDEX IF NOT EXISTS idx_usage_ts ON usage (ts);
+"""
+
+
+class BudgetExceededError(Exception):
+    """Raised when a component has used up its budget for the current period."""
+
+    def __init__(self, component: str, message: str) -> None:
+        super().__init__(message)
+        self.component = component
+
+
+class Budget:
+    """Spending limit of one component.
+
+    Args:
+        max_cost: Maximum cost per period, in the currency of the price table.
+        max_tokens: Maximum input plus output tokens per period.
+        period: Length of the budget period in seconds.
+        action: ``"reject"`` to raise :class:`BudgetExceededError` once the
+            budget is used up, ``"throttle"`` to let calls through at most
+            once every ``throttle_interval`` seconds.
+        throttle_interval: Seconds between calls while throttled.
+    """
+
+    def __init__(
+        self,
+        max_cost: float | None = None,
+        max_tokens: int | None = None,
+        period: float = 86400.0,
+        action: str = REJECT,
+        throttle_interval: float = 10.0,
+    ) -> None:
+        if action not in (REJECT, THROTTLE):
+            raise ValueError(f"Unknown budget action: {action}")
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.period = period
+        self.action = action
+        self.throttle_interval = throttle_interval
+
+
+class UsageLedger:
+    """Append-only SQLite record of the tokens and cost of every LLM call.
+
+    Prices and budgets are read from ``usage.json``, which is reloaded when it
+    changes. Budgets set with :meth:`set_budget` take precedence.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH, usage_file: str = USAGE_FILE) -> None:
+        self.path = path
+        self.usage_file = usage_file
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(usage)")}
+            if "prompt" not in columns:
+                # Ledgers written before prompt versions were recorded
+                self._conn.execute("ALTER TABLE usage ADD COLUMN prompt TEXT")
+        self._prices: dict[str, dict] = {}
+        self._file_budgets: dict[str, Budget] = {}
+        self._budgets: dict[str, Budget] = {}
+        self._usage_mtime: int | None = None
+        self._next_allowed: dict[str, float] = {}
+
+    def _reload(self) -> None:
+        try:
+            mtime = os.stat(self.usage_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._usage_mtime:
+            return
+        self._usage_mtime = mtime
+        data = {}
+        if mtime is not None:
+            try:
+                with open(self.usage_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger(f"usage: failed to read {self.usage_file}: {e}")
+        self._prices = data.get("prices", {})
+        budgets = {}
+        for component, values in data.get("budgets", {}).items():
+            try:
+                budgets[component] = Budget(**values)
+            except (TypeError, ValueError) as e:
+                logger(f"usage: ignoring budget of {component}: {e}")
+        self._file_budgets = budgets
+
+    def price(self, model: str) -> dict | None:
+        """Return the prices of ``model`` per million tokens, if known.
+
+        Models are looked up by their full name and then without a provider
+        prefix, so ``openai/gpt-4o`` also matches an entry for ``gpt-4o``.
+        """
+        with self._lock:
+            self._reload()
+            prices = self._prices
+        return prices.get(model) or prices.get(model.split("/")[-1])
+
+    def cost(self, model: str, input_tokens: int, cached_tokens: int, output_tokens: int):
+        """Return the cost of a call or ``None`` if the model has no price."""
+        price = self.price(model)
+        if price is None:
+            return None
+        uncached = max(0, input_tokens - cached_tokens)
+        cached_price = price.get("cached_input", price.get("input", 0.0))
+        return (
+            uncached * price.get("input", 0.0)
+            + cached_tokens * cached_price
+            + output_tokens * price.get("output", 0.0)
+        ) / 1_000_000
+
+    def record(
+        self,
+        component: str,
+        conversation_id: str | None,
+        provider: str,
+        model: str,
+        input_tokens: int,
+        cached_tokens: int,
+        output_tokens: int,
+        latency: float,
+        prompt: str | None = None,
+    ) -> float | None:
+        """Append a usage record and return its cost.
+
+        ``prompt`` names the prompt templates the call was made with, as
+        returned by :func:`prompt_registry.prompt_refs`.
+        """
+        cost = self.cost(model, input_tokens, cached_tokens, output_tokens)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO usage (ts, component, conversation_id, provider, model, "
+                "input_tokens, cached_tokens, output_tokens, latency_ms, cost, prompt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    component,
+                    conversation_id,
+                    provider,
+                    model,
+                    input_tokens,
+                    cached_tokens,
+                    output_tokens,
+                    latency * 1000,
+                    cost,
+                    prompt,
+                ),
+            )
+        return cost
+
+    def summary(
+        self,
+        group_by: str = "component",
+        since: float | None = None,
+        until: float | None = None,
+        component: str | None = None,
+    ) -> list[dict]:
+        """Return calls, tokens, cost and latency per group, most expensive first.
+
+        Args:
+            group_by: One of ``component``, ``conversation_id``, ``provider``,
+                ``model`` or ``prompt``.
+            since: Only include calls made at or after this timestamp.
+            until: Only include calls made before this timestamp.
+            component: Only include calls of this component.
+        """
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group usage by {group_by}")
+        where, params = self._filters(since, until, component)
+        query = (
+            f"SELECT {group_by} AS key, COUNT(*) AS calls, "
+            "SUM(input_tokens) AS input_tokens, SUM(cached_tokens) AS cached_tokens, "
+            "SUM(output_tokens) AS output_tokens, COALESCE(SUM(cost), 0) AS cost, "
+            "AVG(latency_ms) AS avg_latency_ms "
+            f"FROM usage{where} GROUP BY {group_by} ORDER BY cost DESC, calls DESC"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def records(
+        self,
+        since: float | None = None,
+        until: float | None = None,
+        component: str | None = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> list[dict]:
+        """Return individual usage records, newest first."""
+        where, params = self._filters(since, until, component)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM usage{where} ORDER BY ts DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _filters(since, until, component) -> tuple[str, list]:
+        clauses, params = [], []
+        if component is not None:
+            clauses.append("component = ?")
+            params.append(component)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def spent(self, component: str, since: float) -> tuple[float, int]:
+        """Return the cost and tokens used by ``component`` since ``since``."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(cost), 0), COALESCE(SUM(input_tokens + output_tokens), 0) "
+                "FROM usage WHERE component = ? AND ts >= ?",
+                (component, since),
+            ).fetchone()
+        return row[0], row[1]
+
+    def set_budget(self, component: str, budget: Budget | None) -> None:
+        """Set or, with ``None``, remove the budget of ``component``."""
+        with self._lock:
+            if budget is None:
+                self._budgets.pop(component, None)
+            else:
+                self._budgets[component] = budget
+
+    def get_budget(self, component: str) -> Budget | None:
+        with self._lock:
+            self._reload()
+            return self._budgets.get(component) or self._file_budgets.get(component)
+
+    def check_budget(self, component: str) -> None:
+        """Reject or delay a call of ``component`` if its budget is used up.
+
+        Raises:
+            BudgetExceededError: If the budget is exceeded and its action is
+                ``"reject"``.
+        """
+        budget = self.get_budget(component)
+        if budget is None:
+            return
+        cost, tokens = self.spent(component, time.time() - budget.period)
+        if budget.max_cost is not None and cost >= budget.max_cost:
+            reason = f"cost {cost:.4f} of {budget.max_cost:.4f}"
+        elif budget.max_tokens is not None and tokens >= budget.max_tokens:
+            reason = f"{tokens} of {budget.max_tokens} tokens"
+        else:
+            return
+
+        if budget.action == REJECT:
+            raise BudgetExceededError(
+                component, f"{component or 'Unattributed calls'} exceeded the budget: {reason}"
+            )
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_allowed.get(component, 0.0))
+            self._next_allowed[component] = start + budget.throttle_interval
+        if start > now:
+            logger(f"usage: throttling {component} ({reason}), waiting {start - now:.1f}s")
+            time.sleep(start - now)
+
+
+_ledger: UsageLedger | None = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> UsageLedger:
+    """Return the process-wide usage ledger, opening it on first use."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
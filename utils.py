@@ -1,34 +1,79 @@
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-import chardet
+from langchain_core.messages.ai import add_usage
 import sys
 import json
 import locale
 import os
 import base64
+import hashlib
 import mimetypes
+import threading
+import time
+import uuid
+import functools
+from collections import OrderedDict
 
 from log_writer import logger
 import config
+import conversation_store
+import http_transport
+import profiling
+import prompt_registry
+import singleflight
+import structured_output
+import usage_ledger
+
+
+# Seconds spent importing each provider SDK, filled in on first use.
+PROVIDER_IMPORT_TIMES: dict[str, float] = {}
+
+
+def _import_provider(provider: str):
+    """Import and return the chat model class for ``provider``.
+
+    The provider SDKs are among the heaviest imports of the application, so
+    only the one that is actually configured gets loaded.
+    """
+    start = time.perf_counter()
+    if provider == "anthropic":
+        from langchain_anthropic import ChatAnthropic as chat_class
+    elif provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI as chat_class
+    else:
+        from langchain_openai import ChatOpenAI as chat_class
+    if provider not in PROVIDER_IMPORT_TIMES:
+        PROVIDER_IMPORT_TIMES[provider] = time.perf_counter() - start
+        logger(
+            f"Imported the {provider} SDK in {PROVIDER_IMPORT_TIMES[provider]:.2f}s"
+        )
+    return chat_class
 
 
 def _create_client(provider: str, api_key: str, base_url: str, model_name: str):
     provider = provider.lower()
     if provider == "anthropic":
+        ChatAnthropic = _import_provider(provider)
         return ChatAnthropic(api_key=api_key, model_name=model_name, max_tokens=10000)
     if provider == "google":
+        ChatGoogleGenerativeAI = _import_provider(provider)
         return ChatGoogleGenerativeAI(
             google_api_key=api_key,
             model=model_name,
             max_output_tokens=10000,
+            # The SDK builds its own httpx client; give it the same pool limits
+            client_args=http_transport.client_args(),
         )
+    ChatOpenAI = _import_provider("openai")
     return ChatOpenAI(
         api_key=api_key,
         base_url=base_url,
         model_name=model_name,
         max_tokens=10000,
+        # Report token usage for streamed replies as well; see _open_stream
+        # for endpoints that reject it
+        stream_usage=True,
+        # Keep-alive connections shared by every OpenAI-compatible client
+        http_client=http_transport.get_http_client(),
         default_headers={
             "HTTP-Referer": "https://cynia.dev",
             "X-Title": "CyniaAI",
@@ -36,6 +81,103 @@ def _create_client(provider: str, api_key: str, base_url: str, model_name: str):
     )
 
 
+# Process-wide pool of provider clients keyed by their connection settings.
+# Streamlit reruns and the component instances share these clients instead of
+# building a fresh HTTP stack for every ``LLM`` object.
+_CLIENTS: dict[tuple, object] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(provider: str, api_key: str, base_url: str, model_name: str):
+    """Return a cached client for the given provider settings."""
+    key = (provider.lower(), api_key, base_url, model_name)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _create_client(provider, api_key, base_url, model_name)
+            _CLIENTS[key] = client
+        return client
+
+
+def prune_clients() -> int:
+    """Drop cached clients whose provider settings are no longer configured.
+
+    Called after a configuration change so that clients for a replaced API
+    key or base URL do not stay cached. Clients of ``LLM`` objects with
+    explicit settings are rebuilt on their next use.
+
+    Returns:
+        The number of clients dropped.
+    """
+    api_key = getattr(config, "API_KEY", "")
+    base_url = getattr(config, "BASE_URL", "")
+    configured = {
+        ((getattr(config, "LLM_PROVIDER", "") or "openai").lower(), api_key, base_url),
+        (
+            (getattr(config, "BACKUP_LLM_PROVIDER", "") or "openai").lower(),
+            getattr(config, "BACKUP_API_KEY", "") or api_key,
+            getattr(config, "BACKUP_BASE_URL", "") or base_url,
+        ),
+    }
+    with _CLIENTS_LOCK:
+        stale = [key for key in _CLIENTS if key[:3] not in configured]
+        for key in stale:
+            del _CLIENTS[key]
+    if stale:
+        logger(f"Dropped {len(stale)} LLM client(s) with outdated settings.")
+    return len(stale)
+
+
+# (base URL, model) pairs whose endpoint rejected a native JSON mode request;
+# ask_json only describes the schema in the prompt for them.
+_NATIVE_JSON_REJECTED: set[tuple[str, str]] = set()
+
+
+# Base URLs of OpenAI-compatible endpoints that rejected a request for usage
+# in streamed replies; their streams are requested without it.
+_STREAM_USAGE_REJECTED: set[str] = set()
+
+
+def _status_code(error: BaseException) -> int | None:
+    """Return the HTTP status of a provider error, if it has one."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+# Identical requests made at the same time, e.g. by several sessions or
+# reruns, share one upstream call.
+_INFLIGHT = singleflight.SingleFlight()
+
+
+def _request_key(
+    provider: str, api_key: str, base_url: str, model_name: str, messages: list
+) -> str:
+    """Return a hash identifying a request, used to coalesce identical ones."""
+    payload = json.dumps(
+        [provider, api_key, base_url, model_name, [(m.type, m.content) for m in messages]],
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _content_text(content) -> str:
+    """Return the text of a message or chunk content.
+
+    Some providers return a list of content blocks instead of a string.
+    """
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if isinstance(block, str):
+            parts.append(block)
+        elif isinstance(block, dict) and block.get("type") == "text":
+            parts.append(block.get("text", ""))
+    return "".join(parts)
+
+
 def _image_to_data_url(path: str) -> str:
     """Return the data URL for an image file."""
     if not os.path.exists(path):
@@ -71,37 +213,262 @@ def initialize() -> None:
 class LLM:
     """Helper class for interacting with the configured LLM provider."""
 
+    # Share one upstream request between concurrent identical calls. Disable
+    # on an instance whose callers expect independent samples.
+    coalesce = True
+
     def __init__(
         self,
         provider: str | None = None,
         api_key: str | None = None,
         base_url: str | None = None,
         model_name: str | None = None,
+        component: str = "",
     ) -> None:
-        self.provider = (provider or getattr(config, "LLM_PROVIDER", "openai")).lower()
-        self.api_key = api_key or config.API_KEY
-        self.base_url = base_url or config.BASE_URL
-        self.model_name = model_name or config.GENERATION_MODEL
+        # Explicit settings; anything left as None follows the configuration.
+        self._overrides = (provider, api_key, base_url, model_name)
+        # Name the usage ledger attributes this instance's calls to
+        self.component = component
+        self._resolve_settings()
 
-        self.client = _create_client(
+        self.client = get_client(
             self.provider, self.api_key, self.base_url, self.model_name
         )
         logger(
             f"Initialized the {self.provider} LLM client with model {self.model_name}."
         )
 
-    def create_conversation(self, system_prompt: str) -> "Conversation":
-        """Return a :class:`Conversation` object using this LLM."""
+    def _resolve_settings(self) -> tuple:
+        provider, api_key, base_url, model_name = self._overrides
+        self.provider = (provider or getattr(config, "LLM_PROVIDER", "openai")).lower()
+        self.api_key = api_key or config.API_KEY
+        self.base_url = base_url or config.BASE_URL
+        self.model_name = model_name or config.GENERATION_MODEL
+        self._config_version = config.CONFIG_VERSION
+        return (self.provider, self.api_key, self.base_url, self.model_name)
+
+    def _refresh(self) -> None:
+        """Rebuild the client if a configuration change affected its settings."""
 
-        return Conversation(self, system_prompt)
+        if self._config_version == config.CONFIG_VERSION:
+            return
+        before = (self.provider, self.api_key, self.base_url, self.model_name)
+        after = self._resolve_settings()
+        if after != before:
+            self.client = get_client(*after)
+            logger(
+                f"Rebuilt the {self.provider} LLM client with model {self.model_name}."
+            )
+
+    def create_conversation(self, system_prompt: str, **kwargs) -> "Conversation":
+        """Return a :class:`Conversation` object using this LLM.
+
+        Keyword arguments are passed to :class:`Conversation`.
+        """
+
+        return Conversation(self, system_prompt, **kwargs)
 
     def _get_client(self, model_name: str | None = None):
+        self._refresh()
         if model_name and model_name != self.model_name:
-            return _create_client(
+            return get_client(
                 self.provider, self.api_key, self.base_url, model_name
             )
         return self.client
 
+    @staticmethod
+    def _ask_messages(
+        system_prompt: str,
+        user_prompt: str,
+        image_path: str | None,
+        final_model: str,
+    ) -> list:
+        """Build the message list for a single-turn request."""
+
+        if image_path:
+            image_url = _image_to_data_url(image_path)
+            user_content = [
+                {"type": "text", "text": user_prompt},
+                {"type": "image_url", "image_url": {"url": image_url}},
+            ]
+            user_message = HumanMessage(content=json.dumps(user_content))
+        else:
+            user_message = HumanMessage(content=user_prompt)
+
+        if final_model in ["o1-preview", "o1-mini"]:
+            return [
+                HumanMessage(content=system_prompt),
+                user_message,
+            ]
+        return [
+            SystemMessage(content=system_prompt),
+            user_message,
+        ]
+
+    @staticmethod
+    def _history_messages(messages: list[dict], final_model: str) -> list:
+        """Convert a ``{"role", "content"}`` history into LangChain messages."""
+
+        langchain_messages = []
+        for msg in messages:
+            role = msg.get("role", "user")
+            content = msg.get("content", "")
+            if role == "system":
+                if final_model in ["o1-preview", "o1-mini"]:
+                    langchain_messages.append(HumanMessage(content=content))
+                else:
+                    langchain_messages.append(SystemMessage(content=content))
+            elif role == "assistant":
+                langchain_messages.append(AIMessage(content=content))
+            else:
+                langchain_messages.append(HumanMessage(content=content))
+        return langchain_messages
+
+    def _key(self, final_model: str, messages: list) -> str | None:
+        if not self.coalesce:
+            return None
+        return _request_key(
+            self.provider, self.api_key, self.base_url, final_model, messages
+        )
+
+    @staticmethod
+    def _prompt_refs(tag: str, *texts) -> str | None:
+        """Return the refs of the prompt templates among ``texts`` and log them."""
+        refs = prompt_registry.prompt_refs(*texts)
+        if refs:
+            logger(f"{tag}: prompts {refs}")
+        return refs
+
+    def _record_usage(
+        self, usage: tuple, final_model: str, metadata: dict | None, latency: float
+    ) -> None:
+        component, conversation_id, prompt = usage
+        metadata = metadata or {}
+        details = metadata.get("input_token_details") or {}
+        try:
+            usage_ledger.get_ledger().record(
+                component,
+                conversation_id,
+                self.provider,
+                final_model,
+                metadata.get("input_tokens", 0),
+                details.get("cache_read") or 0,
+                metadata.get("output_tokens", 0),
+                latency,
+                prompt=prompt,
+            )
+        except Exception as e:
+            logger(f"usage: failed to record usage: {e}")
+
+    def _record_coalesced(self, usage: tuple, final_model: str, latency: float) -> None:
+        # A caller that shared another caller's request: its tokens are billed
+        # to the first caller, so budgets of the others are approximate
+        self._record_usage(usage, final_model, None, latency)
+
+    def _invoke(self, client, messages: list, final_model: str, usage: tuple):
+        """Invoke ``client`` within the budget and record the tokens used.
+
+        ``usage`` is the ``(component, conversation_id, prompt)`` the call is
+        attributed to. Identical concurrent calls share one request, whose
+        tokens are recorded for the caller that made it; every other caller
+        gets a record without tokens.
+        """
+        usage_ledger.get_ledger().check_budget(usage[0])
+        led = False
+
+        def call():
+            nonlocal led
+            led = True
+            start = time.perf_counter()
+            response = client.invoke(messages)
+            self._record_usage(
+                usage,
+                final_model,
+                getattr(response, "usage_metadata", None),
+                time.perf_counter() - start,
+            )
+            return response
+
+        key = self._key(final_model, messages)
+        if key is None:
+            return call()
+        start = time.perf_counter()
+        response = _INFLIGHT.do(key, call)
+        if not led:
+            self._record_coalesced(usage, final_model, time.perf_counter() - start)
+        return response
+
+    def _open_stream(self, client, messages: list):
+        """Yield the chunks of ``client.stream(messages)``.
+
+        OpenAI-compatible endpoints that reject the request for token usage
+        are asked again without it, and remembered, so usage is only missing
+        from their records.
+        """
+        if self.provider != "openai":
+            yield from client.stream(messages)
+            return
+        base_url = (self.base_url or "").rstrip("/")
+        if base_url in _STREAM_USAGE_REJECTED:
+            yield from client.stream(messages, stream_usage=False)
+            return
+        chunks = client.stream(messages)
+        try:
+            first = next(chunks, None)
+        except Exception as e:
+            if _status_code(e) not in (400, 422):
+                raise
+            chunks = client.stream(messages, stream_usage=False)
+            first = next(chunks, None)
+            # Only now is it certain that the usage request was the problem
+            logger(f"{base_url or 'openai'}: streamed usage rejected, requesting without it: {e}")
+            _STREAM_USAGE_REJECTED.add(base_url)
+        if first is None:
+            return
+        yield first
+        yield from chunks
+
+    def _metered_stream(self, client, messages: list, final_model: str, usage: tuple):
+        start = time.perf_counter()
+        metadata = None
+        try:
+            for chunk in self._open_stream(client, messages):
+                if getattr(chunk, "usage_metadata", None):
+                    metadata = add_usage(metadata, chunk.usage_metadata)
+                yield chunk
+        finally:
+            self._record_usage(usage, final_model, metadata, time.perf_counter() - start)
+
+    def _stream(self, client, messages: list, tag: str, final_model: str, usage: tuple):
+        """Yield reply text from ``client.stream`` and log the full reply."""
+
+        usage_ledger.get_ledger().check_budget(usage[0])
+        key = self._key(final_model, messages)
+        led = key is None
+
+        def metered():
+            nonlocal led
+            led = True
+            return self._metered_stream(client, messages, final_model, usage)
+
+        start = time.perf_counter()
+        chunks = metered() if key is None else _INFLIGHT.stream(key, metered)
+        parts = []
+        try:
+            for chunk in chunks:
+                text = _content_text(chunk.content)
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            logger(f"{tag}: stream error {e}")
+            raise
+        finally:
+            if not led:
+                self._record_coalesced(usage, final_model, time.perf_counter() - start)
+        logger(f"{tag}: streamed reply {''.join(parts)}")
+
+    @profiling.track("llm")
     def ask(
         self,
         system_prompt: str,
@@ -120,33 +487,18 @@ class LLM:
 
         client = self._get_client(model_name)
         final_model = model_name or self.model_name
-
-        if image_path:
-            image_url = _image_to_data_url(image_path)
-            user_content = [
-                {"type": "text", "text": user_prompt},
-                {"type": "image_url", "image_url": {"url": image_url}},
-            ]
-            user_message = HumanMessage(content=json.dumps(user_content))
-        else:
-            user_message = HumanMessage(content=user_prompt)
-
-        if final_model in ["o1-preview", "o1-mini"]:
-            messages = [
-                HumanMessage(content=system_prompt),
-                user_message,
-            ]
-        else:
-            messages = [
-                SystemMessage(content=system_prompt),
-                user_message,
-            ]
+        messages = self._ask_messages(
+            system_prompt, user_prompt, image_path, final_model
+        )
 
         logger(f"ask: system {system_prompt}")
         logger(f"ask: user {user_prompt}")
+        prompt = self._prompt_refs("ask", system_prompt, user_prompt)
 
         try:
-            response = client.invoke(messages)
+            response = self._invoke(
+                client, messages, final_model, (self.component, None, prompt)
+            )
         except Exception as e:
             logger(f"ask: invoke error {e}")
             if "connect" in str(e).lower():
@@ -178,32 +530,32 @@ class LLM:
 
         return assistant_reply
 
+    @profiling.track("llm")
     def _conversation(
-        self, messages: list[dict], model_name: str | None = None
+        self,
+        messages: list[dict],
+        model_name: str | None = None,
+        conversation_id: str | None = None,
+        component: str | None = None,
     ) -> str:
         """Internal helper for multi-turn conversation using a history list."""
 
         client = self._get_client(model_name)
         final_model = model_name or self.model_name
-
-        langchain_messages = []
-        for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if role == "system":
-                if final_model in ["o1-preview", "o1-mini"]:
-                    langchain_messages.append(HumanMessage(content=content))
-                else:
-                    langchain_messages.append(SystemMessage(content=content))
-            elif role == "assistant":
-                langchain_messages.append(AIMessage(content=content))
-            else:
-                langchain_messages.append(HumanMessage(content=content))
+        langchain_messages = self._history_messages(messages, final_model)
 
         logger(f"conversation: messages {messages}")
+        prompt = self._prompt_refs(
+            "conversation", *(msg.get("content") for msg in messages)
+        )
 
         try:
-            response = client.invoke(langchain_messages)
+            response = self._invoke(
+                client,
+                langchain_messages,
+                final_model,
+                (component or self.component, conversation_id, prompt),
+            )
         except Exception as e:
             logger(f"conversation: invoke error {e}")
             raise
@@ -221,30 +573,425 @@ class LLM:
 
         return assistant_reply
 
+    @profiling.track("llm")
+    def ask_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        image_path: str | None = None,
+        model_name: str | None = None,
+    ):
+        """Single-turn conversation yielding the reply text as it arrives.
+
+        Takes the same arguments as :meth:`ask`.
+        """
+
+        client = self._get_client(model_name)
+        final_model = model_name or self.model_name
+        messages = self._ask_messages(
+            system_prompt, user_prompt, image_path, final_model
+        )
+
+        logger(f"ask_stream: system {system_prompt}")
+        logger(f"ask_stream: user {user_prompt}")
+        prompt = self._prompt_refs("ask_stream", system_prompt, user_prompt)
+
+        yield from self._stream(
+            client, messages, "ask_stream", final_model, (self.component, None, prompt)
+        )
+
+    @profiling.track("llm")
+    def invoke_tools(
+        self,
+        messages: list,
+        tools: list[dict],
+        model_name: str | None = None,
+        conversation_id: str | None = None,
+        prompt: str | None = None,
+    ):
+        """Send LangChain messages with tools bound and return the ``AIMessage``.
+
+        The provider's native tool calling is used; requested calls are in
+        the ``tool_calls`` of the returned message. These requests are never
+        coalesced since the bound tools are not part of the request key.
+
+        Args:
+            messages: LangChain messages, including earlier ``ToolMessage``
+                results.
+            tools: Tool definitions in OpenAI function format.
+            model_name: Optional model override.
+            conversation_id: Conversation the usage is attributed to.
+            prompt: Refs of the prompt templates in ``messages``, see
+                :func:`prompt_registry.prompt_refs`. LangChain messages do not
+                keep them.
+        """
+
+        client = self._get_client(model_name)
+        final_model = model_name or self.model_name
+        if tools:
+            client = client.bind_tools(tools)
+        usage = (self.component, conversation_id, prompt)
+        if prompt:
+            logger(f"invoke_tools: prompts {prompt}")
+        usage_ledger.get_ledger().check_budget(self.component)
+
+        start = time.perf_counter()
+        try:
+            response = client.invoke(messages)
+        except Exception as e:
+            logger(f"invoke_tools: invoke error {e}")
+            raise
+        self._record_usage(
+            usage,
+            final_model,
+            getattr(response, "usage_metadata", None),
+            time.perf_counter() - start,
+        )
+        logger(f"invoke_tools: response {response}")
+        return response
+
+    def _native_json(self, final_model: str) -> bool:
+        """Return whether ``final_model`` is asked for schema-constrained output.
+
+        Many OpenAI-compatible endpoints reject ``response_format``, so it is
+        only used for the OpenAI API itself and the models or base URLs listed
+        in ``NATIVE_JSON_MODE``.
+        """
+
+        if self.provider == "google":
+            return True
+        if self.provider != "openai":
+            return False
+        base_url = (self.base_url or "").rstrip("/")
+        if (base_url, final_model) in _NATIVE_JSON_REJECTED:
+            return False
+        if not base_url or "://api.openai.com" in base_url:
+            return True
+        enabled = {
+            item.strip().rstrip("/")
+            for item in (getattr(config, "NATIVE_JSON_MODE", "") or "").split(",")
+            if item.strip()
+        }
+        return final_model in enabled or base_url in enabled
+
+    def _json_client(self, client, json_schema: dict):
+        """Bind the provider's native JSON output mode to ``client``."""
+
+        if self.provider == "openai":
+            return client.bind(
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": structured_output.schema_name(json_schema),
+                        "schema": json_schema,
+                    },
+                }
+            )
+        if self.provider == "google":
+            return client.bind(
+                response_mime_type="application/json", response_json_schema=json_schema
+            )
+        return client
+
+    def _stream_json(
+        self, client, messages: list, validator, final_model: str, prompt: str | None = None
+    ) -> str:
+        """Stream a reply into ``validator`` and return the JSON text.
+
+        The request is cut off as soon as the reply diverges from the schema.
+        After the value is complete the rest of the stream is still read so
+        that its token usage gets recorded.
+        """
+
+        usage_ledger.get_ledger().check_budget(self.component)
+        chunks = self._metered_stream(
+            client, messages, final_model, (self.component, None, prompt)
+        )
+        try:
+            for chunk in chunks:
+                if not validator.done:
+                    validator.feed(_content_text(chunk.content))
+        finally:
+            chunks.close()
+        return validator.finish()
+
+    @profiling.track("llm")
+    def ask_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema,
+        image_path: str | None = None,
+        model_name: str | None = None,
+        max_retries: int = 2,
+    ):
+        """Single-turn request returning a reply that matches ``schema``.
+
+        The reply is validated while it streams in and cut off as soon as it
+        goes wrong. Google models, the OpenAI API and endpoints listed in
+        ``NATIVE_JSON_MODE`` are asked for schema-constrained output, falling
+        back to the prompt if they reject it; the schema is always part of the
+        system prompt. After an invalid reply Anthropic models continue from the last
+        valid value of their reply, other providers are asked again with the
+        error.
+
+        Args:
+            system_prompt: The system prompt for the model.
+            user_prompt: The user prompt text.
+            schema: A JSON schema dictionary, or a type such as a pydantic
+                model or a dataclass.
+            image_path: Optional path to an image included with the prompt.
+            model_name: Optional model override.
+            max_retries: Number of attempts after the first one.
+
+        Returns:
+            The parsed JSON, or an instance of ``schema`` if it is a type.
+
+        Raises:
+            structured_output.StructuredOutputError: If no attempt produced a
+                valid reply.
+        """
+
+        json_schema, convert = structured_output.resolve_schema(schema)
+        final_model = model_name or self.model_name
+        native = self._native_json(final_model)
+
+        def prepare(native: bool):
+            # Native modes need an object at the root; the value is unwrapped below
+            request_schema, wrapped = (
+                structured_output.wrap_root(json_schema) if native else (json_schema, False)
+            )
+            client = self._get_client(model_name)
+            if native:
+                client = self._json_client(client, request_schema)
+            messages = self._ask_messages(
+                system_prompt + structured_output.instructions(request_schema),
+                user_prompt,
+                image_path,
+                final_model,
+            )
+            return client, request_schema, wrapped, messages
+
+        client, request_schema, wrapped, messages = prepare(native)
+
+        logger(f"ask_json: system {system_prompt}")
+        logger(f"ask_json: user {user_prompt}")
+        prompt = self._prompt_refs("ask_json", system_prompt, user_prompt)
+
+        prefix = ""
+        error = None
+        attempt = 0
+        while attempt <= max_retries:
+            validator = structured_output.StreamingJSONValidator(request_schema)
+            request = list(messages)
+            if prefix:
+                validator.feed(prefix)
+                request.append(AIMessage(content=prefix))
+            try:
+                text = self._stream_json(client, request, validator, final_model, prompt)
+                value = json.loads(text)
+                value = convert(value["value"] if wrapped else value)
+            except ValueError as e:
+                # Divergence, invalid JSON or a failed type validation
+                error = e
+                logger(f"ask_json: attempt {attempt + 1} invalid: {e}")
+            except Exception as e:
+                if not native or _status_code(e) not in (400, 422):
+                    raise
+                # The endpoint does not support the JSON mode or this schema
+                logger(f"ask_json: {final_model} rejected the JSON mode, using the prompt only: {e}")
+                _NATIVE_JSON_REJECTED.add(((self.base_url or "").rstrip("/"), final_model))
+                native = False
+                client, request_schema, wrapped, messages = prepare(False)
+                prefix = ""
+                continue
+            else:
+                logger(f"ask_json: reply {text}")
+                return value
+
+            attempt += 1
+            # Anthropic continues a prefilled reply; the prefill must not end
+            # with whitespace.
+            valid_prefix = getattr(error, "valid_prefix", "").rstrip()
+            if self.provider == "anthropic" and valid_prefix:
+                prefix = valid_prefix
+            else:
+                prefix = ""
+                messages = messages + [
+                    AIMessage(content=validator.text or "(no reply)"),
+                    HumanMessage(
+                        content=f"That reply is invalid: {error}. "
+                        "Reply again with only the corrected JSON."
+                    ),
+                ]
+        raise structured_output.StructuredOutputError(
+            f"No valid JSON reply after {max_retries + 1} attempts: {error}"
+        )
+
+    @profiling.track("llm")
+    def _conversation_stream(
+        self,
+        messages: list[dict],
+        model_name: str | None = None,
+        conversation_id: str | None = None,
+        component: str | None = None,
+    ):
+        """Streaming counterpart of :meth:`_conversation`."""
+
+        client = self._get_client(model_name)
+        final_model = model_name or self.model_name
+        langchain_messages = self._history_messages(messages, final_model)
+
+        logger(f"conversation_stream: messages {messages}")
+        prompt = self._prompt_refs(
+            "conversation_stream", *(msg.get("content") for msg in messages)
+        )
+
+        yield from self._stream(
+            client,
+            langchain_messages,
+            "conversation_stream",
+            final_model,
+            (component or self.component, conversation_id, prompt),
+        )
+
 
 class Conversation:
-    """Manage a conversation with message history."""
+    """Manage a conversation with message history.
 
-    def __init__(self, llm: LLM, system_prompt: str) -> None:
+    When a :class:`conversation_store.ConversationStore` is given every turn is
+    appended to it, and ``window`` limits how many messages are kept in memory
+    and sent to the model. Older messages remain available through
+    :meth:`load_page`. A new conversation is only written to the store with
+    its first turn, so conversations that are never used leave no record.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        system_prompt: str,
+        store: "conversation_store.ConversationStore | None" = None,
+        conversation_id: str | None = None,
+        window: int | None = None,
+        component: str = "",
+    ) -> None:
         self.llm = llm
         self.messages: list[dict] = [
             {"role": "system", "content": system_prompt}
         ]
+        self.store = store
+        self.window = window
+        self.conversation_id = conversation_id
+        self.component = component
+        # Whether the conversation has a record in the store yet
+        self._stored = conversation_id is not None
+        if store is not None and conversation_id is None:
+            self.conversation_id = uuid.uuid4().hex
+        # Serializes sends so background jobs cannot interleave turns.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def resume(
+        cls,
+        llm: LLM,
+        conversation_id: str,
+        store: "conversation_store.ConversationStore | None" = None,
+        window: int | None = conversation_store.DEFAULT_WINDOW,
+    ) -> "Conversation":
+        """Load a stored conversation, keeping the last ``window`` messages."""
+
+        store = store or conversation_store.get_store()
+        record = store.get_conversation(conversation_id)
+        if record is None:
+            raise KeyError(f"Unknown conversation: {conversation_id}")
+        conv = cls(
+            llm,
+            record["system_prompt"],
+            store=store,
+            conversation_id=conversation_id,
+            window=window,
+            component=record["component"],
+        )
+        if window:
+            stored = store.recent_messages(conversation_id, window)
+        else:
+            stored = store.iter_messages(conversation_id)
+        conv.messages += [{"role": m["role"], "content": m["content"]} for m in stored]
+        return conv
+
+    def _record(self, user_prompt: str, reply: str) -> None:
+        self.messages.append({"role": "assistant", "content": reply})
+        if self.store is not None:
+            if not self._stored:
+                self.store.create_conversation(
+                    self.messages[0]["content"], self.component, self.conversation_id
+                )
+                self._stored = True
+            self.store.append_message(self.conversation_id, "user", user_prompt)
+            self.store.append_message(self.conversation_id, "assistant", reply)
+        if self.window and len(self.messages) - 1 > self.window:
+            del self.messages[1 : len(self.messages) - self.window]
 
     def send(self, user_prompt: str, model_name: str | None = None) -> str:
         """Append a user message, get the assistant reply and store it."""
 
-        self.messages.append({"role": "user", "content": user_prompt})
-        reply = self.llm._conversation(self.messages, model_name)
-        self.messages.append({"role": "assistant", "content": reply})
+        with self._lock:
+            self.messages.append({"role": "user", "content": user_prompt})
+            try:
+                reply = self.llm._conversation(
+                    self.messages, model_name, self.conversation_id, self.component
+                )
+            except Exception:
+                self.messages.pop()
+                raise
+            self._record(user_prompt, reply)
         return reply
 
+    def send_stream(self, user_prompt: str, model_name: str | None = None):
+        """Like :meth:`send` but yield the reply text as it arrives.
+
+        The reply is stored once the stream has been fully consumed. Closing
+        the generator early discards the turn.
+        """
+
+        with self._lock:
+            self.messages.append({"role": "user", "content": user_prompt})
+            parts = []
+            try:
+                for text in self.llm._conversation_stream(
+                    self.messages, model_name, self.conversation_id, self.component
+                ):
+                    parts.append(text)
+                    yield text
+            except BaseException:
+                self.messages.pop()
+                raise
+            self._record(user_prompt, "".join(parts))
+
     @property
     def history(self) -> list[dict]:
-        """Return the full conversation history."""
+        """Return the messages held in memory, starting with the system prompt.
+
+        Without a ``window`` this is the full conversation history.
+        """
 
         return self.messages
 
+    @property
+    def message_count(self) -> int:
+        """Number of user and assistant messages in the whole conversation."""
+
+        if self.store is None:
+            return len(self.messages) - 1
+        return self.store.count_messages(self.conversation_id)
+
+    def load_page(self, offset: int = 0, limit: int = 50) -> list[dict]:
+        """Return ``limit`` user/assistant messages starting at ``offset``."""
+
+        if self.store is None:
+            return self.messages[1 + offset : 1 + offset + limit]
+        return self.store.load_messages(self.conversation_id, offset, limit)
+
 
 def askgpt(
     system_prompt: str,
@@ -258,12 +1005,91 @@ def askgpt(
     return llm.ask(system_prompt, user_prompt, image_path=image_path)
 
 
-def mixed_decode(text: str) -> str:
+# Number of bytes inspected by charset detection when UTF-8 decoding fails.
+DETECTION_SAMPLE_SIZE = 4096
+
+# Maximum number of sources whose encoding is remembered.
+ENCODING_CACHE_SIZE = 256
+
+# Encodings detected per source (e.g. a compiler or tool name), so that later
+# output from the same source skips detection. Least recently used first.
+_ENCODING_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_ENCODING_CACHE_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _is_multibyte(encoding: str) -> bool:
+    """Return whether ``encoding`` combines bytes into characters.
+
+    Such codecs reject most text in another encoding, so a wrong guess shows
+    up as a decoding error. Single-byte codecs such as latin-1 decode any
+    bytes and would silently garble later output.
+    """
+    try:
+        high = bytes(range(0x80, 0x100)).decode(encoding, errors="replace")
+    except LookupError:
+        return False
+    return len(high) < 0x80
+
+
+def _cached_encoding(source: str | None) -> str | None:
+    if not source:
+        return None
+    with _ENCODING_CACHE_LOCK:
+        encoding = _ENCODING_CACHE.get(source)
+        if encoding is not None:
+            _ENCODING_CACHE.move_to_end(source)
+        return encoding
+
+
+def _cache_encoding(source: str | None, encoding: str) -> None:
+    if not source:
+        return
+    with _ENCODING_CACHE_LOCK:
+        # UTF-8 is always tried first, and single-byte guesses are not reused
+        if encoding == "utf-8" or not _is_multibyte(encoding):
+            return
+        _ENCODING_CACHE[source] = encoding
+        _ENCODING_CACHE.move_to_end(source)
+        while len(_ENCODING_CACHE) > ENCODING_CACHE_SIZE:
+            _ENCODING_CACHE.popitem(last=False)
+
+
+def _decode_bytes(data: bytes, encoding_hint: str | None = None) -> tuple[str, str]:
+    """Decode ``data`` and return the text together with the encoding used.
+
+    Strict UTF-8 (which covers ASCII) is tried first, then ``encoding_hint``
+    if it is a multibyte codec. Only if both fail is the charset detected, on
+    a bounded sample.
+    """
+    try:
+        return data.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if encoding_hint and encoding_hint != "utf-8" and _is_multibyte(encoding_hint):
+        try:
+            return data.decode(encoding_hint), encoding_hint
+        except (UnicodeDecodeError, LookupError):
+            pass
+
+    import chardet
+
+    encoding = chardet.detect(data[:DETECTION_SAMPLE_SIZE])["encoding"] or "utf-8"
+    try:
+        return data.decode(encoding, errors="replace"), encoding
+    except LookupError:
+        return data.decode("utf-8", errors="replace"), "utf-8"
+
+
+def mixed_decode(text: str, source: str | None = None) -> str:
     """
     Decode a mixed text containing both normal text and a byte sequence.
 
     Args:
         text (str): The mixed text to be decoded.
+        source (str, optional): Name of the program that produced the text.
+            A multibyte encoding detected for a source is tried first for
+            its later output.
 
     Returns:
         str: The decoded text, where the byte sequence has been converted to its corresponding characters.
@@ -277,23 +1103,61 @@ def mixed_decode(text: str) -> str:
         # The text only contains normal text
         return text
 
-    # Convert the byte sequence to actual bytes
-    byte_sequence = byte_text.encode(
-        "latin1"
-    )  # latin1 encoding maps byte values directly to unicode code points
+    # ASCII decodes to itself in every supported encoding
+    if byte_text.isascii():
+        return text
 
-    # Detect the encoding of the byte sequence
-    detected_encoding = chardet.detect(byte_sequence)
-    encoding = detected_encoding["encoding"]
+    # Convert the byte sequence to actual bytes
+    try:
+        byte_sequence = byte_text.encode(
+            "latin1"
+        )  # latin1 encoding maps byte values directly to unicode code points
+    except UnicodeEncodeError:
+        # Characters above U+00FF: the text has already been decoded
+        return text
 
-    # Decode the byte sequence
-    decoded_text = byte_sequence.decode(encoding)
+    decoded_text, encoding = _decode_bytes(byte_sequence, _cached_encoding(source))
+    _cache_encoding(source, encoding)
 
     # Combine the normal text with the decoded byte sequence
     final_text = normal_text + ": " + decoded_text
     return final_text
 
 
+def mixed_decode_many(texts, source: str | None = None):
+    """Lazily apply :func:`mixed_decode` to an iterable of texts.
+
+    A multibyte encoding detected for one text is tried first for the rest.
+    """
+    source = source or f"<batch {id(texts)}>"
+    try:
+        for text in texts:
+            yield mixed_decode(text, source)
+    finally:
+        if source.startswith("<batch "):
+            with _ENCODING_CACHE_LOCK:
+                _ENCODING_CACHE.pop(source, None)
+
+
+def iter_decoded_lines(stream, source: str | None = None):
+    """Yield decoded lines from a binary stream or an iterable of byte lines.
+
+    Large logs are decoded one line at a time instead of being read into
+    memory as a whole.
+
+    Args:
+        stream: A file opened in binary mode, or any iterable of ``bytes``.
+        source: Optional name used to cache the detected encoding.
+    """
+    encoding = _cached_encoding(source)
+    for line in stream:
+        text, used = _decode_bytes(line, encoding)
+        if used != "utf-8" and _is_multibyte(used):
+            encoding = used
+        yield text
+    if encoding:
+        _cache_encoding(source, encoding)
+
 
 if __name__ == "__main__":
     print("This script is not meant to be run directly. Please run console.py instead.")
@@ -2,34 +2,147 @@ import streamlit as st
 import os
 
 import config
+import import_profile
+import profiling
 import utils
-from component_manager import ComponentManager
+from app_context import AppContext
 import artifact_manager
+import job_queue
+import search_index
 
 
-utils.initialize()
-
 st.set_page_config(page_title="Cynia Agents", page_icon="🧩")
 
-manager = ComponentManager()
+artifact_manager.register_artifact_type("profile")
+
+
+@st.cache_resource
+def get_app_context() -> AppContext:
+    """Return the application context shared by all sessions."""
+    return AppContext()
+
+
+app = get_app_context()
+app.refresh_config()
+manager = app.manager
+
+
+ARTIFACT_PAGE_SIZE = 20
+
+
+def _pager(key: str, has_next: bool) -> None:
+    """Previous/next buttons for the page number stored in ``st.session_state[key]``."""
+    page = st.session_state[key]
+    cols = st.columns([1, 2, 1])
+    if cols[0].button("◀ Previous", key=f"{key}_prev", disabled=page == 0):
+        st.session_state[key] = page - 1
+        st.rerun()
+    cols[1].write(f"Page {page + 1}")
+    if cols[2].button("Next ▶", key=f"{key}_next", disabled=not has_next):
+        st.session_state[key] = page + 1
+        st.rerun()
+
+
+def _download_artifact(column, art: dict) -> None:
+    file_path = os.path.join(artifact_manager.ARTIFACTS_DIR, art["file"])
+    if not os.path.isfile(file_path):
+        column.write("Deleted")
+        return
+    with open(file_path, "rb") as f:
+        column.download_button("Download", f.read(), file_name=art["file"], key=f"dl_{art['file']}")
+
+
+def render_search_results(query: str) -> None:
+    """Ranked search over artifacts and stored conversation messages."""
+    page = st.session_state.artifact_page
+    # One extra result tells whether there is a next page without counting all matches
+    results = search_index.get_index().search(
+        query, limit=ARTIFACT_PAGE_SIZE + 1, offset=page * ARTIFACT_PAGE_SIZE
+    )
+    if not results:
+        st.info("No matches.")
+        return
+    for result in results[:ARTIFACT_PAGE_SIZE]:
+        if result["kind"] == search_index.ARTIFACT:
+            cols = st.columns([3, 2, 4, 1])
+            cols[0].write(f"📄 {result['title']}")
+            cols[1].write(f"{result['component']} · {result['type']}")
+            cols[2].write(result["remark"])
+            _download_artifact(cols[3], {"file": result["ref"]})
+        else:
+            st.write(
+                f"💬 {result['component'] or 'Conversation'} `{result['parent']}` ({result['type']})"
+            )
+        st.markdown(result["snippet"])
+        st.markdown("---")
+    _pager("artifact_page", len(results) > ARTIFACT_PAGE_SIZE)
 
 
 def render_artifact_center():
-    """UI for browsing generated artifacts."""
+    """UI for browsing and searching generated artifacts."""
     st.header("📦 Artifact Center")
+    query = st.text_input("🔍 Search artifacts and conversations", key="artifact_query")
+    if st.session_state.get("artifact_last_query") != query:
+        st.session_state.artifact_last_query = query
+        st.session_state.artifact_page = 0
+    if query.strip():
+        render_search_results(query)
+        return
+
     artifacts = artifact_manager.list_artifacts()
     if not artifacts:
         st.info("No artifacts available.")
         return
-    for art in artifacts:
-        file_path = os.path.join(artifact_manager.ARTIFACTS_DIR, art["file"])
+    page = st.session_state.artifact_page
+    start = page * ARTIFACT_PAGE_SIZE
+    for art in artifacts[start : start + ARTIFACT_PAGE_SIZE]:
         cols = st.columns([3, 2, 1, 3, 1])
         cols[0].write(art["file"])
         cols[1].write(art.get("component", ""))
         cols[2].write(f"{art.get('size', 0)} bytes")
         cols[3].write(art.get("remark", ""))
-        with open(file_path, "rb") as f:
-            cols[4].download_button("Download", f.read(), file_name=art["file"])
+        _download_artifact(cols[4], art)
+        st.markdown("---")
+    _pager("artifact_page", start + ARTIFACT_PAGE_SIZE < len(artifacts))
+    if st.button("🔄 Rebuild search index", help="Re-index every artifact and stored conversation"):
+        app.jobs.submit("Artifact Center", "Rebuild search index", search_index.get_index().rebuild)
+        st.success("Rebuilding the search index in the background")
+
+
+def render_jobs_center():
+    """UI for monitoring background jobs."""
+    st.header("⏳ Jobs")
+    jobs = app.jobs.list_jobs()
+    if not jobs:
+        st.info("No jobs have been submitted.")
+        return
+    if st.button("🔄 Refresh"):
+        st.rerun()
+    status_icons = {
+        job_queue.QUEUED: "🕒",
+        job_queue.RUNNING: "⚙️",
+        job_queue.DONE: "✅",
+        job_queue.FAILED: "❌",
+    }
+    for job in jobs:
+        cols = st.columns([1, 3, 2, 2, 2])
+        cols[0].write(status_icons.get(job.status, job.status))
+        cols[1].write(job.description)
+        cols[2].write(job.component)
+        wait = f"{job.wait_time:.1f}s" if job.wait_time is not None else "-"
+        run = f"{job.run_time:.1f}s" if job.run_time is not None else "-"
+        cols[3].write(f"wait {wait} / run {run}")
+        if job.finished and cols[4].button("Dismiss", key=f"dismiss_{job.id}"):
+            app.jobs.remove(job.id)
+            st.rerun()
+        if job.status == job_queue.DONE:
+            with st.expander("Result"):
+                st.text(str(job.result))
+                if st.button("Save as Artifact", key=f"save_{job.id}"):
+                    job_queue.save_job_artifact(job)
+                    st.success("Artifact saved")
+        elif job.status == job_queue.FAILED:
+            st.error(job.error)
         st.markdown("---")
 
 
@@ -37,6 +150,10 @@ def render_component_center():
     """UI for enabling/disabling components."""
     st.header("🧩 Component Center")
     st.markdown("Manage your components here. Enable or disable components as needed.")
+
+    if st.button("🔄 Reload Components", help="Rediscover components after adding or updating them"):
+        app.reload_components()
+        st.rerun()
     
     if not manager.available:
         st.info("No components found. Please add components to the components directory.")
@@ -171,17 +288,73 @@ def render_config_center():
         submitted = st.form_submit_button("Save")
 
     if submitted:
-        for k, v in inputs.items():
-            config.edit_config(k, v)
+        if config.edit_config_many(inputs):
+            utils.prune_clients()
+            # Components whose setup failed under the old settings get another chance.
+            app.reload_components()
         st.success("Configuration saved successfully!")
         st.rerun()
 
+    with st.expander("🚀 Startup Profile"):
+        st.markdown("Measure how long the application's imports take in a fresh interpreter.")
+        if utils.PROVIDER_IMPORT_TIMES:
+            for provider, seconds in utils.PROVIDER_IMPORT_TIMES.items():
+                st.write(f"{provider} SDK imported in this process in {seconds * 1000:.0f} ms")
+        if st.button("Profile Imports"):
+            st.session_state.import_profile = import_profile.startup_report()
+        report = st.session_state.get("import_profile")
+        if report:
+            if report["error"]:
+                st.error(report["error"])
+            st.write(f"**Total import time:** {report['total_ms']:.0f} ms")
+            st.table(
+                [
+                    {"module": r["module"], "cumulative (ms)": round(r["cumulative_ms"], 1)}
+                    for r in report["roots"]
+                ]
+            )
+            st.markdown("Slowest individual modules")
+            st.table(
+                [
+                    {"module": r["module"], "self (ms)": round(r["self_ms"], 1)}
+                    for r in report["top"]
+                ]
+            )
+
+
+def render_component(component):
+    """Render a component page followed by a breakdown of where the time went."""
+    cprofile = config.PROFILER_ENABLED == "true"
+    with profiling.profile_render(component.name, cprofile=cprofile) as profile:
+        component.render()
+
+    with st.expander(f"⏱️ Render time: {profile.total * 1000:.0f} ms"):
+        st.table(profile.rows())
+        # The click reruns the page, so the saved profile is of that render
+        save = bool(profile.stats_path) and st.button(
+            "💾 Save profile", key=f"save_profile_{component.name}"
+        )
+
+    if profile.stats_path:
+        try:
+            if save:
+                artifact_manager.write_artifact(
+                    component.name,
+                    profile.stats_path,
+                    f"cProfile of {component.name} ({profile.total * 1000:.0f} ms)",
+                    "profile",
+                )
+                st.success("Profile saved to the Artifact Center")
+        finally:
+            os.remove(profile.stats_path)
+
 
 def build_pages():
     pages = {
         "Component Center": None,
         "Configuration Center": None,
         "Artifact Center": None,
+        "Jobs": None,
     }
     for comp in manager.get_enabled_components():
         pages[comp.name] = comp
@@ -207,6 +380,10 @@ if st.sidebar.button("⚙️ Configuration Center", use_container_width=True):
 if st.sidebar.button("📦 Artifact Center", use_container_width=True):
     st.session_state.selected_page = "Artifact Center"
 
+# 显示后台任务
+if st.sidebar.button("⏳ Jobs", use_container_width=True):
+    st.session_state.selected_page = "Jobs"
+
 # 显示启用的组件
 if manager.get_enabled_components():
     st.sidebar.markdown("### 📋 Enabled Components")
@@ -233,6 +410,8 @@ elif st.session_state.selected_page == "Configuration Center":
     render_config_center()
 elif st.session_state.selected_page == "Artifact Center":
     render_artifact_center()
+elif st.session_state.selected_page == "Jobs":
+    render_jobs_center()
 else:
     component = pages.get(st.session_state.selected_page)
     if component:
@@ -240,6 +419,6 @@ else:
         if component.description:
             st.markdown(f"*{component.description}*")
         st.markdown("---")
-        component.render()
+        render_component(component)
     else:
         st.error("Component not found or not enabled.")